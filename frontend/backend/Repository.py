@@ -3,7 +3,8 @@ import os
 from dotenv import load_dotenv
 import urllib.parse
 import datetime
-from flask import Flask, request, jsonify
+from flask import (Flask, Blueprint, current_app, request, jsonify, send_from_directory, send_file,
+                   g, has_request_context)
 from functools import wraps
 import jwt as pyjwt
 import random
@@ -14,60 +15,40 @@ from email.mime.multipart import MIMEMultipart
 import ssl
 import bcrypt
 import secrets
-
-app = Flask(__name__)
-
-# Load environment variables
-print("Loading environment variables...")
-load_dotenv()
-
-# Database Configuration using public URL
-print("\nReading database configuration...")
-MYSQL_PUBLIC_URL = os.getenv('MYSQL_PUBLIC_URL')
-
-if not MYSQL_PUBLIC_URL:
-    raise ValueError("MYSQL_PUBLIC_URL environment variable is not set")
-
-# Parse the URL
-parsed = urllib.parse.urlparse(MYSQL_PUBLIC_URL)
-print("\nParsed connection details:")
-print(f"Host: {parsed.hostname}")
-print(f"Port: {parsed.port}")
-print(f"User: {parsed.username}")
-print(f"Database: {parsed.path[1:]}")  # Remove leading /
-
-# Initialize database connection
-print("\nAttempting to connect to MySQL...")
-try:
-    conn = mysql.connector.connect(
-        host=parsed.hostname,
-        port=parsed.port,
-        user=parsed.username,
-        password=parsed.password,
-        database=parsed.path[1:] if parsed.path else 'railway',
-        autocommit=True,
-        connection_timeout=30
-    )
-    cursor = conn.cursor(dictionary=True)
-    print(f"\nSuccessfully connected to MySQL database at {parsed.hostname}:{parsed.port}")
-except mysql.connector.Error as e:
-    print(f"\nMySQL Error: {e}")
-    raise
-except Exception as e:
-    print(f"\nGeneral Error: {e}")
-    raise
-
-# Email Configuration
-GMAIL_USER = os.getenv('GMAIL_USER', 'your-email@gmail.com')
-GMAIL_APP_PASSWORD = os.getenv('GMAIL_APP_PASSWORD', 'your-app-password')
-
-# Setup HTTPS if enabled
-use_https = os.getenv('USE_HTTPS', 'false').lower() == 'true'
-CERT_FILE = os.getenv('SSL_CERT', './certs/certificate.crt')
-KEY_FILE = os.getenv('SSL_KEY', './certs/private.key')
-
-# Set your secret key for JWT from environment variable
-app.config['SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'admin-secret-key-change-this-in-production')
+import base64
+import io
+import threading
+from werkzeug.middleware.proxy_fix import ProxyFix
+from moderation import InlineModerator
+from avatars import store_avatar, avatar_urls, AvatarError, AVATAR_DIR
+from album_art import AlbumArtCache, AlbumArtError, sniff_mimetype
+from caches import LRUCache
+from recommendations import SimilarityIndex
+from content_index import ContentIndex
+from trending import TrendingCharts
+from leaderboards import Leaderboards
+from analytics import AnalyticsStore, SECTIONS as ANALYTICS_SECTIONS
+from catalog import SongCatalog, LIST_COLUMNS, DETAIL_COLUMNS, SEARCH_COLUMNS
+from liked_songs import (LikedSetCache, fetch_liked_page, decode_liked_cursor,
+                         LIKED_PAGE_SIZE, LIKED_MAX_PAGE_SIZE)
+from db_routing import DatabaseRouter, decode_read_after, READ_AFTER_TTL_SECONDS
+from admission import AdmissionController, Rejected, env_class, TRUSTED_PROXY_HOPS
+from json_provider import OrjsonProvider, orjson
+from compression import ResponseCompressor
+from wire_format import negotiate as negotiate_wire_format, encode as encode_wire_format
+from song_deletion import SongPurger, tombstone, job_progress, live_songs, MAX_TRACKS_PER_JOB
+import song_import
+
+# Routes live on a blueprint; create_app() builds the Flask app (see the bottom of this file).
+# Importing this module has no side effects: configuration is read by create_app() and every
+# database connection, cache and mail session is opened on first use.
+api = Blueprint('api', __name__)
+
+# Primary/replica routing (see db_routing.py). Write responses carry a read-your-writes token
+# in this header and cookie; clients that cannot keep the cookie echo the header back.
+db_router = DatabaseRouter()
+READ_AFTER_HEADER = 'X-DB-Read-After'
+READ_AFTER_COOKIE = 'db_read_after'
 
 def generate_admin_token(admin_id, email):
     expiration = datetime.datetime.utcnow() + datetime.timedelta(hours=24)  # Token expires in 24 hours
@@ -75,7 +56,7 @@ def generate_admin_token(admin_id, email):
         'admin_id': admin_id,
         'email': email,
         'exp': expiration.timestamp()  # Convert to Unix timestamp
-    }, app.config['SECRET_KEY'], algorithm='HS256')
+    }, current_app.config['SECRET_KEY'], algorithm='HS256')
     return token
 
 def admin_token_required(f):
@@ -88,7 +69,7 @@ def admin_token_required(f):
         try:
             if token.startswith('Bearer '):
                 token = token.split('Bearer ')[1]
-            data = pyjwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            data = pyjwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
             current_admin = data
         except pyjwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired!'}), 401
@@ -98,36 +79,141 @@ def admin_token_required(f):
         return f(*args, **kwargs)
     return decorated# Start the monitoring thread
 
-def get_db_connection():
-    """Get database connection to Railway MySQL database using the public URL"""
+def get_db_connection(read_only=None):
+    """Get a database connection: the primary (MYSQL_PUBLIC_URL) for writes, a replica for
+    handlers marked @read_only_route when one is fresh enough (see db_routing.py)"""
+    if read_only is None:
+        read_only = has_request_context() and g.get('db_read_only', False)
     try:
-        MYSQL_PUBLIC_URL = os.getenv('MYSQL_PUBLIC_URL')
-        if not MYSQL_PUBLIC_URL:
-            raise ValueError("MYSQL_PUBLIC_URL environment variable is not set")
-            
-        # Parse the URL
-        parsed = urllib.parse.urlparse(MYSQL_PUBLIC_URL)
-        
-        connection = mysql.connector.connect(
-            host=parsed.hostname,
-            port=parsed.port,
-            user=parsed.username,
-            password=parsed.password,
-            database=parsed.path[1:] if parsed.path else 'railway',
-            autocommit=True,
-            connection_timeout=30
-        )
-        print(f"Successfully created new database connection to {parsed.hostname}:{parsed.port}")
+        if read_only:
+            return db_router.read(decode_read_after(
+                request.headers.get(READ_AFTER_HEADER) or request.cookies.get(READ_AFTER_COOKIE)))
+        connection = db_router.primary()
+        if has_request_context() and request.method != 'GET':
+            connection = WriteConnection(connection)
         return connection
     except mysql.connector.Error as e:
         print(f"MySQL Error: {e}")
-        print(f"Connection URL: {MYSQL_PUBLIC_URL}")
+        print(f"Connection URL: {os.getenv('MYSQL_PUBLIC_URL')}")
         raise
     except Exception as e:
         print(f"General Error: {e}")
         raise
 
-@app.before_request
+def get_primary_connection():
+    """Primary connection even inside read-only handlers; for the in-process indexes that are
+    also fed by this process's writes and must not load a lagging copy"""
+    return get_db_connection(read_only=False)
+
+def get_cache_connection(cache):
+    """Connection for filling a shared cache: a replica that has applied the writes this
+    process last invalidated cache for, else the primary. The write endpoints invalidate after
+    committing, so the invalidation time works as a read-after token for every reader."""
+    return db_router.read(('t', cache.written_at))
+
+class WriteConnection:
+    """Primary connection of a write request; on close it records the primary's GTID state so
+    the response can carry a read-your-writes token"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        if self._connection.is_connected():
+            g.db_read_after = db_router.write_token(self._connection)
+        return self._connection.close()
+
+def read_only_route(f):
+    """Let the handler's connections go to a replica; it must not write."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.db_read_only = True
+        return f(*args, **kwargs)
+    return decorated
+
+@api.after_app_request
+def attach_read_after_token(response):
+    token = g.get('db_read_after')
+    if token:
+        response.headers[READ_AFTER_HEADER] = token
+        response.set_cookie(READ_AFTER_COOKIE, token, max_age=READ_AFTER_TTL_SECONDS,
+                            httponly=True, samesite='Lax')
+    return response
+
+# Admission control (see admission.py). Reads and writes share the top rank, so waiting GETs
+# never shed writes; only 'expensive' backs off for them. Routes pick their class with
+# @admission_class, otherwise GETs are 'read' and other methods 'write'.
+admission = AdmissionController([
+    env_class('read', limit=32, queue_budget_ms=500),
+    env_class('write', limit=16, queue_budget_ms=1000),
+    env_class('expensive', limit=4, queue_budget_ms=200, cost=5, rank=1),
+])
+
+def admission_class(name):
+    """Put a route in an admission class; None exempts it from the concurrency limits."""
+    def decorator(f):
+        f.admission_class = name
+        return f
+    return decorator
+
+@api.before_app_request
+def admit_request():
+    view = current_app.view_functions.get(request.endpoint)
+    default = 'read' if request.method in ('GET', 'HEAD', 'OPTIONS') else 'write'
+    name = getattr(view, 'admission_class', default)
+    client = request.remote_addr or 'unknown'
+    try:
+        if name is None:
+            admission.throttle(client)
+        else:
+            g.admission_slot = admission.admit(name, client)
+    except Rejected as r:
+        response = jsonify({"error": r.reason})
+        response.status_code = r.status
+        response.headers['Retry-After'] = str(r.retry_after)
+        return response
+
+@api.teardown_app_request
+def release_admission(exc):
+    slot = g.pop('admission_slot', None)
+    if slot is not None:
+        admission.release(slot)
+
+# gzip/brotli for text responses (see compression.py); handlers set g.body_key on bodies
+# that stay the same across requests so they are compressed only once
+response_compressor = ResponseCompressor()
+
+@api.after_app_request
+def compress_response(response):
+    return response_compressor.apply(response, request.accept_encodings, g.get('body_key'))
+
+def json_bytes_encoder():
+    """The app's JSON encoder returning bytes when it can (the orjson provider), else str."""
+    return getattr(current_app.json, 'dumps_bytes', current_app.json.dumps)
+
+def song_list_response(data, status=200):
+    """jsonify(data), or the compact columnar encoding when Accept asks for it (see wire_format.py)."""
+    media_type = negotiate_wire_format(request.accept_mimetypes)
+    if media_type is None:
+        response = jsonify(data)
+    else:
+        response = current_app.response_class(encode_wire_format(data, media_type, current_app.json),
+                                              mimetype=media_type)
+    response.vary.add('Accept')
+    return response, status
+
+# Album art proxy cache (see album_art.py)
+album_art_cache = AlbumArtCache()
+
+# Bad-word check on the comment write path; replaces the periodic scan in monitor_thread.py
+comment_moderator = InlineModerator(get_db_connection)
+
+LOGGED_BODY_MAX_BYTES = 64 * 1024
+
+@api.before_app_request
 def log_request_info():
     print(f"Incoming request: {request.method} {request.path}")
     print(f"Request headers: {dict(request.headers)}")
@@ -137,12 +223,28 @@ def log_request_info():
             print(f"Request JSON data: {request.json}")
         except Exception as e:
             print(f"Error parsing JSON: {str(e)}")
-    else:
+    elif request.content_length and request.content_length <= LOGGED_BODY_MAX_BYTES:
+        # Larger (or chunked) bodies are left unread, so handlers can stream uploads
         print(f"Request body: {request.get_data(as_text=True)[:200]}")
 
+def request_body_stream():
+    """The request body as a file; bodies log_request_info has already read come from its cache"""
+    if request.content_length and request.content_length <= LOGGED_BODY_MAX_BYTES:
+        return io.BytesIO(request.get_data())
+    return request.stream
+
 # ------------------------------- USER ENDPOINTS -------------------------------
 
-@app.route('/getUserByEmail', methods=['POST'])
+# Profile columns returned to clients: no password/token columns, and legacy inline base64
+# avatars are never sent over the wire (run avatars.py to move them to the avatar store)
+USER_PROFILE_COLUMNS = """
+    id, username, email, favorite_genre, favorite_artist, bio,
+    CASE WHEN avatar LIKE 'data:%%' THEN NULL ELSE avatar END AS avatar,
+    email_verified, two_factor_enabled, last_login
+"""
+
+@api.route('/getUserByEmail', methods=['POST'])
+@read_only_route
 def get_user_by_email():
     email = request.json.get('email')
     print(f"Looking up user with email: {email}")
@@ -151,10 +253,12 @@ def get_user_by_email():
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)  # Use dictionary cursor for direct JSON conversion
-        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+        cursor.execute(f"SELECT {USER_PROFILE_COLUMNS} FROM users WHERE email = %s", (email,))
         result = cursor.fetchone()
         if result:
-            print("Found user:", result)
+            print("Found user:", result['id'])
+            result['avatar_ref'] = result['avatar']
+            result.update(avatar_urls(result['avatar']))
             return jsonify(result)
         print(f"No user found for email: {email}")
         return jsonify({})
@@ -176,7 +280,7 @@ def send_verification_email(to_email, verification_code):
         # Create message
         msg = MIMEMultipart('alternative')
         msg['Subject'] = "Music Library - Email Verification"
-        msg['From'] = GMAIL_USER  # Use the actual Gmail address
+        msg['From'] = current_app.config['GMAIL_USER']  # Use the actual Gmail address
         msg['To'] = to_email
         
         # Create the plain-text and HTML version of your message
@@ -217,10 +321,10 @@ def send_verification_email(to_email, verification_code):
             server.starttls()  # Enable TLS
             
             # Print debug info
-            print(f"Attempting to login with GMAIL_USER: {GMAIL_USER}")
+            print(f"Attempting to login with GMAIL_USER: {current_app.config['GMAIL_USER']}")
             
             # Login to the server
-            server.login(GMAIL_USER, GMAIL_APP_PASSWORD)
+            server.login(current_app.config['GMAIL_USER'], current_app.config['GMAIL_APP_PASSWORD'])
             
             # Send email
             server.send_message(msg)
@@ -233,7 +337,7 @@ def send_verification_email(to_email, verification_code):
             
         except Exception as smtp_error:
             print(f"SMTP Error: {smtp_error}")
-            print(f"Gmail User: {GMAIL_USER}")
+            print(f"Gmail User: {current_app.config['GMAIL_USER']}")
             print("Please check your Gmail credentials and make sure you're using an App Password")
             return False
             
@@ -244,7 +348,7 @@ def send_verification_email(to_email, verification_code):
         return False
 
 
-@app.route('/registerUser', methods=['POST'])
+@api.route('/registerUser', methods=['POST'])
 def register_user():
     data = request.json
     email = data.get('email')
@@ -290,7 +394,7 @@ def register_user():
         if conn:
             conn.close()
 
-@app.route('/verify-email', methods=['POST'])
+@api.route('/verify-email', methods=['POST'])
 def verify_email():
     data = request.json
     email = data.get('email')
@@ -349,7 +453,7 @@ def verify_email():
         if conn:
             conn.close()
 
-@app.route('/updateUserProfile', methods=['POST'])
+@api.route('/updateUserProfile', methods=['POST'])
 def update_user_profile():
     conn = None
     cursor = None
@@ -365,6 +469,12 @@ def update_user_profile():
             if field not in data:
                 return jsonify({"error": f"Missing field: {field}"}), 400
 
+        # Decode the avatar once and keep only its content-hash reference in the row
+        try:
+            avatar_ref = store_avatar(data['avatar'])
+        except AvatarError as ae:
+            return jsonify({"error": str(ae)}), 400
+
         # Get database connection
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -374,10 +484,10 @@ def update_user_profile():
             UPDATE users SET password = %s, favorite_genre = %s, favorite_artist = %s, bio = %s, avatar = %s
             WHERE email = %s""",
             (data['password'], data['favoriteGenre'],
-            data['favoriteArtist'], data['bio'], data['avatar'], data['email'])
+            data['favoriteArtist'], data['bio'], avatar_ref, data['email'])
         )
         conn.commit()
-        return jsonify({"message": "Profile updated successfully"}), 200
+        return jsonify({"message": "Profile updated successfully", **avatar_urls(avatar_ref)}), 200
     except Exception as e:
         print("Error updating user profile:", e)
         return jsonify({"error": "Failed to update profile"}), 500
@@ -387,27 +497,54 @@ def update_user_profile():
         if conn:
             conn.close()
 
+# Avatar files are named by content hash, so they never change and can be cached forever
+@api.route('/avatars/<path:filename>', methods=['GET'])
+@admission_class(None)
+def get_avatar(filename):
+    response = send_from_directory(AVATAR_DIR, filename, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 # ------------------------------- SONGS ENDPOINTS -------------------------------
 
+# Columnar catalog shared through a memory-mapped snapshot; the SQL below is the fallback
+# when it cannot be loaded (e.g. NumPy missing)
+song_catalog = SongCatalog()
+
 #pagination
 #improve performance by using indexes on the columns used in the WHERE clause and JOIN conditions
 #fetch all songs that u want
-@app.route('/getAllSongs', methods=['GET'])
+@api.route('/getAllSongs', methods=['GET'])
+@admission_class('expensive')
+@read_only_route
 def get_all_songs():
+    if song_catalog.ready(get_primary_connection):
+        media_type = negotiate_wire_format(request.accept_mimetypes)
+        if media_type is None:
+            version, body = song_catalog.all_songs_json(json_bytes_encoder())
+        else:
+            version, body = song_catalog.all_songs_encoded(
+                media_type, lambda songs: encode_wire_format(songs, media_type, current_app.json))
+        g.body_key = ('getAllSongs', media_type, version)  # Compressed once per catalog version
+        response = current_app.response_class(body, mimetype=media_type or 'application/json')
+        response.vary.add('Accept')
+        return response, 200
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:        
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT track_id, track_name, artist_name, album_name, album_image, genres, rating
             FROM songs USE INDEX (idx_track_name)
+            WHERE {live_songs()}
             ORDER BY track_name
         """)
         rows = cursor.fetchall()
         columns = [col[0] for col in cursor.description]
         songs = [dict(zip(columns, row)) for row in rows]
 
-        return jsonify(songs), 200
+        return song_list_response(songs)
     except Exception as e:
         print("Error fetching songs:", e)
         return jsonify({"error": "Failed to fetch songs"}), 500
@@ -415,7 +552,9 @@ def get_all_songs():
         cursor.close()
         conn.close()
 
-@app.route('/api/searchSongs/<query>', methods=['GET'])
+@api.route('/api/searchSongs/<query>', methods=['GET'])
+@admission_class('expensive')
+@read_only_route
 def search_songs(query):
     if not query or query.strip() == '':
         return jsonify([]), 200  # Return empty array for empty queries
@@ -425,18 +564,38 @@ def search_songs(query):
         return jsonify({"error": "Search query must be at least 2 characters long"}), 400
         
     print(f"Searching for songs with query: {query}")
-    conn = get_db_connection()
+    try:
+        songs = search_cache.get_or_load(search_term.lower(), lambda: find_songs(search_term))
+    except Exception as e:
+        print("Error searching songs:", e)
+        return jsonify({"error": "Failed to search songs"}), 500
+    print(f"Found {len(songs)} matching songs")
+    return song_list_response(songs)
+
+# Search results per lowercased term. Identical concurrent searches share one lookup; the
+# song write endpoints clear it, the TTL covers writes made by other workers. Misses go to a
+# replica only once it has applied the last clear's write (see get_cache_connection), so an
+# entry refilled right after a write never holds the data from before it.
+search_cache = LRUCache(int(os.getenv('SEARCH_CACHE_SIZE', 1024)), ttl_seconds=10,
+                        stale_seconds=int(os.getenv('SEARCH_STALE_SECONDS', 60)))
+
+def find_songs(search_term):
+    if song_catalog.ready(get_primary_connection):
+        return [song.to_dict(SEARCH_COLUMNS) for song in song_catalog.search(search_term)]
+
+    conn = get_cache_connection(search_cache)
     cursor = conn.cursor(dictionary=True)
 
     try:
         search_term = search_term.lower()  # Case-insensitive search
         search_pattern = f"%{search_term}%"
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT track_id, track_name, artist_name, album_name, album_image, genres
             FROM songs USE INDEX (idx_track_name)
-            WHERE LOWER(track_name) LIKE %s 
+            WHERE (LOWER(track_name) LIKE %s 
                 OR LOWER(artist_name) LIKE %s 
-                OR LOWER(album_name) LIKE %s
+                OR LOWER(album_name) LIKE %s)
+                AND {live_songs()}
             ORDER BY 
                 CASE 
                     WHEN LOWER(track_name) = %s THEN 1
@@ -446,23 +605,12 @@ def search_songs(query):
                 track_name
             LIMIT 50
         """, (search_pattern, search_pattern, search_pattern, search_term, search_term))
-    
-        rows = cursor.fetchall()
-        if not rows:
-            return jsonify([]), 200
-            
-        songs = rows  # dictionary cursor already converts to dict
-
-        print(f"Found {len(songs)} matching songs")
-        return jsonify(songs), 200
-    except Exception as e:
-        print("Error searching songs:", e)
-        return jsonify({"error": "Failed to search songs"}), 500
+        return cursor.fetchall()  # dictionary cursor already converts to dict
     finally:
         cursor.close()
         conn.close()
 
-@app.route('/api/addReview', methods=['POST'])
+@api.route('/api/addReview', methods=['POST'])
 def add_review():
     conn = None
     cursor = None
@@ -517,7 +665,9 @@ def add_review():
         user_id = user['id']  # Extract the ID from the query result using dictionary cursor
         print("Resolved user_id:", user_id)
         
-        # Add or update the rating
+        # Add or update the rating, remembering the old one for the leaderboards
+        cursor.execute("SELECT rating FROM ratings WHERE user_id = %s AND track_id = %s", (user_id, track_id))
+        previous = cursor.fetchone()
         cursor.execute("""
             INSERT INTO ratings (user_id, track_id, rating) 
             VALUES (%s, %s, %s)
@@ -532,6 +682,13 @@ def add_review():
             """, (user_id, track_id, comment))
             
         conn.commit()
+        song_details_cache.invalidate(int(track_id))
+        leaderboards.record_rating(int(track_id), int(rating), previous['rating'] if previous else None)
+        if not previous:
+            trending_charts.record_write(int(track_id), 'rating', user_id)
+        if comment.strip():
+            trending_charts.record_write(int(track_id), 'comment', user_id)
+            comment_moderator.check(user_id, comment)
         print("Review added successfully")
         return jsonify({"message": "Review added successfully"}), 200
         
@@ -554,8 +711,8 @@ def add_review():
         if conn:
             conn.close()
 
-@app.route('/api/addComment', methods=['POST'])
-@app.route('/addComment', methods=['POST'])  # Add this alias route to ensure compatibility
+@api.route('/api/addComment', methods=['POST'])
+@api.route('/addComment', methods=['POST'])  # Add this alias route to ensure compatibility
 def add_comment():
     try:
         # Log the request to help with debugging
@@ -611,6 +768,9 @@ def add_comment():
             
             conn.commit()
             conn.close()
+            song_details_cache.invalidate(int(track_id))
+            trending_charts.record_write(int(track_id), 'comment', user_id)
+            comment_moderator.check(user_id, comment)
             print("Comment added successfully")
             return jsonify({"message": "Comment added successfully"}), 200
         except Exception as db_error:
@@ -629,81 +789,257 @@ def add_comment():
         traceback.print_exc()
         return jsonify({"error": str(e) or "Failed to add comment", "type": type(e).__name__}), 500
 
-@app.route('/api/getSongDetails/<int:song_id>', methods=['GET'])
-def get_song_details(song_id):
+# Song detail payloads, kept per song and updated or invalidated by the song/review/comment
+# write endpoints. The TTL bounds staleness across worker processes.
+# Concurrent misses on one song share a single query; an expired entry is served for up to
+# SONG_DETAILS_STALE_SECONDS more while it is reloaded in the background. Like search_cache,
+# misses read a replica only once it has applied the last invalidated write.
+song_details_cache = LRUCache(int(os.getenv('SONG_DETAILS_CACHE_SIZE', 2048)), ttl_seconds=60,
+                              stale_seconds=int(os.getenv('SONG_DETAILS_STALE_SECONDS', 60)))
+SONG_DETAILS_COMMENTS = 10
+
+SONG_DETAILS_PROCEDURE = """
+CREATE PROCEDURE get_song_details(IN p_track_id INT)
+BEGIN
+    SELECT s.*, COUNT(r.user_id) AS rating_count, COALESCE(AVG(r.rating), 0) AS average_rating
+    FROM songs s
+    LEFT JOIN ratings r ON r.track_id = s.track_id
+    WHERE s.track_id = p_track_id
+      AND NOT EXISTS (SELECT 1 FROM song_deletions sd WHERE sd.track_id = s.track_id)
+    GROUP BY s.track_id;
+
+    SELECT c.user_id, u.username, c.comment_text, c.created_at, COALESCE(r.rating, 0) AS user_rating
+    FROM comments c
+    JOIN users u ON c.user_id = u.id
+    LEFT JOIN ratings r ON r.user_id = c.user_id AND r.track_id = c.track_id
+    WHERE c.track_id = p_track_id
+    ORDER BY c.created_at DESC, c.user_id DESC
+    LIMIT 11;
+END
+"""
+
+def rows_as_dicts(result):
+    rows = result.fetchall()
+    if rows and not isinstance(rows[0], dict):
+        columns = [col[0] for col in result.description]
+        rows = [dict(zip(columns, row)) for row in rows]
+    return rows
+
+def create_song_details_procedure():
+    conn = get_primary_connection()
     try:
-        # Calculate the average rating for the song
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get average rating
-        cursor.execute("""
-            SELECT COALESCE(AVG(rating), 0) AS average_rating
-            FROM ratings
-            WHERE track_id = %s
-        """, (song_id,))
-        rating_result = cursor.fetchone()
-        average_rating = rating_result['average_rating']
+        cursor = conn.cursor()
+        cursor.execute(SONG_DETAILS_PROCEDURE)
+        cursor.close()
+    finally:
+        conn.close()
 
-        # Fetch the last 10 comments for the song with user info
-        cursor.execute("""
-            SELECT 
-                u.username,
-                c.comment_text,
-                c.created_at,
-                COALESCE(r.rating, 0) as user_rating
-            FROM comments c
-            JOIN users u ON c.user_id = u.id
-            LEFT JOIN ratings r ON c.user_id = r.user_id 
-                AND c.track_id = r.track_id
-            WHERE c.track_id = %s
-            ORDER BY c.created_at DESC
-            LIMIT 10
-        """, (song_id,))
-        comments = cursor.fetchall()
-
-        # Get basic song info
-        cursor.execute("""
-            SELECT s.*, COUNT(DISTINCT r.user_id) as rating_count
-            FROM songs s
-            LEFT JOIN ratings r ON s.track_id = r.track_id
-            WHERE s.track_id = %s
-            GROUP BY s.track_id
-        """, (song_id,))
-        song = cursor.fetchone()
-        
-        if not song:
+def load_song_details(cursor, song_id):
+    """Song row, rating aggregates and the newest comments in one round trip via get_song_details()."""
+    try:
+        cursor.callproc('get_song_details', (song_id,))
+    except mysql.connector.Error as e:
+        if e.errno != 1305:  # ER_SP_DOES_NOT_EXIST
+            raise
+        # Created through the primary: this cursor may be on a read-only replica, which gets
+        # the procedure through replication
+        create_song_details_procedure()
+        cursor.callproc('get_song_details', (song_id,))
+    song_rows, comment_rows = [rows_as_dicts(result) for result in cursor.stored_results()]
+    return song_details_response(song_rows, comment_rows)
+
+def song_details_response(song_rows, comment_rows):
+    """Shape the two get_song_details() result sets (lists of dicts) into the API response."""
+    if not song_rows:
+        return None
+
+    # One extra comment row is fetched only to tell whether older comments exist
+    has_more = len(comment_rows) > SONG_DETAILS_COMMENTS
+    comment_rows = comment_rows[:SONG_DETAILS_COMMENTS]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_comment_cursor(comment_rows[-1]['created_at'], comment_rows[-1]['user_id'])
+    comments = [{
+        "username": row['username'],
+        "comment_text": row['comment_text'],
+        "created_at": row['created_at'],
+        "user_rating": row['user_rating']
+    } for row in comment_rows]
+
+    return {
+        **song_rows[0],
+        "average_rating": float(song_rows[0]['average_rating']),
+        "comments": comments,
+        "comments_next_cursor": next_cursor
+    }
+
+@api.route('/api/getSongDetails/<int:song_id>', methods=['GET'])
+@read_only_route
+def get_song_details(song_id):
+    try:
+        response_data = song_details_cache.get_or_load(song_id, lambda: fetch_song_details(song_id))
+        if not response_data:
             return jsonify({"error": "Song not found"}), 404
-
-        # Combine all data
-        response_data = {
-            **song,
-            "average_rating": float(average_rating),
-            "comments": comments
-        }
-
         return jsonify(response_data), 200
     except Exception as e:
         print("Error fetching song details:", e)
         import traceback
         traceback.print_exc()
         return jsonify({"error": "Failed to fetch song details"}), 500
+
+def fetch_song_details(song_id):
+    conn = get_cache_connection(song_details_cache)
+    try:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            return load_song_details(cursor, song_id)
+        finally:
+            cursor.close()
     finally:
-        if 'cursor' in locals():
+        conn.close()
+
+# Comment pages are keyset-paginated on (created_at, user_id): comments has one row per
+# (user_id, track_id), so user_id breaks ties within a track. Backed by idx_comments_track_created.
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_MAX_PAGE_SIZE = 100
+
+def encode_comment_cursor(created_at, user_id):
+    raw = f"{created_at.isoformat()}|{user_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_comment_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8')
+        created_at, user_id = raw.split('|')
+        return datetime.datetime.fromisoformat(created_at), int(user_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+# The comment page queries are built separately from their execution so the asyncio app
+# (asgi.py) runs the same SQL through its own driver
+def comment_page_query(song_id, limit, after=None):
+    if after:
+        created_at, user_id = after
+        return """
+            SELECT user_id, comment_text, created_at
+            FROM comments
+            WHERE track_id = %s
+              AND (created_at < %s OR (created_at = %s AND user_id < %s))
+            ORDER BY created_at DESC, user_id DESC
+            LIMIT %s
+        """, (song_id, created_at, created_at, user_id, limit + 1)
+    return """
+        SELECT user_id, comment_text, created_at
+        FROM comments
+        WHERE track_id = %s
+        ORDER BY created_at DESC, user_id DESC
+        LIMIT %s
+    """, (song_id, limit + 1)
+
+def comment_lookup_queries(song_id, rows):
+    """Username and rating lookups for the authors on one page, one query each."""
+    user_ids = list({row['user_id'] for row in rows})
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    return (
+        (f"SELECT id, username FROM users WHERE id IN ({placeholders})", user_ids),
+        (f"SELECT user_id, rating FROM ratings WHERE track_id = %s AND user_id IN ({placeholders})",
+         [song_id] + user_ids),
+    )
+
+def fetch_comment_page(cursor, song_id, limit, after=None):
+    """Return (comments, next_cursor) for one page, newest first. cursor must be a dictionary cursor."""
+    cursor.execute(*comment_page_query(song_id, limit, after))
+    rows = cursor.fetchall()
+    if not rows:
+        return [], None
+
+    # Resolve usernames and this song's ratings for the whole page in one query each
+    (users_query, users_params), (ratings_query, ratings_params) = comment_lookup_queries(song_id, rows[:limit])
+    cursor.execute(users_query, users_params)
+    usernames = {row['id']: row['username'] for row in cursor.fetchall()}
+    cursor.execute(ratings_query, ratings_params)
+    ratings = {row['user_id']: row['rating'] for row in cursor.fetchall()}
+    return comment_page_response(rows, usernames, ratings, limit)
+
+def comment_page_response(rows, usernames, ratings, limit):
+    """(comments, next_cursor) from the page rows (limit + 1 at most) and the author lookups."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    comments = [{
+        "username": usernames.get(row['user_id']),
+        "comment_text": row['comment_text'],
+        "created_at": row['created_at'],
+        "user_rating": ratings.get(row['user_id']) or 0
+    } for row in rows]
+    next_cursor = encode_comment_cursor(rows[-1]['created_at'], rows[-1]['user_id']) if has_more else None
+    return comments, next_cursor
+
+@api.route('/api/songs/<int:song_id>/comments', methods=['GET'])
+@read_only_route
+def get_song_comments(song_id):
+    try:
+        limit = min(max(request.args.get('limit', COMMENTS_PAGE_SIZE, type=int), 1), COMMENTS_MAX_PAGE_SIZE)
+        after = request.args.get('cursor')
+        after = decode_comment_cursor(after) if after else None
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        comments, next_cursor = fetch_comment_page(cursor, song_id, limit, after)
+        return jsonify({"comments": comments, "next_cursor": next_cursor}), 200
+    except Exception as e:
+        print("Error fetching song comments:", e)
+        return jsonify({"error": "Failed to fetch comments"}), 500
+    finally:
+        if cursor:
             cursor.close()
-        if 'conn' in locals():
+        if conn:
             conn.close()
 
+# Album art proxy - /api/albumArt?url=<album_image>&size=64 returns a cached, resized copy
+@api.route('/api/albumArt', methods=['GET'])
+@admission_class(None)
+def get_album_art():
+    url = request.args.get('url')
+    size = request.args.get('size', type=int)
+    if not url:
+        return jsonify({"error": "url is required"}), 400
+    try:
+        _, name = album_art_cache.entry_name(url, size)
+        etag = f'"{name}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = current_app.response_class(status=304)
+        else:
+            image, etag = album_art_cache.open(url, size)
+            response = send_file(image, mimetype=sniff_mimetype(image), etag=False)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+    except AlbumArtError as e:
+        print("Error fetching album art:", e)
+        return jsonify({"error": str(e)}), e.status
+
 # Endpoint for getting song by ID - used by the song list
-@app.route('/getSongById/<int:track_id>', methods=['GET'])
+@api.route('/getSongById/<int:track_id>', methods=['GET'])
+@read_only_route
 def get_song_by_id(track_id):
+    if song_catalog.ready(get_primary_connection):
+        song = song_catalog.get(track_id)
+        if not song:
+            return jsonify({"error": "Song not found"}), 404
+        return jsonify(song.to_dict(DETAIL_COLUMNS)), 200
+
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT track_id, track_name, artist_name, album_name, album_image, rating, audio_url
             FROM songs 
-            WHERE track_id = %s
+            WHERE track_id = %s AND {live_songs()}
         """, (track_id,))
         song = cursor.fetchone()
         if not song:
@@ -720,7 +1056,42 @@ def get_song_by_id(track_id):
         if 'conn' in locals():
             conn.close()
 
-@app.route('/api/addToLiked', methods=['POST'])
+# Batch form of getSongById: POST {trackIds} -> songs in request order, unknown ids skipped
+SONG_BATCH_MAX_TRACKS = 500
+
+@api.route('/api/songs/batch', methods=['POST'])
+@read_only_route
+def get_songs_by_ids():
+    data = request.get_json(silent=True) or {}
+    track_ids = data.get('trackIds')
+    if not isinstance(track_ids, list):
+        return jsonify({"error": "trackIds must be a list"}), 400
+    try:
+        track_ids = list(dict.fromkeys(int(track_id) for track_id in track_ids))
+    except (TypeError, ValueError):
+        return jsonify({"error": "trackIds must be integers"}), 400
+    if len(track_ids) > SONG_BATCH_MAX_TRACKS:
+        return jsonify({"error": f"At most {SONG_BATCH_MAX_TRACKS} tracks per request"}), 400
+
+    if song_catalog.ready(get_primary_connection):
+        return song_list_response([song.to_dict(LIST_COLUMNS) for song in song_catalog.get_many(track_ids)])
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        return song_list_response(fetch_songs_by_ids(cursor, track_ids))
+    except Exception as e:
+        print("Error getting songs by ID:", e)
+        return jsonify({"error": "Failed to get songs"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@api.route('/api/addToLiked', methods=['POST'])
 def add_to_liked():
     try:
         data = request.json
@@ -747,6 +1118,8 @@ def add_to_liked():
             VALUES (%s, %s)
         """, (user_id, track_id))
         conn.commit()
+        liked_sets.add(user_id, int(track_id))
+        trending_charts.record_write(int(track_id), 'like', user_id)
         return jsonify({"message": "Song added to liked list successfully"}), 200
     except Exception as e:
         print("Error adding to liked list:", e)
@@ -757,64 +1130,335 @@ def add_to_liked():
         if 'conn' in locals():
             conn.close()
 
-@app.route('/api/getLikedSongs', methods=['POST'])
+liked_sets = LikedSetCache()
+
+def lookup_user_id(cursor, email):
+    cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+    user = cursor.fetchone()
+    if not user:
+        return None
+    return user['id'] if isinstance(user, dict) else user[0]
+
+def legacy_liked_songs_response(email):
+    """Full liked list in the original response shape (bare list, NULLs as empty strings)."""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        user_id = lookup_user_id(cursor, email)
+        if not user_id:
+            print(f"No user found for email: {email}")
+            return song_list_response([])
+        songs, _ = fetch_liked_page(cursor, user_id)
+        liked = [{key: ('' if value is None else value) for key, value in song.items() if key != 'liked_at'}
+                 for song in songs]
+        print(f"Found {len(liked)} liked songs for user ID {user_id}")
+        return song_list_response(liked)
+    except Exception as e:
+        print(f"Error fetching liked songs for email {email}: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@api.route('/api/getLikedSongs', methods=['POST'])
+@read_only_route
 def get_liked_songs():
+    data = request.json or {}
+    email = data.get('email')
+    if not email:
+        print("No email provided in request")
+        return jsonify({"error": "No email provided"}), 400
+    return legacy_liked_songs_response(email)
+
+# Paginated liked songs: {email, limit, cursor, sort} in the JSON body or query string
+@api.route('/api/likedSongs', methods=['GET', 'POST'])
+@read_only_route
+def get_liked_songs_page():
+    params = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    email = params.get('email')
+    if not email:
+        return jsonify({"error": "No email provided"}), 400
+    try:
+        limit = min(max(int(params.get('limit', LIKED_PAGE_SIZE)), 1), LIKED_MAX_PAGE_SIZE)
+        sort = params.get('sort', 'recent')
+        after = decode_liked_cursor(params['cursor']) if params.get('cursor') else None
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        user_id = lookup_user_id(cursor, email)
+        if not user_id:
+            return song_list_response({"songs": [], "total": 0, "next_cursor": None})
+        songs, next_cursor = fetch_liked_page(cursor, user_id, limit, after, sort)
+        total = liked_sets.count(get_primary_connection, user_id)
+        return song_list_response({"songs": songs, "total": total, "next_cursor": next_cursor})
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        print(f"Error fetching liked songs page for email {email}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+# Per-user annotations for a list of songs: {email, trackIds} -> liked flag and the user's rating
+# per track. Liked flags come from the user's cached liked set (liked_sets); only the ratings
+# are queried, as (user_id, track_id) primary-key lookups
+ANNOTATION_MAX_TRACKS = 500
+
+@api.route('/api/songs/annotations', methods=['POST'])
+@read_only_route
+def get_song_annotations():
+    data = request.get_json(silent=True) or {}
+    email = data.get('email')
+    track_ids = data.get('trackIds')
+    if not email:
+        return jsonify({"error": "No email provided"}), 400
+    if not isinstance(track_ids, list):
+        return jsonify({"error": "trackIds must be a list"}), 400
+    try:
+        track_ids = sorted({int(track_id) for track_id in track_ids})
+    except (TypeError, ValueError):
+        return jsonify({"error": "trackIds must be integers"}), 400
+    if len(track_ids) > ANNOTATION_MAX_TRACKS:
+        return jsonify({"error": f"At most {ANNOTATION_MAX_TRACKS} tracks per request"}), 400
+
+    annotations = {str(track_id): {"liked": False, "rating": 0} for track_id in track_ids}
+    if not track_ids:
+        return jsonify({"annotations": annotations}), 200
+
+    conn = None
+    cursor = None
     try:
-        print("Flask: Received request to /api/getLikedSongs")
-        # Get email from request JSON
-        data = request.json
-        email = data.get('email')
-        if not email:
-            print("No email provided in request")
-            return jsonify({"error": "No email provided"}), 400
-        print(f"Flask: Processing getLikedSongs for email: {email}")
-        # Get user ID first
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-        if not user:
-            print(f"No user found for email: {email}")
-            return jsonify([])
-        user_id = user[0]
-        print(f"Found user ID: {user_id}")
-        # Get liked songs with the user's specific rating
+        user_id = lookup_user_id(cursor, email)
+        if not user_id:
+            return jsonify({"annotations": annotations}), 200
+        for track_id in liked_sets.liked_among(get_primary_connection, user_id, track_ids):
+            annotations[str(track_id)]["liked"] = True
+        placeholders = ', '.join(['%s'] * len(track_ids))
+        cursor.execute(f"SELECT track_id, rating FROM ratings WHERE user_id = %s AND track_id IN ({placeholders})",
+                       [user_id] + track_ids)
+        for track_id, rating in cursor.fetchall():
+            annotations[str(track_id)]["rating"] = rating or 0
+        return jsonify({"annotations": annotations}), 200
+    except Exception as e:
+        print(f"Error annotating songs for email {email}: {e}")
+        return jsonify({"error": "Failed to annotate songs"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+# ------------------------------- RECOMMENDATIONS -------------------------------
+
+# Neighbour lists are built offline by recommendations.py and memory-mapped here
+similarity_index = SimilarityIndex()
+SONG_LIST_COLUMNS = "track_id, track_name, artist_name, album_name, album_image, genres, rating"
+
+def fetch_songs_by_ids(cursor, track_ids):
+    """Song rows for track_ids in the given order (missing ids are skipped). cursor must be a dictionary cursor."""
+    if not track_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(track_ids))
+    cursor.execute(f"SELECT {SONG_LIST_COLUMNS} FROM songs WHERE track_id IN ({placeholders}) AND {live_songs()}",
+                   list(track_ids))
+    by_id = {row['track_id']: row for row in cursor.fetchall()}
+    return [by_id[track_id] for track_id in track_ids if track_id in by_id]
+
+def scored_songs_response(cursor, scored):
+    songs = fetch_songs_by_ids(cursor, [track_id for track_id, _ in scored])
+    scores = dict(scored)
+    return [{**song, "score": round(scores[song['track_id']], 4)} for song in songs]
+
+# Metadata (TF-IDF) similarity for songs without ratings; loaded on first use, then kept
+# current by add_song, update_song and delete_song
+content_index = ContentIndex()
+content_index_lock = threading.Lock()
+
+def content_similar(track_ids, limit):
+    if not content_index.loaded:
+        with content_index_lock:
+            if not content_index.loaded:
+                conn = get_primary_connection()
+                try:
+                    content_index.load_from_db(conn)
+                finally:
+                    conn.close()
+    return content_index.similar(track_ids, limit)
+
+@api.route('/api/songs/<int:song_id>/similar', methods=['GET'])
+@read_only_route
+def get_similar_songs(song_id):
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    conn = None
+    cursor = None
+    try:
+        # Listening-based neighbours first; fresh songs with no ratings fall back to metadata
+        scored = similarity_index.similar(song_id, limit) if similarity_index.available else []
+        if not scored and content_index.available:
+            scored = content_similar([song_id], limit).get(song_id, [])
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        return song_list_response(scored_songs_response(cursor, scored))
+    except Exception as e:
+        print("Error fetching similar songs:", e)
+        return jsonify({"error": "Failed to fetch similar songs"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+# "More like this" from catalog metadata only; POST {trackIds, limit} answers several songs at once
+@api.route('/api/songs/<int:song_id>/moreLikeThis', methods=['GET'])
+@api.route('/api/songs/moreLikeThis', methods=['POST'])
+@admission_class('expensive')
+@read_only_route
+def get_more_like_this(song_id=None):
+    data = request.get_json(silent=True) or {}
+    try:
+        track_ids = [song_id] if song_id is not None else [int(t) for t in data.get('trackIds', [])][:50]
+        limit = min(max(int(request.args.get('limit', data.get('limit', 10))), 1), 50)
+    except (TypeError, ValueError):
+        return jsonify({"error": "trackIds and limit must be integers"}), 400
+    if not content_index.available:
+        return jsonify({"error": "More like this is not available"}), 503
+    conn = None
+    cursor = None
+    try:
+        results = content_similar(track_ids, limit)
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        if song_id is not None:
+            return song_list_response(scored_songs_response(cursor, results.get(song_id, [])))
+        # One song lookup for the whole batch
+        all_ids = list({track_id for scored in results.values() for track_id, _ in scored})
+        songs = {song['track_id']: song for song in fetch_songs_by_ids(cursor, all_ids)}
+        return song_list_response({str(track_id): [{**songs[t], "score": round(score, 4)} for t, score in scored if t in songs]
+                                   for track_id, scored in results.items()})
+    except Exception as e:
+        print("Error fetching more like this:", e)
+        return jsonify({"error": "Failed to fetch similar songs"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+# <user> is the user's email or numeric id
+@api.route('/api/recommendations/<user>', methods=['GET'])
+@admission_class('expensive')
+@read_only_route
+def get_recommendations(user):
+    if not similarity_index.available:
+        return jsonify({"error": "Recommendations are not available yet"}), 503
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        user_id = int(user) if user.isdigit() else lookup_user_id(cursor, user)
+        if not user_id:
+            return jsonify({"error": "User not found"}), 404
+
+        # Seeds are liked and well-rated tracks; anything the user already rated is excluded
         cursor.execute("""
-            SELECT 
-                s.track_id,
-                s.track_name,
-                s.artist_name,
-                s.album_name,
-                s.album_image,
-                s.audio_url,
-                COALESCE(r.rating, 0) AS rating
-            FROM songs s
-            INNER JOIN liked_songs ls ON s.track_id = ls.track_id
-            LEFT JOIN ratings r ON s.track_id = r.track_id AND r.user_id = %s
-            WHERE ls.user_id = %s
+            SELECT track_id, rating FROM ratings WHERE user_id = %s
+            UNION ALL
+            SELECT track_id, NULL FROM liked_songs WHERE user_id = %s
         """, (user_id, user_id))
-        # Convert rows to list of dictionaries
-        columns = ['track_id', 'track_name', 'artist_name', 'album_name', 'album_image', 'audio_url', 'rating']
-        liked_songs = []
+        seeds, seen = set(), set()
         for row in cursor.fetchall():
-            song = {}
-            for i, col in enumerate(columns):
-                song[col] = row[i] if row[i] is not None else ''
-            liked_songs.append(song)
-        print(f"Found {len(liked_songs)} liked songs for user ID {user_id}")
-        return jsonify(liked_songs)
+            seen.add(row['track_id'])
+            if row['rating'] is None or row['rating'] >= 4:
+                seeds.add(row['track_id'])
+
+        scored = [(track_id, score) for track_id, score in similarity_index.recommend(seeds, limit + len(seen))
+                  if track_id not in seen][:limit]
+        return song_list_response(scored_songs_response(cursor, scored))
     except Exception as e:
-        print(f"Error in get_liked_songs for email {data.get('email', 'N/A')}: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        print("Error fetching recommendations:", e)
+        return jsonify({"error": "Failed to fetch recommendations"}), 500
     finally:
-        if 'cursor' in locals():
+        if cursor:
             cursor.close()
-        if 'conn' in locals():
+        if conn:
+            conn.close()
+
+# ------------------------------- CHARTS -------------------------------
+
+# Time-decayed trending scores, fed by add_review, add_comment and add_to_liked and synced from
+# the ratings, comments and liked_songs tables for writes made elsewhere
+trending_charts = TrendingCharts()
+
+@api.route('/api/trending', methods=['GET'])
+@read_only_route
+def get_trending():
+    genre = request.args.get('genre')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    conn = None
+    cursor = None
+    try:
+        trending_charts.ensure_loaded(get_primary_connection)
+        scored = trending_charts.top(limit, genre)
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        return song_list_response(scored_songs_response(cursor, scored))
+    except Exception as e:
+        print("Error fetching trending songs:", e)
+        return jsonify({"error": "Failed to fetch trending songs"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+# Bayesian top-rated charts, kept current by add_review
+leaderboards = Leaderboards()
+
+@api.route('/api/topRated', methods=['GET'])
+@read_only_route
+def get_top_rated():
+    genre = request.args.get('genre')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    conn = None
+    cursor = None
+    try:
+        leaderboards.ensure_loaded(get_primary_connection)
+        ranked = leaderboards.top(limit, genre)
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        songs = scored_songs_response(cursor, [(track_id, score) for track_id, score, _ in ranked])
+        counts = {track_id: count for track_id, _, count in ranked}
+        for song in songs:
+            song['rating_count'] = counts[song['track_id']]
+        return jsonify(songs), 200
+    except Exception as e:
+        print("Error fetching top rated songs:", e)
+        return jsonify({"error": "Failed to fetch top rated songs"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
             conn.close()
 
 #-------Admin---------
 
-@app.route('/api/admin/login', methods=['POST'])
+@api.route('/api/admin/login', methods=['POST'])
 def admin_login():
     try:
         conn = get_db_connection()
@@ -854,58 +1498,84 @@ def admin_login():
         cursor.close()
         conn.close()
 
-@app.route('/api/mostCommonGenre/<int:rating>', methods=['GET'])
+@api.route('/api/mostCommonGenre/<int:rating>', methods=['GET'])
+@admission_class('expensive')
+@read_only_route
 def get_most_common_genre(rating):
+    if rating not in GENRE_RATING_FILTERS:
+        return jsonify({"error": "Invalid rating range"}), 400
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        genre = genre_stats_cache.get_or_load(rating, lambda: find_most_common_genre(rating))
+        return jsonify({"most_common_genre": genre}), 200
+    except Exception as e:
+        print("Error fetching most common genre:", e)
+        return jsonify({"error": "Failed to fetch most common genre"}), 500
 
-        # Use the idx_genre_rating index to optimize the query
-        if rating == 1:  # Low ratings (<= 2)
-            cursor.execute("""
-                SELECT genres, COUNT(*) as count
-                FROM songs USE INDEX (idx_genre_rating)
-                WHERE rating <= 2 AND genres IS NOT NULL AND genres != ''
-                GROUP BY genres
-                ORDER BY count DESC
-                LIMIT 1
-            """)
-        elif rating == 2:  # Medium ratings (= 3)
-            cursor.execute("""
-                SELECT genres, COUNT(*) as count
-                FROM songs USE INDEX (idx_genre_rating)
-                WHERE rating = 3 AND genres IS NOT NULL AND genres != ''
-                GROUP BY genres
-                ORDER BY count DESC
-                LIMIT 1
-            """)
-        elif rating == 3:  # High ratings (>= 4)
-            cursor.execute("""
-                SELECT genres, COUNT(*) as count
-                FROM songs USE INDEX (idx_genre_rating)
-                WHERE rating >= 4 AND genres IS NOT NULL AND genres != ''
-                GROUP BY genres
-                ORDER BY count DESC
-                LIMIT 1
-            """)
-        else:
-            return jsonify({"error": "Invalid rating range"}), 400
+# Rating bucket -> songs.rating filter: 1 low (<= 2), 2 medium (= 3), 3 high (>= 4)
+GENRE_RATING_FILTERS = {1: "rating <= 2", 2: "rating = 3", 3: "rating >= 4"}
+
+# A full GROUP BY per bucket; shared by concurrent callers and refreshed in the background.
+# Runs on a replica when one is fresh enough: the counts tolerate a little lag.
+genre_stats_cache = LRUCache(len(GENRE_RATING_FILTERS), ttl_seconds=60,
+                             stale_seconds=int(os.getenv('GENRE_STATS_STALE_SECONDS', 600)))
 
+def find_most_common_genre(rating):
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Use the idx_genre_rating index to optimize the query
+        cursor.execute(f"""
+            SELECT genres, COUNT(*) as count
+            FROM songs USE INDEX (idx_genre_rating)
+            WHERE {GENRE_RATING_FILTERS[rating]} AND genres IS NOT NULL AND genres != ''
+            GROUP BY genres
+            ORDER BY count DESC
+            LIMIT 1
+        """)
         row = cursor.fetchone()
         print("Query result for rating", rating, ":", row)  # Log the query result
+        return row['genres'] if row else "none"
+    finally:
+        cursor.close()
         conn.close()
 
-        if row:
-            return jsonify({"most_common_genre": row[0]}), 200
-        else:
-            return jsonify({"most_common_genre": "none"}), 200
+# Columnar snapshot of songs/ratings/liked_songs for the admin dashboard
+analytics_store = AnalyticsStore()
 
+@api.route('/api/admin/analytics', methods=['GET'])
+@admin_token_required
+@admission_class('expensive')
+@read_only_route
+def get_admin_analytics():
+    if not analytics_store.available:
+        return jsonify({"error": "Analytics are not available"}), 503
+    requested = request.args.get('sections')
+    sections = [name.strip() for name in requested.split(',')] if requested else list(ANALYTICS_SECTIONS)
+    unknown = [name for name in sections if name not in ANALYTICS_SECTIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown sections: {', '.join(unknown)}"}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+    try:
+        return jsonify(analytics_store.report(get_db_connection, sections, limit)), 200
     except Exception as e:
-        print("Error fetching most common genre:", e)
-        return jsonify({"error": "Failed to fetch most common genre"}), 500
-    
-@app.route('/api/getMonitoredUsers', methods=['GET'])
+        print("Error computing analytics:", e)
+        return jsonify({"error": "Failed to compute analytics"}), 500
+
+# Hit/miss/coalescing counters of this worker's caches, plus admission counters
+@api.route('/api/admin/cacheStats', methods=['GET'])
 @admin_token_required
+@admission_class(None)
+def get_cache_stats():
+    return jsonify({
+        "song_details": song_details_cache.stats(),
+        "search": search_cache.stats(),
+        "genre_stats": genre_stats_cache.stats(),
+        "admission": admission.stats(),
+    }), 200
+
+@api.route('/api/getMonitoredUsers', methods=['GET'])
+@admin_token_required
+@read_only_route
 def get_monitored_users():
     try:
         conn = get_db_connection()
@@ -923,38 +1593,99 @@ def get_monitored_users():
         cursor.close()
         conn.close()
 
-@app.route('/api/songs/delete/<int:song_id>', methods=['DELETE'])
+# Deleting songs tombstones them at once and leaves the dependent rows to song_purger
+# (see song_deletion.py); the job id can be polled for progress
+song_purger = SongPurger(get_db_connection)
+
+def tombstone_songs(track_ids):
+    """Hide the given songs everywhere and queue their purge; return (job_id, tombstoned ids)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # Connections autocommit; the job row and its song_deletions rows must commit together
+        conn.start_transaction()
+        try:
+            job_id, found = tombstone(cursor, track_ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        cursor.close()
+        conn.close()
+    for track_id in found:
+        song_catalog.remove(track_id)
+        song_details_cache.invalidate(track_id)
+        liked_sets.remove_track(track_id)
+        content_index.remove(track_id)
+        trending_charts.remove_track(track_id)
+        leaderboards.remove_track(track_id)
+    if found:
+        search_cache.clear()
+        song_purger.wake()
+    return job_id, found
+
+@api.route('/api/songs/delete/<int:song_id>', methods=['DELETE'])
 @admin_token_required
 def delete_song(song_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # First check if the song exists
-        cursor.execute("SELECT track_id FROM songs WHERE track_id = %s", (song_id,))
-        if not cursor.fetchone():
+        job_id, found = tombstone_songs([song_id])
+        if not found:
             return jsonify({"error": "Song not found"}), 404
-
-        # Delete related records first (maintain referential integrity)
-        cursor.execute("DELETE FROM comments WHERE track_id = %s", (song_id,))
-        cursor.execute("DELETE FROM ratings WHERE track_id = %s", (song_id,))
-        cursor.execute("DELETE FROM liked_songs WHERE track_id = %s", (song_id,))
-        
-        # Finally delete the song
-        cursor.execute("DELETE FROM songs WHERE track_id = %s", (song_id,))
-        
-        conn.commit()
-        return jsonify({"message": "Song deleted successfully"}), 200
+        return jsonify({"message": "Song deleted successfully", "job_id": job_id}), 200
     except Exception as e:
         print("Error deleting song:", e)
         return jsonify({"error": str(e)}), 500
+
+# Bulk delete: {trackIds} -> 202 with the job id; unknown or already deleted ids are listed as missing
+@api.route('/api/songs/delete', methods=['POST'])
+@admin_token_required
+def delete_songs():
+    data = request.get_json(silent=True) or {}
+    track_ids = data.get('trackIds')
+    if not isinstance(track_ids, list) or not track_ids:
+        return jsonify({"error": "trackIds must be a non-empty list"}), 400
+    try:
+        track_ids = list(dict.fromkeys(int(track_id) for track_id in track_ids))
+    except (TypeError, ValueError):
+        return jsonify({"error": "trackIds must be integers"}), 400
+    if len(track_ids) > MAX_TRACKS_PER_JOB:
+        return jsonify({"error": f"At most {MAX_TRACKS_PER_JOB} tracks per request"}), 400
+    try:
+        job_id, found = tombstone_songs(track_ids)
+        if not found:
+            return jsonify({"error": "No matching songs found"}), 404
+        missing = sorted(set(track_ids) - set(found))
+        return jsonify({"job_id": job_id, "tracks": found, "missing": missing}), 202
+    except Exception as e:
+        print("Error deleting songs:", e)
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/api/songs/deleteJobs/<int:job_id>', methods=['GET'])
+@admin_token_required
+@admission_class(None)
+def get_delete_job(job_id):
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        job = job_progress(cursor, job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        if job['status'] == 'pending':
+            song_purger.wake()  # e.g. left behind by a restart
+        return jsonify(job), 200
+    except Exception as e:
+        print("Error fetching delete job:", e)
+        return jsonify({"error": "Failed to fetch job"}), 500
     finally:
-        if 'cursor' in locals():
+        if cursor:
             cursor.close()
-        if 'conn' in locals():
+        if conn:
             conn.close()
 
-@app.route('/api/spngs/add', methods=['POST'])
+@api.route('/api/spngs/add', methods=['POST'])
 @admin_token_required
 def add_song():
     try:
@@ -977,6 +1708,12 @@ def add_song():
         """, (track_name, artist_name, album_name, album_image, rating, genres, audio_url))
 
         conn.commit()
+        content_index.upsert([{"track_id": cursor.lastrowid, "track_name": track_name, "artist_name": artist_name,
+                               "album_name": album_name, "genres": genres}])
+        trending_charts.set_genres({cursor.lastrowid: genres})
+        leaderboards.set_genres({cursor.lastrowid: genres})
+        song_catalog.reload_tracks(cursor, [cursor.lastrowid])
+        search_cache.clear()
         return jsonify({"message": "Song added successfully"}), 200
 
     except Exception as e:
@@ -988,7 +1725,59 @@ def add_song():
         if 'conn' in locals():
             conn.close()
 
-@app.route('/api/songs/update/<int:song_id>', methods=['PUT'])
+# Bulk import: POST a CSV (text/csv) or NDJSON (application/x-ndjson) body, or pass
+# ?format=csv|ndjson; rows are inserted in the background (see song_import.py)
+def songs_imported(cursor, songs):
+    content_index.upsert(songs)
+    genres = {song['track_id']: song['genres'] for song in songs}
+    trending_charts.set_genres(genres)
+    leaderboards.set_genres(genres)
+    song_catalog.reload_tracks(cursor, list(genres))
+    search_cache.clear()
+
+song_importer = song_import.SongImporter(get_db_connection, on_insert=songs_imported)
+
+@api.route('/api/songs/import', methods=['POST'])
+@admin_token_required
+def import_songs():
+    try:
+        fmt = song_import.detect_format(request.content_type, request.args.get('format'))
+        path = song_import.spool_upload(request_body_stream())
+    except song_import.UploadRejected as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        job_id = song_importer.start(path, fmt)
+    except Exception as e:
+        os.unlink(path)
+        print("Error starting song import:", e)
+        return jsonify({"error": "Failed to start import"}), 500
+    return jsonify({"job_id": job_id}), 202
+
+@api.route('/api/songs/importJobs/<int:job_id>', methods=['GET'])
+@admin_token_required
+@admission_class(None)
+def get_import_job(job_id):
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        job = song_import.job_progress(cursor, job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        if job['status'] in ('pending', 'running'):
+            song_importer.wake()  # e.g. left behind by a restart
+        return jsonify(job), 200
+    except Exception as e:
+        print("Error fetching import job:", e)
+        return jsonify({"error": "Failed to fetch job"}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@api.route('/api/songs/update/<int:song_id>', methods=['PUT'])
 @admin_token_required
 def update_song(song_id):
     try:
@@ -1004,20 +1793,34 @@ def update_song(song_id):
         cursor = conn.cursor()
 
         # Update song details using MySQL syntax with %s placeholders
-        cursor.execute("""
+        cursor.execute(f"""
             UPDATE songs
             SET track_name = %s,
                 artist_name = %s,
                 album_name = %s,
                 genres = %s,
                 release_year = %s
-            WHERE track_id = %s
+            WHERE track_id = %s AND {live_songs()}
         """, (data['title'], data['artist'], data['album'], data['genre'], data['year'], song_id))
 
         if cursor.rowcount == 0:
             return jsonify({"error": "Song not found"}), 404
 
         conn.commit()
+        song_details_cache.update(song_id, lambda details: {
+            **details,
+            "track_name": data['title'],
+            "artist_name": data['artist'],
+            "album_name": data['album'],
+            "genres": data['genre'],
+            "release_year": data['year']
+        })
+        content_index.upsert([{"track_id": song_id, "track_name": data['title'], "artist_name": data['artist'],
+                               "album_name": data['album'], "genres": data['genre']}])
+        trending_charts.set_genres({song_id: data['genre']})
+        leaderboards.set_genres({song_id: data['genre']})
+        song_catalog.reload_tracks(cursor, [song_id])
+        search_cache.clear()
         return jsonify({"message": "Song updated successfully"}), 200
 
     except Exception as e:
@@ -1031,7 +1834,8 @@ def update_song(song_id):
 
 
 # Admin verify token endpoint
-@app.route('/api/admin/verify', methods=['GET'])
+@api.route('/api/admin/verify', methods=['GET'])
+@admission_class(None)
 def verify_admin_token():
     token = request.headers.get('Authorization')
     if not token:
@@ -1040,7 +1844,7 @@ def verify_admin_token():
     try:
         if token.startswith('Bearer '):
             token = token.split('Bearer ')[1]
-        data = pyjwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        data = pyjwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
         return jsonify({'message': 'Valid token', 'admin': data}), 200
     except pyjwt.ExpiredSignatureError:
         return jsonify({'error': 'Token has expired!'}), 401
@@ -1048,64 +1852,14 @@ def verify_admin_token():
         return jsonify({'error': 'Invalid token!'}), 401
 
 
-@app.route('/api/user/getLikedSongs', methods=['POST'])
+@api.route('/api/user/getLikedSongs', methods=['POST'])
+@read_only_route
 def get_user_liked_songs():
-    try:
-        data = request.json
-        if not data or 'email' not in data:
-            print("No email provided in request")
-            return jsonify([])
-
-        email = data['email']
-        print(f"Fetching liked songs for email: {email}")
-        
-        # Get user ID first
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-        
-        if not user:
-            print(f"No user found for email: {email}")
-            conn.close()
-            return jsonify([])
-
-        user_id = user[0]
-        print(f"Found user ID: {user_id}")        # Get liked songs with the user's specific rating
-        cursor.execute("""
-            SELECT 
-                s.track_id,
-                s.track_name,
-                s.artist_name,
-                s.album_name,
-                s.album_image,
-                s.audio_url,
-                COALESCE(r.rating, 0) AS rating
-            FROM songs s
-            INNER JOIN liked_songs ls ON s.track_id = ls.track_id
-            LEFT JOIN ratings r ON s.track_id = r.track_id AND r.user_id = %s
-            WHERE ls.user_id = %s
-        """, (user_id, user_id))
-
-        # Convert rows to list of dictionaries
-        columns = ['track_id', 'track_name', 'artist_name', 'album_name', 'album_image', 'audio_url', 'rating']
-        liked_songs = []
-
-        for row in cursor.fetchall():
-            song = {}
-            for i, col in enumerate(columns):
-                song[col] = row[i] if row[i] is not None else ''
-            liked_songs.append(song)
-
-        print(f"Found {len(liked_songs)} liked songs for user ID {user_id}")
-        conn.close()
-        return jsonify(liked_songs)
-
-    except Exception as e:
-        print(f"Error in get_user_liked_songs for email {data.get('email', 'N/A')}: {str(e)}")
-        if 'conn' in locals():
-            conn.close()
-        return jsonify({"error": "Internal server error"}), 500
+    data = request.json
+    if not data or 'email' not in data:
+        print("No email provided in request")
+        return jsonify([])
+    return legacy_liked_songs_response(data['email'])
 
 def verify_email(email):
     try:
@@ -1125,12 +1879,71 @@ def verify_email(email):
         if 'conn' in locals():
             conn.close()
 
+# ------------------------------- APP FACTORY -------------------------------
+
+def create_app(config=None):
+    """Build the Flask app. Reads .env and the environment; opens no connections."""
+    load_dotenv()
+    app = Flask(__name__)
+    # Set your secret key for JWT from environment variable
+    app.config['SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'admin-secret-key-change-this-in-production')
+    # Email Configuration
+    app.config['GMAIL_USER'] = os.getenv('GMAIL_USER', 'your-email@gmail.com')
+    app.config['GMAIL_APP_PASSWORD'] = os.getenv('GMAIL_APP_PASSWORD', 'your-app-password')
+    # Setup HTTPS if enabled
+    app.config['USE_HTTPS'] = os.getenv('USE_HTTPS', 'false').lower() == 'true'
+    app.config['SSL_CERT'] = os.getenv('SSL_CERT', './certs/certificate.crt')
+    app.config['SSL_KEY'] = os.getenv('SSL_KEY', './certs/private.key')
+    if config:
+        app.config.update(config)
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    # remote_addr becomes the client behind the proxies, so admission buckets are per client
+    if TRUSTED_PROXY_HOPS:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+    app.register_blueprint(api)
+    return app
+
+def preload():
+    """Load read-mostly data before forking so workers share it copy-on-write (see serve.py)."""
+    steps = (
+        ("song catalog", lambda: song_catalog.ready(get_primary_connection)),
+        ("similarity index", lambda: similarity_index.available),
+        ("content index", lambda: content_similar([], 1)),
+        ("leaderboards", lambda: leaderboards.ensure_loaded(get_primary_connection)),
+        ("trending charts", lambda: trending_charts.ensure_loaded(get_primary_connection)),
+    )
+    for name, load in steps:
+        try:
+            load()
+        except Exception as e:
+            print(f"Could not preload {name}: {e}")
+
+# Per-worker hooks, run in each child right after the fork (the purger and importer also resume unfinished jobs)
+post_fork_hooks = [comment_moderator.after_fork, song_purger.after_fork, song_purger.wake,
+                   song_importer.after_fork, song_importer.wake, trending_charts.after_fork]
+
+def run_post_fork_hooks():
+    for hook in post_fork_hooks:
+        hook()
+
+_app = None
+
+def __getattr__(name):
+    # `Repository:app` keeps working for WSGI servers; the app is only built when first asked for
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
     try:
         # Default to port 5000 for local development
         port = int(os.environ.get("PORT", 5000))
         
-        # Run in development mode on localhost
-        app.run(host='localhost', port=port, debug=True)
+        # Run in development mode on localhost; use serve.py in production
+        create_app().run(host='localhost', port=port, debug=True)
     except Exception as e:
         print(f"Error starting Flask application: {e}")
@@ -0,0 +1,166 @@
+import math
+import os
+import threading
+import time
+
+# Admission control in front of the database-backed routes.
+#
+# Each route belongs to a class with its own concurrency limit and queue budget. A request
+# waits for a slot at most the class's budget and is then shed with 503 + Retry-After, so
+# when MySQL slows down requests fail fast instead of piling up behind connection_timeout.
+# Each class has a rank (0 is the highest): while a class of a higher rank has requests
+# waiting, lower-ranked classes are shed without queueing, so cheap reads and writes keep
+# flowing while search and the full catalog dump back off first. Classes of the same rank
+# only queue against their own limit.
+#
+# Each client (remote address) also has a token bucket; expensive routes cost more tokens.
+# An empty bucket gives 429 + Retry-After. All limits are per worker process.
+#
+# Behind nginx/Railway the remote address is the proxy's, so the client is the address
+# TRUSTED_PROXY_HOPS entries from the right of X-Forwarded-For (what werkzeug's ProxyFix picks,
+# which create_app installs for the Flask routes). Set it to 0 when clients connect directly,
+# otherwise they could pick their own bucket by sending the header.
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 1))
+CLIENT_RATE_PER_SECOND = float(os.getenv('ADMISSION_CLIENT_RATE', 20))
+CLIENT_BURST = float(os.getenv('ADMISSION_CLIENT_BURST', 40))
+MAX_TRACKED_CLIENTS = 10000
+
+
+class RouteClass:
+    def __init__(self, name, limit, queue_budget_ms, cost=1, rank=0):
+        self.name = name
+        self.limit = limit
+        self.queue_budget = queue_budget_ms / 1000
+        self.cost = cost
+        self.rank = rank
+        self.in_flight = 0
+        self.waiting = 0
+        self.service_time = 0.05  # Moving average of seconds a slot is held
+        self.admitted = 0
+        self.shed = 0
+
+    def retry_after(self):
+        """Seconds until the current queue has likely drained."""
+        return max(1, math.ceil(self.service_time * (self.waiting + 1) / self.limit))
+
+
+def env_class(name, limit, queue_budget_ms, cost=1, rank=0):
+    prefix = f'ADMISSION_{name.upper()}_'
+    return RouteClass(name, int(os.getenv(prefix + 'LIMIT', limit)),
+                      float(os.getenv(prefix + 'QUEUE_MS', queue_budget_ms)), cost, rank)
+
+
+def client_address(remote_addr, forwarded_for, hops=TRUSTED_PROXY_HOPS):
+    """The client's address: the hops-th X-Forwarded-For entry from the right, else remote_addr."""
+    if hops and forwarded_for:
+        values = [value.strip() for value in forwarded_for.split(',')]
+        if len(values) >= hops:
+            return values[-hops]
+    return remote_addr
+
+
+class Rejected(Exception):
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class ClientBuckets:
+    """Per-client token buckets refilled at rate tokens/second up to burst."""
+
+    def __init__(self, rate=CLIENT_RATE_PER_SECOND, burst=CLIENT_BURST, max_clients=MAX_TRACKED_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+        self.buckets = {}  # client -> [tokens, updated]
+
+    def take(self, client, cost=1, now=None):
+        """Spend cost tokens; return 0 when allowed, else the seconds until enough have refilled."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                if len(self.buckets) >= self.max_clients:
+                    self._prune(now)
+                bucket = self.buckets[client] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                return 0
+            bucket[0] = tokens
+            return (cost - tokens) / self.rate
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        full = [c for c, (tokens, updated) in self.buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for client in full:
+            del self.buckets[client]
+        if len(self.buckets) >= self.max_clients:
+            self.buckets.clear()
+
+
+class AdmissionController:
+    """Concurrency slots per route class, handed out by rank with a bounded wait."""
+
+    def __init__(self, classes, buckets=None):
+        self.classes = {c.name: c for c in classes}
+        self.priority = sorted(classes, key=lambda c: c.rank)  # Highest rank first
+        self.buckets = buckets or ClientBuckets()
+        self.condition = threading.Condition()
+
+    def admit(self, class_name, client):
+        """Take a slot for one request; return a token for release() or raise Rejected."""
+        route_class = self.classes[class_name]
+        self.throttle(client, route_class.cost)
+
+        deadline = time.monotonic() + route_class.queue_budget
+        with self.condition:
+            route_class.waiting += 1
+            try:
+                while not self._can_run(route_class):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._outranked(route_class):
+                        route_class.shed += 1
+                        raise Rejected(503, route_class.retry_after(), "Server is busy, try again shortly")
+                    self.condition.wait(remaining)
+            finally:
+                route_class.waiting -= 1
+            route_class.in_flight += 1
+            route_class.admitted += 1
+        return route_class, time.monotonic()
+
+    def throttle(self, client, cost=1):
+        """Charge the client's bucket; raise Rejected (429) when it is empty."""
+        wait = self.buckets.take(client, cost)
+        if wait:
+            raise Rejected(429, max(1, math.ceil(wait)), "Too many requests")
+
+    def release(self, token):
+        route_class, started = token
+        with self.condition:
+            route_class.in_flight -= 1
+            route_class.service_time += 0.1 * (time.monotonic() - started - route_class.service_time)
+            self.condition.notify_all()
+
+    def _can_run(self, route_class):
+        return route_class.in_flight < route_class.limit and not self._outranked(route_class)
+
+    def _outranked(self, route_class):
+        for other in self.priority:
+            if other.rank >= route_class.rank:
+                return False
+            if other.waiting:
+                return True
+        return False
+
+    def stats(self):
+        with self.condition:
+            return {c.name: {"limit": c.limit, "in_flight": c.in_flight, "waiting": c.waiting,
+                             "admitted": c.admitted, "shed": c.shed,
+                             "service_ms": round(c.service_time * 1000, 1)}
+                    for c in self.priority}
@@ -0,0 +1,261 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+try:
+    import fcntl
+except ImportError:  # Windows (single-process development): the thread lock alone guards eviction
+    fcntl = None
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow every size is served from the original image
+    Image = None
+
+# Album-art proxy: each upstream image is fetched once, resized to the sizes the UI uses
+# and kept in a size-bounded on-disk LRU.
+#
+# The directory is shared by every worker process, so it is the only index: a hit refreshes
+# the file's mtime, and eviction rescans the directory (one process at a time, under
+# <dir>/.lock) and removes the least recently used files until all of them together fit in
+# ALBUM_ART_MAX_BYTES. A file evicted by another worker between lookup and open is a miss.
+ALBUM_ART_DIR = os.getenv('ALBUM_ART_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', 'album_art'))
+ALBUM_ART_MAX_BYTES = int(os.getenv('ALBUM_ART_MAX_BYTES', 512 * 1024 * 1024))
+ALBUM_ART_SIZES = (64, 160, 300)
+ALBUM_ART_HOSTS = tuple(h.strip() for h in os.getenv('ALBUM_ART_HOSTS', 'i.scdn.co').split(',') if h.strip())
+MAX_UPSTREAM_BYTES = 10 * 1024 * 1024
+KEY_LOCK_STRIPES = 64  # Fetches of the same image serialize on one of these; distinct images rarely share one
+TOUCH_SECONDS = 60      # A hit refreshes an mtime older than this
+RESCAN_SECONDS = 30     # Bounds how far other workers' writes can push the directory past the budget
+EVICT_TO = 0.9          # Eviction frees space down to this fraction of max_bytes
+
+
+class AlbumArtError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def check_host(url, allowed_hosts):
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme not in ('http', 'https') or parsed.hostname not in allowed_hosts:
+        raise AlbumArtError(f"Album art host not allowed: {parsed.hostname}", 400)
+
+
+class AllowedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follows redirects only to the allowed hosts."""
+
+    def __init__(self, allowed_hosts):
+        self.allowed_hosts = allowed_hosts
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_host(newurl, self.allowed_hosts)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+class HttpFetcher:
+    """Fetches images from the allowed upstream hosts."""
+
+    def __init__(self, allowed_hosts=ALBUM_ART_HOSTS, timeout=10):
+        self.allowed_hosts = allowed_hosts
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(AllowedRedirectHandler(allowed_hosts))
+
+    def fetch(self, url):
+        check_host(url, self.allowed_hosts)
+        try:
+            with self.opener.open(url, timeout=self.timeout) as response:
+                data = response.read(MAX_UPSTREAM_BYTES + 1)
+        except AlbumArtError:
+            raise
+        except Exception as e:
+            raise AlbumArtError(f"Failed to fetch album art: {e}", 502)
+        if len(data) > MAX_UPSTREAM_BYTES:
+            raise AlbumArtError("Album art is too large", 502)
+        return data
+
+
+class FileFetcher:
+    """Local stand-in for HttpFetcher: serves the file named after the last URL path segment from root."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def fetch(self, url):
+        name = os.path.basename(urllib.parse.urlparse(url).path)
+        path = os.path.join(self.root, name)
+        if not name or not os.path.isfile(path):
+            raise AlbumArtError(f"Album art not found: {url}", 404)
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class DiskLRU:
+    """Files in one directory shared by every worker, evicted least-recently-used (oldest mtime)
+    first once together they exceed max_bytes."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total = self._scan_total()  # Directory size at the last scan plus this process's writes since
+        self.scanned_at = time.monotonic()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _files(self):
+        """(mtime, name, size) for every cache file, oldest first."""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp') or name == '.lock':
+                continue
+            try:
+                stat = os.stat(self.path(name))
+            except FileNotFoundError:
+                continue  # Evicted by another worker while listing
+            files.append((stat.st_mtime, name, stat.st_size))
+        return sorted(files)
+
+    def _scan_total(self):
+        return sum(size for _, _, size in self._files())
+
+    def get(self, name):
+        """Path of name, or None when it is not cached."""
+        path = self.path(name)
+        try:
+            mtime = os.stat(path).st_mtime
+            if time.time() - mtime > TOUCH_SECONDS:
+                os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, name, data):
+        path = self.path(name)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self.lock:
+            self.total += len(data)
+            if self.total > self.max_bytes or time.monotonic() - self.scanned_at >= RESCAN_SECONDS:
+                self._evict()
+        return path
+
+    def _evict(self):
+        with open(self.path('.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released when the file is closed
+            files = self._files()
+            total = sum(size for _, _, size in files)
+            if total > self.max_bytes:
+                # Keep the newest file: it is the one just written
+                for _, name, size in files[:-1]:
+                    if total <= self.max_bytes * EVICT_TO:
+                        break
+                    try:
+                        os.remove(self.path(name))
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+        self.total = total
+        self.scanned_at = time.monotonic()
+
+
+class AlbumArtCache:
+    def __init__(self, fetcher=None, directory=ALBUM_ART_DIR, max_bytes=ALBUM_ART_MAX_BYTES, sizes=ALBUM_ART_SIZES):
+        self.fetcher = fetcher or HttpFetcher()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._store = None
+        self.sizes = sizes
+        self.key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+        self.store_lock = threading.Lock()
+
+    @property
+    def store(self):
+        # Indexing the cache directory is deferred to the first request that needs it
+        if self._store is None:
+            with self.store_lock:
+                if self._store is None:
+                    self._store = DiskLRU(self.directory, self.max_bytes)
+        return self._store
+
+    def _key_lock(self, key):
+        return self.key_locks[int(key[:8], 16) % len(self.key_locks)]
+
+    def entry_name(self, url, size=None):
+        """Cache file name for url at size; also used as the ETag since upstream images never change."""
+        if size is not None and size not in self.sizes:
+            raise AlbumArtError(f"Unsupported size {size}; use one of {list(self.sizes)}", 400)
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return key, (f"{key}_{size}.jpg" if size and Image is not None else f"{key}.img")
+
+    def open(self, url, size=None):
+        """Return (binary file, etag) for url resized to size (None = original), fetching upstream at most once.
+
+        Cached files are opened here, so another worker evicting them afterwards cannot break the response.
+        """
+        key, name = self.entry_name(url, size)
+
+        f = self._open(name)
+        if f is None:
+            # Concurrent requests for the same image wait for one fetch instead of each going upstream
+            with self._key_lock(key):
+                f = self._open(name)
+                if f is None:
+                    original = self._read(f"{key}.img")
+                    if original is None:
+                        original = self.fetcher.fetch(url)
+                        self.store.put(f"{key}.img", original)
+                    data = original
+                    if name != f"{key}.img":
+                        data = self._resize(original, size)
+                        self.store.put(name, data)
+                    f = io.BytesIO(data)
+        return f, f'"{name}"'
+
+    def _open(self, name):
+        path = self.store.get(name)
+        if path is None:
+            return None
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:  # Evicted by another worker since the lookup
+            return None
+
+    def _read(self, name):
+        f = self._open(name)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def _resize(self, data, size):
+        try:
+            image = Image.open(io.BytesIO(data)).convert('RGB')
+        except OSError as e:  # Includes UnidentifiedImageError and truncated images
+            raise AlbumArtError(f"Album art is not a readable image: {e}", 502)
+        image.thumbnail((size, size), Image.LANCZOS)
+        buf = io.BytesIO()
+        image.save(buf, 'JPEG', quality=85, optimize=True)
+        return buf.getvalue()
+
+
+def sniff_mimetype(f):
+    """Image type of the binary file f from its first bytes; f is left at the start."""
+    head = f.read(12)
+    f.seek(0)
+    if head.startswith(b'\x89PNG'):
+        return 'image/png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith(b'GIF8'):
+        return 'image/gif'
+    return 'image/jpeg'
@@ -0,0 +1,316 @@
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # Admin analytics are disabled without NumPy
+    np = None
+
+# Admin analytics over a columnar NumPy snapshot of songs, ratings and liked_songs.
+#
+# The snapshot is loaded in full once, then topped up every REFRESH_SECONDS with rows
+# created since the last load (new songs by track_id, ratings by created_at, likes by
+# liked_at). Edited ratings, song edits and deletions are picked up by the full reload
+# every FULL_REFRESH_SECONDS. Every statistic is a vectorized group-by (bincount) over the
+# arrays, so dashboard requests never query MySQL.
+REFRESH_SECONDS = int(os.getenv('ANALYTICS_REFRESH_SECONDS', 60))
+FULL_REFRESH_SECONDS = int(os.getenv('ANALYTICS_FULL_REFRESH_SECONDS', 3600))
+COMMIT_LAG_SECONDS = 5
+SECTIONS = ('overview', 'genres', 'artists', 'tracks', 'users', 'activity')
+DAY = 86400
+
+
+def _fetch(cursor, query, params, ncols, batch_size=50000):
+    """Run query and return its rows as a float64 (n, ncols) array."""
+    cursor.execute(query, params)
+    blocks = []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        blocks.append(np.array(rows, dtype=np.float64))
+    if not blocks:
+        return np.empty((0, ncols))
+    return np.concatenate(blocks)
+
+
+def _intern(values, codes, labels):
+    """Dictionary-encode strings into int32 codes, extending codes/labels in place."""
+    out = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(labels)
+            labels.append(value)
+        out[i] = code
+    return out
+
+
+class CatalogSnapshot:
+    """Immutable set of column arrays; a refresh builds a new snapshot and swaps it in.
+
+    The joins every statistic needs (rating/like -> song row, user id -> dense user code) are
+    resolved once here, so the per-request work is only bincounts over these columns.
+    """
+
+    def __init__(self, as_of, songs, ratings, likes, genres, artists):
+        self.as_of = as_of
+        self.song_ids, self.song_genres, self.song_artists = songs
+        self.genres, self.artists = genres, artists   # (codes dict, labels list), append-only
+
+        # Drop rows whose song is not in the snapshot (deleted since, or added mid-load)
+        rating_rows, found = self._song_rows(ratings[1])
+        self.rating_users, self.rating_tracks, self.rating_values, self.rating_times = (c[found] for c in ratings)
+        self.rating_rows = rating_rows[found]
+        like_rows, found = self._song_rows(likes[1])
+        self.like_users, self.like_tracks, self.like_times = (c[found] for c in likes)
+        self.like_rows = like_rows[found]
+
+        self.user_ids, user_codes = np.unique(np.concatenate([self.rating_users, self.like_users]), return_inverse=True)
+        self.action_user_codes = user_codes   # ratings, then likes
+        # Whole days before as_of of each rating/like (-1 when unknown)
+        self.rating_days = self._days_ago(self.rating_times)
+        self.like_days = self._days_ago(self.like_times)
+        self.action_days = np.concatenate([self.rating_days, self.like_days])
+        self.results = {}   # (section, limit) -> result; valid for this snapshot's lifetime
+
+    def _days_ago(self, times):
+        days = np.full(len(times), -1, dtype=np.int32)
+        known = ~np.isnan(times)
+        days[known] = np.maximum((self.as_of - times[known]) // DAY, 0)
+        return days
+
+    def _song_rows(self, track_ids):
+        """Row of each track in the song columns, plus a mask of the tracks that exist."""
+        if len(self.song_ids) == 0:
+            return np.zeros(len(track_ids), np.int64), np.zeros(len(track_ids), bool)
+        rows = np.minimum(np.searchsorted(self.song_ids, track_ids), len(self.song_ids) - 1)
+        return rows, self.song_ids[rows] == track_ids
+
+
+def _load_songs(cursor, genres, artists, after_track_id=0):
+    cursor.execute("SELECT track_id, genres, artist_name FROM songs WHERE track_id > %s ORDER BY track_id",
+                   (after_track_id,))
+    rows = cursor.fetchall()
+    track_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    genre_codes = _intern([(row[1] or '').strip() or 'unknown' for row in rows], *genres)
+    # Multi-artist tracks count toward their primary (first listed) artist
+    artist_codes = _intern([(row[2] or '').split(',')[0].strip() or 'unknown' for row in rows], *artists)
+    return track_ids, genre_codes, artist_codes
+
+
+def _load_ratings(cursor, since):
+    block = _fetch(cursor, """
+        SELECT user_id, track_id, rating, UNIX_TIMESTAMP(created_at) FROM ratings
+        WHERE created_at >= FROM_UNIXTIME(%s)
+    """, (since,), 4)
+    return (block[:, 0].astype(np.int64), block[:, 1].astype(np.int64),
+            block[:, 2].astype(np.int8), block[:, 3])
+
+
+def _load_likes(cursor, since):
+    block = _fetch(cursor, """
+        SELECT user_id, track_id, UNIX_TIMESTAMP(liked_at) FROM liked_songs
+        WHERE liked_at >= FROM_UNIXTIME(%s)
+    """, (since,), 3)
+    return block[:, 0].astype(np.int64), block[:, 1].astype(np.int64), block[:, 2]
+
+
+def _merge(old, new):
+    """Append new (user_id, track_id, ...) rows, replacing old rows with the same key."""
+    if len(new[0]) == 0:
+        return old
+    old_keys = (old[0] << 32) | old[1]
+    new_keys = (new[0] << 32) | new[1]
+    keep = ~np.isin(old_keys, new_keys)
+    return tuple(np.concatenate([a[keep], b]) for a, b in zip(old, new))
+
+
+def load_snapshot(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT UNIX_TIMESTAMP()")
+        as_of = float(cursor.fetchone()[0])
+        genres, artists = ({}, []), ({}, [])
+        songs = _load_songs(cursor, genres, artists)
+        return CatalogSnapshot(as_of, songs, _load_ratings(cursor, 0), _load_likes(cursor, 0), genres, artists)
+    finally:
+        cursor.close()
+
+
+def refresh_snapshot(snapshot, conn):
+    """New snapshot with the rows created since snapshot.as_of."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT UNIX_TIMESTAMP()")
+        as_of = float(cursor.fetchone()[0])
+        since = snapshot.as_of - COMMIT_LAG_SECONDS
+        last_track_id = int(snapshot.song_ids[-1]) if len(snapshot.song_ids) else 0
+        new_songs = _load_songs(cursor, snapshot.genres, snapshot.artists, last_track_id)
+        songs = tuple(np.concatenate([a, b]) for a, b in
+                      zip((snapshot.song_ids, snapshot.song_genres, snapshot.song_artists), new_songs))
+        ratings = _merge((snapshot.rating_users, snapshot.rating_tracks, snapshot.rating_values, snapshot.rating_times),
+                         _load_ratings(cursor, since))
+        likes = _merge((snapshot.like_users, snapshot.like_tracks, snapshot.like_times), _load_likes(cursor, since))
+        return CatalogSnapshot(as_of, songs, ratings, likes, snapshot.genres, snapshot.artists)
+    finally:
+        cursor.close()
+
+
+def _rating_histogram(groups, ratings, n_groups):
+    """(n_groups, 5) counts of 1..5 star ratings per group code."""
+    return np.bincount(groups * 5 + (ratings.astype(np.int64) - 1), minlength=n_groups * 5).reshape(n_groups, 5)
+
+
+def _means(histogram):
+    counts = histogram.sum(axis=1)
+    totals = histogram @ np.arange(1, 6)
+    return counts, np.divide(totals, counts, out=np.zeros(len(counts)), where=counts > 0)
+
+
+def overview(snapshot, limit):
+    return {
+        "songs": int(len(snapshot.song_ids)),
+        "ratings": int(len(snapshot.rating_values)),
+        "likes": int(len(snapshot.like_tracks)),
+        "active_users": int(len(snapshot.user_ids)),
+        "mean_rating": round(float(snapshot.rating_values.mean()), 3) if len(snapshot.rating_values) else 0,
+        "genres": len(snapshot.genres[1]),
+        "artists": len(snapshot.artists[1]),
+    }
+
+
+def _group_stats(snapshot, song_codes, labels, limit, min_ratings=0):
+    n = len(labels)
+    histogram = _rating_histogram(song_codes[snapshot.rating_rows], snapshot.rating_values, n)
+    counts, means = _means(histogram)
+    likes = np.bincount(song_codes[snapshot.like_rows], minlength=n)
+    songs = np.bincount(song_codes, minlength=n)
+    order = np.argsort(-counts, kind='stable')
+    order = order[counts[order] >= max(min_ratings, 1)][:limit]
+    return [{
+        "name": labels[i],
+        "songs": int(songs[i]),
+        "ratings": int(counts[i]),
+        "likes": int(likes[i]),
+        "mean_rating": round(float(means[i]), 3),
+        "distribution": histogram[i].tolist(),
+    } for i in order]
+
+
+def genre_stats(snapshot, limit):
+    return _group_stats(snapshot, snapshot.song_genres, snapshot.genres[1], limit)
+
+
+def artist_stats(snapshot, limit):
+    return _group_stats(snapshot, snapshot.song_artists, snapshot.artists[1], limit, min_ratings=5)
+
+
+def track_engagement(snapshot, limit):
+    """Most engaged-with tracks by ratings + likes."""
+    n = len(snapshot.song_ids)
+    if n == 0:
+        return []
+    rating_counts = np.bincount(snapshot.rating_rows, minlength=n)
+    rating_totals = np.bincount(snapshot.rating_rows, weights=snapshot.rating_values, minlength=n)
+    like_counts = np.bincount(snapshot.like_rows, minlength=n)
+    engagement = rating_counts + like_counts
+    k = min(limit, n)
+    top = np.argpartition(-engagement, k - 1)[:k]
+    top = top[np.argsort(-engagement[top], kind='stable')]
+    return [{
+        "track_id": int(snapshot.song_ids[i]),
+        "artist": snapshot.artists[1][snapshot.song_artists[i]],
+        "genre": snapshot.genres[1][snapshot.song_genres[i]],
+        "ratings": int(rating_counts[i]),
+        "likes": int(like_counts[i]),
+        "mean_rating": round(float(rating_totals[i] / rating_counts[i]), 3) if rating_counts[i] else 0,
+    } for i in top if engagement[i] > 0]
+
+
+def user_activity(snapshot, limit):
+    """Distribution of ratings + likes per active user, and recently active user counts."""
+    n = len(snapshot.user_ids)
+    if n == 0:
+        return {"active_users": 0}
+    codes, days_ago = snapshot.action_user_codes, snapshot.action_days
+    per_user = np.bincount(codes, minlength=n)
+    percentiles = np.percentile(per_user, [50, 75, 90, 95, 99])
+
+    def active_since(days):
+        recent = codes[(days_ago >= 0) & (days_ago < days)]
+        return int(np.count_nonzero(np.bincount(recent, minlength=n)))
+
+    return {
+        "active_users": int(len(per_user)),
+        "actions_per_user": {
+            "mean": round(float(per_user.mean()), 2),
+            "p50": float(percentiles[0]), "p75": float(percentiles[1]), "p90": float(percentiles[2]),
+            "p95": float(percentiles[3]), "p99": float(percentiles[4]), "max": int(per_user.max()),
+        },
+        "active_last_7_days": active_since(7),
+        "active_last_30_days": active_since(30),
+    }
+
+
+def daily_activity(snapshot, limit):
+    """Ratings and likes per day over the last 30 days, oldest first."""
+    def per_day(days_ago):
+        return np.bincount(days_ago[(days_ago >= 0) & (days_ago < 30)], minlength=30)[::-1].tolist()
+    return {"days": 30, "ratings": per_day(snapshot.rating_days), "likes": per_day(snapshot.like_days)}
+
+
+SECTION_FUNCTIONS = {
+    'overview': overview,
+    'genres': genre_stats,
+    'artists': artist_stats,
+    'tracks': track_engagement,
+    'users': user_activity,
+    'activity': daily_activity,
+}
+
+
+class AnalyticsStore:
+    def __init__(self, refresh_seconds=REFRESH_SECONDS, full_refresh_seconds=FULL_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.full_refresh_seconds = full_refresh_seconds
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.refreshed_at = 0
+        self.full_refreshed_at = 0
+
+    @property
+    def available(self):
+        return np is not None
+
+    def current(self, conn_factory):
+        """The snapshot, refreshed first when it is older than refresh_seconds."""
+        if self.snapshot is None or time.time() - self.refreshed_at >= self.refresh_seconds:
+            with self.lock:
+                now = time.time()
+                if self.snapshot is None or now - self.refreshed_at >= self.refresh_seconds:
+                    conn = conn_factory()
+                    try:
+                        if self.snapshot is None or now - self.full_refreshed_at >= self.full_refresh_seconds:
+                            self.snapshot = load_snapshot(conn)
+                            self.full_refreshed_at = now
+                        else:
+                            self.snapshot = refresh_snapshot(self.snapshot, conn)
+                    finally:
+                        conn.close()
+                    self.refreshed_at = now
+        return self.snapshot
+
+    def report(self, conn_factory, sections=SECTIONS, limit=20):
+        snapshot = self.current(conn_factory)
+        started = time.perf_counter()
+        result = {}
+        for name in sections:
+            key = (name, limit)
+            if key not in snapshot.results:
+                snapshot.results[key] = SECTION_FUNCTIONS[name](snapshot, limit)
+            result[name] = snapshot.results[key]
+        result["as_of"] = snapshot.as_of
+        result["computed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
@@ -0,0 +1,401 @@
+import asyncio
+import datetime
+import os
+import re
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import aiomysql
+import bcrypt
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from dotenv import load_dotenv
+from admission import Rejected, client_address
+from catalog import DETAIL_COLUMNS
+from compression import negotiate
+from wire_format import negotiate as negotiate_wire_format
+
+# asyncio serving mode: the same routes as Repository.py on one event loop.
+#
+#   python asgi.py               serve with uvicorn on PORT (ASGI_WORKERS processes, default 1)
+#   uvicorn asgi:app             or any other ASGI server
+#
+# The slow, high-fan-in endpoints are served natively with an aiomysql pool, so a waiting
+# client costs a coroutine instead of a thread: catalog reads (getAllSongs, searchSongs,
+# getSongById), getSongDetails, comment pages and registerUser. bcrypt and the JSON encoding
+# of large payloads run in a CPU executor, SMTP sends and cache loads in an I/O executor.
+# Every other route is handed to the Flask app through asgiref's WSGI adapter, on a pool of
+# WSGI_WORKERS threads (asgiref's default runs them all on one thread), so write paths keep
+# all of their in-process hooks and the responses are identical to the WSGI app's. Native
+# routes take a slot from the same admission controller (and route class) as their Flask
+# counterparts.
+ASYNC_DB_POOL_SIZE = int(os.getenv('ASYNC_DB_POOL_SIZE', 20))
+CPU_WORKERS = int(os.getenv('ASYNC_CPU_WORKERS', os.cpu_count() or 1))
+IO_WORKERS = int(os.getenv('ASYNC_IO_WORKERS', 16))
+WSGI_WORKERS = int(os.getenv('ASYNC_WSGI_WORKERS', 32))
+LARGE_JSON_ITEMS = 500  # Payloads with more items than this are encoded off the event loop
+
+# .env must be loaded before Repository imports the helper modules, which read their settings at import
+load_dotenv()
+import Repository  # noqa: E402
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query', 'headers', 'receive', 'remote_addr')
+
+    def __init__(self, scope, receive):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.remote_addr = scope['client'][0] if scope.get('client') else None
+        self.query = urllib.parse.parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        self.headers = scope.get('headers', [])
+        self.receive = receive
+
+    def header(self, name):
+        name = name.lower().encode('latin-1')
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value.decode('latin-1')
+        return None
+
+    def client(self):
+        """Admission key, the same address request.remote_addr gives behind ProxyFix."""
+        return client_address(self.remote_addr, self.header('x-forwarded-for')) or 'unknown'
+
+    def accept_encodings(self):
+        return parse_accept_header(self.header('accept-encoding'))
+
+    def accept_mimetypes(self):
+        return parse_accept_header(self.header('accept'), MIMEAccept)
+
+    def arg(self, name, default=None, type=None):
+        """Query argument with Flask's request.args.get semantics (bad conversions give the default)."""
+        values = self.query.get(name)
+        if not values:
+            return default
+        if type is None:
+            return values[0]
+        try:
+            return type(values[0])
+        except ValueError:
+            return default
+
+    async def body(self):
+        chunks = []
+        while True:
+            message = await self.receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that runs each request on a thread of executor instead of asgiref's single
+    thread_sensitive thread, so Flask routes are served concurrently."""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiInstance(self.wsgi_application, self.executor, self.duplicate_header_limit)(
+            scope, receive, send)
+
+
+class PooledWsgiInstance(WsgiToAsgiInstance):
+    def __init__(self, wsgi_application, executor, duplicate_header_limit=100):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        run = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func  # The undecorated method
+        await sync_to_async(run, thread_sensitive=False, executor=self.executor)(self, body)
+
+
+class AsyncApp:
+    def __init__(self, flask_app=None):
+        self.flask_app = flask_app or Repository.create_app()
+        self.wsgi_threads = ThreadPoolExecutor(WSGI_WORKERS, thread_name_prefix='asgi-wsgi')
+        self.wsgi = PooledWsgiToAsgi(self.flask_app, self.wsgi_threads)
+        self.cpu = ThreadPoolExecutor(CPU_WORKERS, thread_name_prefix='asgi-cpu')
+        self.io = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix='asgi-io')
+        # Requests waiting for an admission slot; separate so they cannot hold up SMTP sends
+        self.admission = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix='asgi-admission')
+        self.pool = None
+        self.pool_lock = None
+        self.detail_loads = {}  # song_id -> task loading it, shared by concurrent misses
+        self.routes = [
+            # method, path, handler, admission class (as on the Flask route)
+            ('GET', re.compile(r'/getAllSongs'), self.get_all_songs, 'expensive'),
+            ('GET', re.compile(r'/api/searchSongs/(?P<query>[^/]+)'), self.search_songs, 'expensive'),
+            ('GET', re.compile(r'/getSongById/(?P<track_id>\d+)'), self.get_song_by_id, 'read'),
+            ('GET', re.compile(r'/api/getSongDetails/(?P<song_id>\d+)'), self.get_song_details, 'read'),
+            ('GET', re.compile(r'/api/songs/(?P<song_id>\d+)/comments'), self.get_song_comments, 'read'),
+            ('POST', re.compile(r'/registerUser'), self.register_user, 'write'),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http':
+            for method, pattern, handler, class_name in self.routes:
+                match = pattern.fullmatch(scope['path'])
+                if match and scope['method'] == method:
+                    params = match.groupdict()  # scope['path'] is already percent-decoded
+                    request = Request(scope, receive)
+                    try:
+                        slot = await self.admit(class_name, request.client())
+                    except Rejected as r:
+                        status, body = await self.json({"error": r.reason}, r.status)
+                        return await self.send(send, status, body, headers=[('Retry-After', str(r.retry_after))])
+                    try:
+                        response = await handler(request, **params)
+                    finally:
+                        Repository.admission.release(slot)
+                    if response is not None:
+                        return await self.send(send, *response)
+                    break
+        # Everything else (and native routes that cannot serve this request, which are then
+        # admitted a second time by the Flask app) runs in Flask
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await asyncio.get_running_loop().run_in_executor(self.io, Repository.preload)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.pool is not None:
+                    self.pool.close()
+                    await self.pool.wait_closed()
+                self.cpu.shutdown(wait=False)
+                self.io.shutdown(wait=False)
+                self.admission.shutdown(wait=False)
+                self.wsgi_threads.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def send(send, status, body, content_type='application/json', headers=()):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', content_type.encode('latin-1')),
+                                (b'content-length', str(len(body)).encode('latin-1')),
+                                *((name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers)]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    # ---- helpers ----
+
+    async def get_pool(self):
+        """The aiomysql pool, created on first use from MYSQL_PUBLIC_URL like get_db_connection()."""
+        if self.pool is None:
+            if self.pool_lock is None:
+                self.pool_lock = asyncio.Lock()
+            async with self.pool_lock:
+                if self.pool is None:
+                    url = os.getenv('MYSQL_PUBLIC_URL')
+                    if not url:
+                        raise ValueError("MYSQL_PUBLIC_URL environment variable is not set")
+                    parsed = urllib.parse.urlparse(url)
+                    self.pool = await aiomysql.create_pool(
+                        host=parsed.hostname, port=parsed.port or 3306, user=parsed.username,
+                        password=parsed.password, db=parsed.path[1:] if parsed.path else 'railway',
+                        autocommit=True, connect_timeout=30, minsize=1, maxsize=ASYNC_DB_POOL_SIZE)
+        return self.pool
+
+    async def admit(self, class_name, client):
+        # Waiting for a slot blocks on a condition variable, so it happens off the loop
+        return await asyncio.get_running_loop().run_in_executor(
+            self.admission, Repository.admission.admit, class_name, client)
+
+    async def json(self, data, status=200):
+        """(status, body) encoded exactly as jsonify() would, off the loop for large payloads."""
+        def encode():
+            return self.flask_app.json.response(data).get_data()
+        if isinstance(data, (list, dict)) and len(data) > LARGE_JSON_ITEMS:
+            body = await asyncio.get_running_loop().run_in_executor(self.cpu, encode)
+        else:
+            body = encode()
+        return status, body
+
+    async def catalog_ready(self):
+        # ready() may poll MySQL for catalog changes, so it runs off the loop
+        return await asyncio.get_running_loop().run_in_executor(
+            self.io, Repository.song_catalog.ready, Repository.get_db_connection)
+
+    # ---- native routes ----
+
+    async def get_all_songs(self, request):
+        # The compact wire format (see wire_format.py) is served by the Flask route
+        if negotiate_wire_format(request.accept_mimetypes()) or not await self.catalog_ready():
+            return None
+        loop = asyncio.get_running_loop()
+        dumps = getattr(self.flask_app.json, 'dumps_bytes', self.flask_app.json.dumps)
+        version, body = await loop.run_in_executor(self.cpu, Repository.song_catalog.all_songs_json, dumps)
+        body = body.encode('utf-8') if isinstance(body, str) else body
+        # Same negotiation and per-version compressed body cache as the Flask app
+        encoding = negotiate(request.accept_encodings())
+        if encoding is None:
+            return 200, body, 'application/json', [('Vary', 'Accept, Accept-Encoding')]
+        body = await loop.run_in_executor(
+            self.cpu, Repository.response_compressor.compressed, body, encoding, ('getAllSongs', version))
+        return 200, body, 'application/json', [('Vary', 'Accept, Accept-Encoding'), ('Content-Encoding', encoding)]
+
+    async def search_songs(self, request, query):
+        if not query or query.strip() == '':
+            return await self.json([])
+        search_term = query.strip()
+        if len(search_term) < 2:
+            return await self.json({"error": "Search query must be at least 2 characters long"}, 400)
+        if negotiate_wire_format(request.accept_mimetypes()):
+            return None
+        # Same cache and lookup as the Flask route; find_songs may query MySQL, so off the loop
+        try:
+            songs = await asyncio.get_running_loop().run_in_executor(
+                self.io, Repository.search_cache.get_or_load, search_term.lower(),
+                lambda: Repository.find_songs(search_term))
+        except Exception as e:
+            print("Error searching songs:", e)
+            return await self.json({"error": "Failed to search songs"}, 500)
+        return await self.json(songs)
+
+    async def get_song_by_id(self, request, track_id):
+        if not await self.catalog_ready():
+            return None
+        song = Repository.song_catalog.get(int(track_id))
+        if not song:
+            return await self.json({"error": "Song not found"}, 404)
+        return await self.json(song.to_dict(DETAIL_COLUMNS))
+
+    async def get_song_details(self, request, song_id):
+        song_id = int(song_id)
+        try:
+            response_data = await self.cached_song_details(song_id)
+            if not response_data:
+                return await self.json({"error": "Song not found"}, 404)
+            return await self.json(response_data)
+        except Exception as e:
+            print("Error fetching song details:", e)
+            return await self.json({"error": "Failed to fetch song details"}, 500)
+
+    async def cached_song_details(self, song_id):
+        """song_details_cache entry for song_id; a stale entry is served while a task reloads it."""
+        details, fresh = Repository.song_details_cache.lookup(song_id)
+        if details is None:
+            return await self.song_details_load(song_id)
+        if not fresh:
+            self.song_details_load(song_id)
+        return details
+
+    def song_details_load(self, song_id):
+        """The task loading song_id into song_details_cache, started unless one is running."""
+        task = self.detail_loads.get(song_id)
+        if task is None:
+            task = self.detail_loads[song_id] = asyncio.ensure_future(self.fill_song_details(song_id))
+            task.add_done_callback(lambda done: self.song_details_loaded(song_id, done))
+        return task
+
+    def song_details_loaded(self, song_id, task):
+        if self.detail_loads.get(song_id) is task:
+            del self.detail_loads[song_id]
+        if not task.cancelled() and task.exception() is not None:
+            with Repository.song_details_cache.lock:
+                Repository.song_details_cache.load_errors += 1
+
+    async def fill_song_details(self, song_id):
+        cache = Repository.song_details_cache
+        # A write endpoint invalidating the entry mid-load bumps the generation; the result is then not kept
+        generation = cache.generation
+        details = await self.load_song_details(song_id)
+        cache.put_if_unchanged(song_id, details, generation)
+        return details
+
+    async def load_song_details(self, song_id):
+        pool = await self.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                try:
+                    await cursor.callproc('get_song_details', (song_id,))
+                except aiomysql.Error as e:
+                    if e.args[0] != 1305:  # ER_SP_DOES_NOT_EXIST
+                        raise
+                    await cursor.execute(Repository.SONG_DETAILS_PROCEDURE)
+                    await cursor.callproc('get_song_details', (song_id,))
+                song_rows = list(await cursor.fetchall())
+                await cursor.nextset()
+                comment_rows = list(await cursor.fetchall())
+                while await cursor.nextset():
+                    pass
+        return Repository.song_details_response(song_rows, comment_rows)
+
+    async def get_song_comments(self, request, song_id):
+        song_id = int(song_id)
+        try:
+            limit = min(max(request.arg('limit', Repository.COMMENTS_PAGE_SIZE, type=int), 1),
+                        Repository.COMMENTS_MAX_PAGE_SIZE)
+            after = request.arg('cursor')
+            after = Repository.decode_comment_cursor(after) if after else None
+        except ValueError as ve:
+            return await self.json({"error": str(ve)}, 400)
+        try:
+            pool = await self.get_pool()
+            async with pool.acquire() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(*Repository.comment_page_query(song_id, limit, after))
+                    rows = list(await cursor.fetchall())
+                    usernames, ratings = {}, {}
+                    if rows:
+                        users_query, ratings_query = Repository.comment_lookup_queries(song_id, rows[:limit])
+                        await cursor.execute(*users_query)
+                        usernames = {row['id']: row['username'] for row in await cursor.fetchall()}
+                        await cursor.execute(*ratings_query)
+                        ratings = {row['user_id']: row['rating'] for row in await cursor.fetchall()}
+            comments, next_cursor = Repository.comment_page_response(rows, usernames, ratings, limit) if rows else ([], None)
+            return await self.json({"comments": comments, "next_cursor": next_cursor})
+        except Exception as e:
+            print("Error fetching song comments:", e)
+            return await self.json({"error": "Failed to fetch comments"}, 500)
+
+    async def register_user(self, request):
+        data = self.flask_app.json.loads(await request.body() or b'{}')
+        email = data.get('email')
+        username = data.get('username')
+        password = data.get('password')
+        verification_token = Repository.generate_verification_token()
+        token_expires = datetime.datetime.utcnow() + datetime.timedelta(minutes=10)
+        loop = asyncio.get_running_loop()
+        try:
+            pool = await self.get_pool()
+            async with pool.acquire() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute("SELECT email FROM users WHERE email = %s", (email,))
+                    if await cursor.fetchone():
+                        return await self.json({"error": "Email already exists"}, 400)
+
+                    hashed_password = await loop.run_in_executor(
+                        self.cpu, bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt())
+                    await cursor.execute("""
+                        INSERT INTO users (email, username, password, two_factor_token, two_factor_expires, email_verified)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """, (email, username, hashed_password, verification_token, token_expires, False))
+
+            await loop.run_in_executor(self.io, self.send_verification_email, email, verification_token)
+            return await self.json({"message": "User registered successfully. Please check your email for verification."}, 201)
+        except Exception as e:
+            print(f"Database error in register_user: {e}")
+            return await self.json({"error": str(e)}, 500)
+
+    def send_verification_email(self, email, code):
+        with self.flask_app.app_context():
+            return Repository.send_verification_email(email, code)
+
+
+app = AsyncApp()
+
+if __name__ == '__main__':
+    import uvicorn
+    workers = int(os.getenv('ASGI_WORKERS', 1))
+    uvicorn.run('asgi:app', host=os.getenv('HOST', '0.0.0.0'), port=int(os.getenv('PORT', 5000)),
+                workers=workers, lifespan='on', log_level='warning')
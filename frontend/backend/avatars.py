@@ -0,0 +1,158 @@
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are skipped without Pillow; the original image is served instead
+    Image = None
+
+# Avatars are stored once on disk by content hash; users.avatar only keeps the file name
+AVATAR_DIR = os.getenv('AVATAR_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', 'avatars'))
+THUMBNAIL_SIZES = (64, 256)
+MAX_AVATAR_BYTES = 5 * 1024 * 1024
+AVATAR_URL_PREFIX = '/avatars/'
+
+DATA_URL_RE = re.compile(r'^data:image/(?P<type>[a-zA-Z0-9.+-]+);base64,(?P<data>.*)$', re.DOTALL)
+REFERENCE_RE = re.compile(r'^[0-9a-f]{40}\.(jpg|png|gif|webp)$')
+EXTENSIONS = {'jpeg': 'jpg', 'jpg': 'jpg', 'png': 'png', 'gif': 'gif', 'webp': 'webp'}
+
+
+class AvatarError(ValueError):
+    pass
+
+
+def is_reference(value):
+    return bool(value) and bool(REFERENCE_RE.match(value))
+
+
+def store_avatar(value):
+    """Decode an uploaded avatar and store it by content hash; return the short reference for users.avatar.
+
+    Accepts a data URL, an existing reference or an /avatars/ URL. Empty values clear the avatar.
+    """
+    if not value:
+        return None
+    if value.startswith(AVATAR_URL_PREFIX):
+        value = value[len(AVATAR_URL_PREFIX):]
+    if is_reference(value):
+        return value
+
+    match = DATA_URL_RE.match(value)
+    if not match:
+        raise AvatarError("Avatar must be a base64 image data URL")
+    ext = EXTENSIONS.get(match.group('type').lower())
+    if not ext:
+        raise AvatarError(f"Unsupported avatar type: {match.group('type')}")
+    try:
+        raw = base64.b64decode(match.group('data'), validate=False)
+    except (binascii.Error, ValueError):
+        raise AvatarError("Avatar is not valid base64")
+    if len(raw) > MAX_AVATAR_BYTES:
+        raise AvatarError("Avatar is too large")
+
+    digest = hashlib.sha1(raw).hexdigest()
+    reference = f"{digest}.{ext}"
+    path = os.path.join(AVATAR_DIR, reference)
+    if not os.path.exists(path):
+        os.makedirs(AVATAR_DIR, exist_ok=True)
+        _write_atomic(path, raw)
+        _write_thumbnails(digest, raw)
+    return reference
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _write_thumbnails(digest, raw):
+    if Image is None:
+        return
+    try:
+        image = Image.open(io.BytesIO(raw))
+        image = image.convert('RGB')
+        # Center-crop to a square so every thumbnail has the same fixed size
+        side = min(image.size)
+        left = (image.width - side) // 2
+        top = (image.height - side) // 2
+        image = image.crop((left, top, left + side, top + side))
+        for size in THUMBNAIL_SIZES:
+            thumb = image.resize((size, size), Image.LANCZOS)
+            buf = io.BytesIO()
+            thumb.save(buf, 'JPEG', quality=85, optimize=True)
+            _write_atomic(thumbnail_path(digest, size), buf.getvalue())
+    except Exception as e:
+        print(f"Failed to create avatar thumbnails for {digest}: {e}")
+
+
+def thumbnail_path(digest, size):
+    return os.path.join(AVATAR_DIR, f"{digest}_{size}.jpg")
+
+
+def avatar_urls(reference):
+    """Public URLs for a stored avatar: the original plus one entry per thumbnail size."""
+    if not is_reference(reference):
+        return {"avatar": None, "avatar_thumbnails": {}}
+    digest = reference.split('.')[0]
+    thumbnails = {}
+    for size in THUMBNAIL_SIZES:
+        if os.path.exists(thumbnail_path(digest, size)):
+            thumbnails[str(size)] = f"{AVATAR_URL_PREFIX}{digest}_{size}.jpg"
+        else:
+            thumbnails[str(size)] = f"{AVATAR_URL_PREFIX}{reference}"
+    return {"avatar": f"{AVATAR_URL_PREFIX}{reference}", "avatar_thumbnails": thumbnails}
+
+
+def migrate_inline_avatars(conn, batch_size=100):
+    """Move legacy base64 avatars out of users.avatar into the avatar store.
+
+    Returns (number migrated, ids of users whose avatar could not be decoded). Those rows are
+    left untouched so nothing is lost; fix or clear them by hand.
+    """
+    cursor = conn.cursor()
+    migrated = 0
+    skipped = []
+    last_id = 0
+    try:
+        while True:
+            cursor.execute("""
+                SELECT id, avatar FROM users
+                WHERE id > %s AND avatar LIKE 'data:%%'
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for user_id, avatar in rows:
+                last_id = user_id
+                try:
+                    reference = store_avatar(avatar)
+                except AvatarError as e:
+                    print(f"Skipping avatar of user {user_id}: {e}")
+                    skipped.append(user_id)
+                    continue
+                cursor.execute("UPDATE users SET avatar = %s WHERE id = %s", (reference, user_id))
+                migrated += 1
+            conn.commit()
+    finally:
+        cursor.close()
+    return migrated, skipped
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from db_connection import get_db_connection
+    load_dotenv()
+    connection = get_db_connection()
+    migrated, skipped = migrate_inline_avatars(connection)
+    print(f"Migrated {migrated} avatars")
+    if skipped:
+        print(f"Left {len(skipped)} undecodable avatars in place, user ids: {', '.join(map(str, skipped))}")
+    connection.close()
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class Flight:
+    """One in-progress load that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.keep = True  # Cleared when the key is invalidated mid-load
+
+    def result(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class LRUCache:
+    """Thread-safe bounded LRU with an optional TTL.
+
+    Entries are per process, so with several workers a TTL bounds how long one worker can
+    serve data another worker has already changed.
+
+    get_or_load() adds single-flight loading: concurrent misses on one key share a single
+    loader call. With stale_seconds, an entry past its TTL is still served for that long
+    while one background thread reloads it (stale-while-revalidate); get() never returns
+    stale entries.
+    """
+
+    def __init__(self, max_entries, ttl_seconds=None, stale_seconds=0):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.stale = stale_seconds if ttl_seconds else 0
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.load_errors = 0
+        self.generation = 0  # Bumped by every write (update/invalidate/clear)
+        self.written_at = 0  # time.time() of the last write
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (self.ttl and entry[1] < time.monotonic()):
+                if entry is not None and entry[1] + self.stale < time.monotonic():
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def lookup(self, key):
+        """(value, fresh) for key, or (None, False) on a miss.
+
+        Unlike get(), an expired entry still within stale_seconds is returned with fresh=False,
+        for callers that reload it themselves (the asyncio routes, which cannot block on a Flight).
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if not self.ttl or entry[1] >= now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0], True
+                if entry[1] + self.stale >= now:
+                    self.stale_hits += 1
+                    return entry[0], False
+                del self.entries[key]
+            self.misses += 1
+            return None, False
+
+    def put_if_unchanged(self, key, value, generation):
+        """Store a value loaded since generation was read, unless a write happened meanwhile."""
+        with self.lock:
+            if value is not None and self.generation == generation:
+                self._store(key, value)
+
+    def get_or_load(self, key, loader):
+        """Cached value for key, calling loader() at most once at a time per key on a miss.
+
+        Callers arriving while a load is running wait for its result (or its exception).
+        None results are returned but not cached.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if not self.ttl or entry[1] >= now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                if entry[1] + self.stale >= now:
+                    self.stale_hits += 1
+                    if key not in self.in_flight:
+                        flight = self.in_flight[key] = Flight()
+                        threading.Thread(target=self._load, args=(key, loader, flight), daemon=True).start()
+                    return entry[0]
+                del self.entries[key]
+            flight = self.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[key] = Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            self._load(key, loader, flight)
+        return flight.result()
+
+    def _load(self, key, loader, flight):
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+        with self.lock:
+            if self.in_flight.get(key) is flight:
+                del self.in_flight[key]
+            if flight.error is not None:
+                self.load_errors += 1
+            elif flight.keep and flight.value is not None:
+                self._store(key, flight.value)
+        flight.done.set()
+
+    def put(self, key, value):
+        with self.lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        self.entries[key] = (value, expires)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def update(self, key, fn):
+        """Apply fn to the cached value in place (write-through); no-op when key is not cached."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries[key] = (fn(entry[0]), entry[1])
+            self._written()
+            self._drop_flight(key)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+            self._written()
+            self._drop_flight(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self._written()
+            for flight in self.in_flight.values():
+                flight.keep = False
+            self.in_flight.clear()
+
+    def _written(self):
+        self.generation += 1
+        self.written_at = time.time()
+
+    def _drop_flight(self, key):
+        # A load that started before this write must not overwrite it when it finishes
+        flight = self.in_flight.pop(key, None)
+        if flight is not None:
+            flight.keep = False
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "stale_hits": self.stale_hits, "coalesced": self.coalesced,
+                    "in_flight": len(self.in_flight), "load_errors": self.load_errors}
@@ -0,0 +1,450 @@
+import heapq
+import json
+import mmap
+import os
+import shutil
+import sys
+import threading
+import time
+from song_deletion import live_songs
+
+try:
+    import numpy as np
+except ImportError:  # Catalog reads go to MySQL without NumPy
+    np = None
+
+# Compact in-memory song catalog serving getAllSongs, searchSongs and getSongById.
+#
+# Every string column is stored as int32 codes into one interned string pool (a UTF-8 blob
+# plus offsets), so repeated artists, albums, genres and image URLs are kept once. Search
+# runs bytes.find over one lowercase "name\0artist\0album\n" line per row. The
+# columns are saved as .npy files behind an atomically swapped `current` symlink, like the
+# recommendation builds; new workers memory-map the newest snapshot instead of querying
+# MySQL, and all workers share its pages.
+#
+# Changes are tracked in an overlay (track_id -> SongRecord, or None when deleted) that is
+# fed by this process's admin edits and, every POLL_SECONDS, by rows whose songs.updated_at
+# or song_deletions.deleted_at moved. The overlay is folded into a new snapshot once it
+# holds COMPACT_FRACTION of the catalog.
+#
+#   python catalog.py              build a snapshot from MySQL
+#   python catalog.py --benchmark  compare memory with dict rows for 100k songs
+CATALOG_DIR = os.getenv('CATALOG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'catalog'))
+POLL_SECONDS = float(os.getenv('CATALOG_POLL_SECONDS', 5))
+COMPACT_FRACTION = 0.05
+COMMIT_LAG_SECONDS = 5
+STRING_COLUMNS = ('track_name', 'artist_name', 'album_name', 'album_image', 'genres', 'audio_url')
+COLUMNS = ('track_id',) + STRING_COLUMNS + ('rating',)
+LIST_COLUMNS = ('track_id', 'track_name', 'artist_name', 'album_name', 'album_image', 'genres', 'rating')
+DETAIL_COLUMNS = ('track_id', 'track_name', 'artist_name', 'album_name', 'album_image', 'rating', 'audio_url')
+SEARCH_COLUMNS = ('track_id', 'track_name', 'artist_name', 'album_name', 'album_image', 'genres')
+SEARCH_LIMIT = 50
+NO_RATING = -1
+SELECT_SONGS = f"SELECT {', '.join(COLUMNS)} FROM songs"
+SELECT_LIVE_SONGS = f"{SELECT_SONGS} WHERE {live_songs()}"  # Tombstoned songs are pending deletion
+
+
+class SongRecord:
+    """One song held outside the columns (overlay entries)."""
+    __slots__ = COLUMNS
+
+    def __init__(self, *values):
+        for name, value in zip(COLUMNS, values):
+            setattr(self, name, value)
+
+    def to_dict(self, columns=COLUMNS):
+        return {name: getattr(self, name) for name in columns}
+
+
+def _string_property(index):
+    return property(lambda self: self._columns.string(int(self._columns.codes[self._row, index])))
+
+
+class SongView:
+    """Lazy view of one row of the columns; strings are decoded on access."""
+    __slots__ = ('_columns', '_row')
+
+    def __init__(self, columns, row):
+        self._columns = columns
+        self._row = row
+
+    @property
+    def track_id(self):
+        return int(self._columns.track_ids[self._row])
+
+    @property
+    def rating(self):
+        rating = int(self._columns.ratings[self._row])
+        return None if rating == NO_RATING else rating
+
+    to_dict = SongRecord.to_dict
+
+
+for _index, _name in enumerate(STRING_COLUMNS):
+    setattr(SongView, _name, _string_property(_index))
+
+
+ARRAYS = ('track_ids', 'codes', 'ratings', 'offsets', 'blob', 'name_order', 'search_starts')
+
+
+class CatalogColumns:
+    """Immutable column arrays: track_ids (sorted), string codes (n x 6), ratings, pool, name order, search text."""
+
+    def __init__(self, track_ids, codes, ratings, offsets, blob, name_order, search_starts, search_text, as_of):
+        self.track_ids = track_ids
+        self.codes = codes
+        self.ratings = ratings
+        self.offsets = offsets
+        self.blob = blob
+        self.data = memoryview(blob)
+        self.name_order = name_order
+        self.search_starts = search_starts
+        self.search_text = search_text
+        self.as_of = as_of
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def string(self, code):
+        return str(self.data[self.offsets[code]:self.offsets[code + 1]], 'utf-8')
+
+    def row(self, track_id):
+        i = int(np.searchsorted(self.track_ids, track_id))
+        if i < len(self.track_ids) and self.track_ids[i] == track_id:
+            return i
+        return None
+
+    @classmethod
+    def build(cls, songs, as_of):
+        """Columns from an iterable of (track_id, *STRING_COLUMNS, rating) tuples."""
+        songs = sorted(songs, key=lambda song: song[0])
+        pool, parts, offsets = {}, [], [0]
+
+        def intern(value):
+            value = value or ''
+            code = pool.get(value)
+            if code is None:
+                code = pool[value] = len(parts)
+                encoded = value.encode('utf-8')
+                parts.append(encoded)
+                offsets.append(offsets[-1] + len(encoded))
+            return code
+
+        n = len(songs)
+        track_ids = np.fromiter((song[0] for song in songs), dtype=np.int64, count=n)
+        codes = np.array([[intern(value) for value in song[1:7]] for song in songs], dtype=np.int32).reshape(n, 6)
+        ratings = np.fromiter((NO_RATING if song[7] is None else song[7] for song in songs), dtype=np.int8, count=n)
+        name_order = np.array(sorted(range(n), key=lambda i: (songs[i][1] or '').lower()), dtype=np.int32)
+        blob = np.frombuffer(b''.join(parts), dtype=np.uint8)
+        lines = [f"{song[1] or ''}\0{song[2] or ''}\0{song[3] or ''}\n".lower().encode('utf-8') for song in songs]
+        search_starts = np.zeros(n, dtype=np.int64)
+        if n:
+            search_starts[1:] = np.cumsum([len(line) for line in lines])[:-1]
+        return cls(track_ids, codes, ratings, np.asarray(offsets, dtype=np.int64), blob, name_order,
+                   search_starts, b''.join(lines), as_of)
+
+    def save(self, directory):
+        """Write a snapshot directory and atomically point `current` at it (see remove_old_builds)."""
+        os.makedirs(directory, exist_ok=True)
+        build_dir = os.path.join(directory, f"build-{int(time.time() * 1000)}-{os.getpid()}")
+        os.makedirs(build_dir)
+        for name in ARRAYS:
+            np.save(os.path.join(build_dir, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(build_dir, 'search.txt'), 'wb') as f:
+            f.write(self.search_text)
+        with open(os.path.join(build_dir, 'meta.json'), 'w') as f:
+            json.dump({"as_of": self.as_of}, f)
+
+        link = os.path.join(directory, 'current')
+        tmp_link = f"{link}.{os.getpid()}.tmp"
+        os.symlink(os.path.basename(build_dir), tmp_link)
+        os.replace(tmp_link, link)
+        return build_dir
+
+    @staticmethod
+    def remove_old_builds(directory, keep=2):
+        """Delete all but the newest keep snapshots; the previous one stays for workers that still have it mapped.
+
+        Workers compacting at the same time may delete the same directories, so errors are ignored.
+        """
+        builds = sorted(d for d in os.listdir(directory) if d.startswith('build-'))
+        for old in builds[:-keep]:
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+    @classmethod
+    def open(cls, directory):
+        """Memory-map the current snapshot, or return None when there is none."""
+        try:
+            build_dir = os.path.join(directory, os.readlink(os.path.join(directory, 'current')))
+            with open(os.path.join(build_dir, 'meta.json')) as f:
+                meta = json.load(f)
+            arrays = [np.load(os.path.join(build_dir, f'{name}.npy'), mmap_mode='r') for name in ARRAYS]
+            with open(os.path.join(build_dir, 'search.txt'), 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                search_text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        except (OSError, ValueError):
+            return None
+        return cls(*arrays, search_text, meta["as_of"])
+
+
+class SongCatalog:
+    def __init__(self, directory=CATALOG_DIR, poll_seconds=POLL_SECONDS):
+        self.directory = directory
+        self.poll_seconds = poll_seconds
+        self.lock = threading.Lock()       # guards columns/overlay swaps
+        self.poll_lock = threading.Lock()  # one poller at a time; others keep serving
+        self.columns = None
+        self.overlay = {}
+        self.watermark = 0
+        self.polled_at = 0
+        self.version = 0
+        self.all_songs_bodies = {}         # encoding name -> (version, serialized getAllSongs body)
+
+    @property
+    def available(self):
+        return np is not None
+
+    def ready(self, conn_factory):
+        """Load (or memory-map) the catalog and apply pending changes; False to fall back to MySQL."""
+        if np is None:
+            return False
+        if time.time() - self.polled_at < self.poll_seconds and self.columns is not None:
+            return True
+        if not self.poll_lock.acquire(blocking=self.columns is None):
+            return True
+        try:
+            if self.columns is None or time.time() - self.polled_at >= self.poll_seconds:
+                conn = conn_factory()
+                try:
+                    if self.columns is None:
+                        self._load(conn)
+                    self._poll(conn)
+                finally:
+                    conn.close()
+                self.polled_at = time.time()
+        except Exception as e:
+            print("Error refreshing song catalog:", e)
+            self.polled_at = time.time()
+        finally:
+            self.poll_lock.release()
+        return self.columns is not None
+
+    def _load(self, conn):
+        columns = CatalogColumns.open(self.directory)
+        if columns is None:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT UNIX_TIMESTAMP()")
+                as_of = float(cursor.fetchone()[0])
+                cursor.execute(SELECT_LIVE_SONGS)
+                columns = CatalogColumns.build(cursor.fetchall(), as_of)
+            finally:
+                cursor.close()
+            columns.save(self.directory)
+        with self.lock:
+            self.columns = columns
+            self.watermark = columns.as_of
+            self.version += 1
+        CatalogColumns.remove_old_builds(self.directory)
+
+    def _poll(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT UNIX_TIMESTAMP()")
+            now = float(cursor.fetchone()[0])
+            since = self.watermark - COMMIT_LAG_SECONDS
+            cursor.execute(SELECT_LIVE_SONGS + " AND updated_at >= FROM_UNIXTIME(%s)", (since,))
+            changed = cursor.fetchall()
+            cursor.execute("SELECT track_id FROM song_deletions WHERE deleted_at >= FROM_UNIXTIME(%s)", (since,))
+            deleted = [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        self.apply(changed, deleted)
+        self.watermark = now
+        if len(self.overlay) > max(100, COMPACT_FRACTION * len(self.columns)):
+            self.compact()
+
+    def apply(self, changed=(), deleted=()):
+        """Record upserted rows (COLUMNS tuples) and deleted track ids in the overlay."""
+        if not changed and not deleted:
+            return
+        with self.lock:
+            if self.columns is None:
+                return
+            for song in changed:
+                self.overlay[song[0]] = SongRecord(*song)
+            for track_id in deleted:
+                self.overlay[track_id] = None
+            self.version += 1
+
+    def reload_tracks(self, cursor, track_ids):
+        """Re-read edited songs by primary key after a local admin write."""
+        if self.columns is None or not track_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(track_ids))
+        cursor.execute(SELECT_LIVE_SONGS + f" AND track_id IN ({placeholders})", list(track_ids))
+        self.apply([tuple(row[name] for name in COLUMNS) if isinstance(row, dict) else row
+                    for row in cursor.fetchall()])
+
+    def remove(self, track_id):
+        self.apply(deleted=[track_id])
+
+    def compact(self):
+        """Fold the overlay into new columns and publish them as the current snapshot."""
+        with self.lock:
+            columns, overlay, version = self.columns, dict(self.overlay), self.version
+        songs = [tuple(getattr(song, name) for name in COLUMNS) for song in self._iter_songs(columns, overlay)]
+        compacted = CatalogColumns.build(songs, self.watermark)
+        compacted.save(self.directory)
+        with self.lock:
+            # Keep entries that changed while we were building
+            self.overlay = {t: song for t, song in self.overlay.items() if overlay.get(t, ...) is not song}
+            self.columns = compacted
+            self.version += 1
+        CatalogColumns.remove_old_builds(self.directory)
+
+    @staticmethod
+    def _iter_songs(columns, overlay):
+        for row in range(len(columns)):
+            track_id = int(columns.track_ids[row])
+            if track_id not in overlay:
+                yield SongView(columns, row)
+        for song in overlay.values():
+            if song is not None:
+                yield song
+
+    def _snapshot(self):
+        with self.lock:
+            return self.columns, self.overlay.copy(), self.version
+
+    def get(self, track_id):
+        columns, overlay, _ = self._snapshot()
+        if track_id in overlay:
+            return overlay[track_id]
+        row = columns.row(track_id)
+        return SongView(columns, row) if row is not None else None
+
+    def get_many(self, track_ids):
+        return [song for song in (self.get(track_id) for track_id in track_ids) if song is not None]
+
+    def all_songs(self):
+        """Every song ordered by track name, as views/records."""
+        columns, overlay, _ = self._snapshot()
+        base = (SongView(columns, int(row)) for row in columns.name_order
+                if int(columns.track_ids[row]) not in overlay)
+        edited = sorted((song for song in overlay.values() if song is not None),
+                        key=lambda song: (song.track_name or '').lower())
+        return heapq.merge(base, edited, key=lambda song: (song.track_name or '').lower())
+
+    def all_songs_json(self, dumps):
+        """(version, serialized getAllSongs body), rebuilt only when the catalog changes."""
+        return self.all_songs_encoded('json', dumps)
+
+    def all_songs_encoded(self, name, encode):
+        """(version, encode(list of song dicts)) cached per encoding name and catalog version."""
+        cached = self.all_songs_bodies.get(name)
+        version = self.version
+        if cached is not None and cached[0] == version:
+            return cached
+        cached = self.all_songs_bodies[name] = (version, encode([song.to_dict(LIST_COLUMNS) for song in self.all_songs()]))
+        return cached
+
+    def search(self, term, limit=SEARCH_LIMIT):
+        """Same matching and order as the SQL search: substring of name/artist/album, exact matches first."""
+        term = term.lower()
+        if '\0' in term or '\n' in term:
+            return []
+        columns, overlay, _ = self._snapshot()
+        text, starts, needle = columns.search_text, columns.search_starts, term.encode('utf-8')
+        matches = []
+        position = text.find(needle)
+        while position != -1:
+            row = int(np.searchsorted(starts, position, side='right')) - 1
+            if int(columns.track_ids[row]) not in overlay:
+                matches.append(SongView(columns, row))
+            # Continue from the next row so each song is reported once
+            next_start = int(starts[row + 1]) if row + 1 < len(starts) else len(text)
+            position = text.find(needle, next_start)
+        for song in overlay.values():
+            if song is not None and any(term in (value or '').lower()
+                                        for value in (song.track_name, song.artist_name, song.album_name)):
+                matches.append(song)
+
+        def rank(song):
+            name = (song.track_name or '').lower()
+            if name == term:
+                return 1, name
+            if (song.artist_name or '').lower() == term:
+                return 2, name
+            return 6, name
+        return heapq.nsmallest(limit, matches, key=rank)
+
+
+def benchmark(n_songs=100_000):
+    """Memory of 100k songs as dict rows (the cursor's representation) vs. catalog columns."""
+    import tracemalloc
+    rng = np.random.default_rng(7)
+    artists = [f"Artist {i}" for i in range(n_songs // 10)]
+    genres = ['pop', 'rock', 'hip hop', 'jazz', 'electronic', 'indie', 'metal', 'folk']
+    songs = []
+    for i in range(n_songs):
+        artist = artists[int(rng.integers(len(artists)))]
+        album = f"{artist} album {int(rng.integers(3))}"
+        songs.append((i + 1, f"Track number {i} {rng.integers(1 << 30):x}", artist, album,
+                      f"https://i.scdn.co/image/{abs(hash(album)):x}", genres[int(rng.integers(len(genres)))],
+                      f"https://www.youtube.com/watch?v={rng.integers(1 << 60):x}", int(rng.integers(6))))
+
+    tracemalloc.start()
+    # Fresh string objects per row, as mysql.connector returns them
+    rows = [dict(zip(COLUMNS, [song[0]] + [''.join(value) for value in song[1:7]] + [song[7]])) for song in songs]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    del rows
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    columns = CatalogColumns.build(songs, time.time())
+    build_seconds = time.perf_counter() - started
+    column_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        columns.save(directory)
+        started = time.perf_counter()
+        catalog = SongCatalog(directory)
+        catalog.columns = CatalogColumns.open(directory)
+        open_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        found = catalog.search('number 4242')
+        search_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        found = catalog.search('number 99')
+        warm_search_seconds = time.perf_counter() - started
+    print(f"{n_songs} songs: dict rows {dict_bytes / 1e6:.1f} MB, columns {column_bytes / 1e6:.1f} MB "
+          f"({column_bytes / dict_bytes:.0%})")
+    print(f"Build: {build_seconds:.2f}s, memory-mapped open: {open_seconds * 1000:.1f}ms, "
+          f"first search: {search_seconds * 1000:.1f}ms, next search: {warm_search_seconds * 1000:.1f}ms "
+          f"({len(found)} results)")
+
+
+if __name__ == '__main__':
+    if np is None:
+        print("NumPy is required for the song catalog")
+        sys.exit(1)
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        from dotenv import load_dotenv
+        from db_connection import get_db_connection
+        load_dotenv()
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        cursor.execute("SELECT UNIX_TIMESTAMP()")
+        as_of = float(cursor.fetchone()[0])
+        cursor.execute(SELECT_LIVE_SONGS)
+        columns = CatalogColumns.build(cursor.fetchall(), as_of)
+        cursor.close()
+        connection.close()
+        print(f"Published {len(columns)} songs to {columns.save(CATALOG_DIR)}")
+        CatalogColumns.remove_old_builds(CATALOG_DIR)
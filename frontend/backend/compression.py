@@ -0,0 +1,68 @@
+import gzip
+import os
+from caches import LRUCache
+
+try:
+    import brotli
+except ImportError:  # Only gzip is offered without the brotli package
+    brotli = None
+
+# Response compression negotiated from Accept-Encoding (br preferred, then gzip).
+#
+# Text responses of at least COMPRESS_MIN_BYTES are compressed per request at a fast level.
+# Responses the handler marks with a body key (for example the getAllSongs body for one
+# catalog version) are compressed once per key and encoding at a high level and the result
+# is kept, so repeated requests only copy bytes.
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+COMPRESSIBLE_TYPES = ('application/json', 'application/vnd.mpp.', 'text/', 'application/javascript', 'image/svg+xml')
+DYNAMIC_LEVELS = {'br': 4, 'gzip': 5}
+CACHED_LEVELS = {'br': 9, 'gzip': 9}
+
+
+def supported_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encodings):
+    """Best encoding from a werkzeug Accept object (request.accept_encodings), or None."""
+    best, best_quality = None, 0
+    for encoding in supported_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class ResponseCompressor:
+    def __init__(self, max_cached=None):
+        self.bodies = LRUCache(max_cached or int(os.getenv('COMPRESSED_BODY_CACHE_SIZE', 64)))
+
+    def compressed(self, body, encoding, body_key=None):
+        """body compressed with encoding; reused across requests when body_key is given."""
+        if body_key is None:
+            return compress(body, encoding, DYNAMIC_LEVELS[encoding])
+        return self.bodies.get_or_load((body_key, encoding),
+                                       lambda: compress(body, encoding, CACHED_LEVELS[encoding]))
+
+    def apply(self, response, accept_encodings, body_key=None):
+        """Compress a Flask response in place when the client and the content allow it."""
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+                or not 200 <= response.status_code < 300 or response.status_code in (204, 206)
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+        encoding = negotiate(accept_encodings)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(self.compressed(body, encoding, body_key))
+        response.headers['Content-Encoding'] = encoding
+        return response
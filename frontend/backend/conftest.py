@@ -0,0 +1,86 @@
+import copy
+import pytest
+
+# Shared fake MySQL connection for the unit tests. A test registers routes (an SQL fragment and
+# a function answering the query) and reads back every executed query with its parameters.
+
+
+class FakeCursor:
+    def __init__(self, db, dictionary=False):
+        self.db = db
+        self.dictionary = dictionary
+        self.rows = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, query, params=()):
+        """Answer from the first route whose fragment is in the query; the answer gets (query, params, cursor)."""
+        params = list(params)
+        self.db.executed.append((query, params))
+        self.rows = []
+        for fragment, answer in self.db.routes:
+            if fragment in query:
+                self.rows = list(answer(query, params, self) or ())
+                return
+        raise AssertionError(f"unexpected query: {query}")
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    """Connection factory and connection in one: pass db.connect wherever a conn_factory goes.
+
+    Attributes named in transactional are restored by rollback().
+    """
+
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.routes = []
+        self.executed = []     # (query, params) in execution order
+        self.transactional = ()
+        self.saved = None
+        self.down = False
+        self.connections = 0
+        self.route('UNIX_TIMESTAMP()', lambda *_: [(self.now,)])
+
+    def route(self, fragment, answer):
+        self.routes.append((fragment, answer))
+
+    def params(self, fragment):
+        """The parameters of every executed query containing fragment."""
+        return [params for query, params in self.executed if fragment in query]
+
+    def connect(self):
+        if self.down:
+            raise ConnectionError("database is down")
+        self.connections += 1
+        return self
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self, dictionary)
+
+    def start_transaction(self):
+        self.saved = copy.deepcopy({name: getattr(self, name) for name in self.transactional})
+
+    def commit(self):
+        self.saved = None
+
+    def rollback(self):
+        for name, value in self.saved.items():
+            setattr(self, name, value)
+        self.saved = None
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_db():
+    return FakeDatabase()
@@ -0,0 +1,197 @@
+import re
+import threading
+from collections import Counter
+
+try:
+    import numpy as np
+    import scipy.sparse as sp
+except ImportError:  # "More like this" is disabled without NumPy/SciPy
+    np = None
+    sp = None
+
+# Content-based "more like this" over catalog metadata, for songs that have no ratings yet.
+# Each song is a TF-IDF vector of tokens from its artist, album, genre and title; similarity
+# is the cosine between rows. New songs are appended with the current IDF weights and the
+# whole matrix is re-weighted once the catalog has grown by REWEIGHT_GROWTH.
+FIELD_WEIGHTS = {'artist': 3.0, 'genre': 2.0, 'album': 1.5, 'title': 1.0}
+REWEIGHT_GROWTH = 0.1
+TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+STOPWORDS = {'the', 'a', 'an', 'of', 'and', 'feat', 'ft', 'with', 'remix', 'version', 'edit', 'remastered'}
+
+
+def song_tokens(song):
+    """Weighted tokens for one song row (dict with track_name, artist_name, album_name, genres)."""
+    counts = Counter()
+    for artist in (song.get('artist_name') or '').split(','):
+        artist = artist.strip().lower()
+        if artist:
+            counts['artist:' + artist] += FIELD_WEIGHTS['artist']
+    for genre in (song.get('genres') or '').split(','):
+        genre = genre.strip().lower()
+        if genre:
+            counts['genre:' + genre] += FIELD_WEIGHTS['genre']
+    album = (song.get('album_name') or '').strip().lower()
+    if album:
+        counts['album:' + album] += FIELD_WEIGHTS['album']
+    for field, weight in (('track_name', FIELD_WEIGHTS['title']), ('album_name', FIELD_WEIGHTS['title'])):
+        for word in TOKEN_RE.findall((song.get(field) or '').lower()):
+            if word not in STOPWORDS and len(word) > 1:
+                counts['word:' + word] += weight
+    return counts
+
+
+class ContentIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.vocab = {}
+        self.df = []
+        self.rows = {}            # track_id -> row
+        self.track_ids = []       # row -> track_id (None once removed)
+        self.tf_rows = []         # row -> {term index: weight}, kept for re-weighting
+        self.matrix = None        # L2-normalized TF-IDF, CSR
+        self.pending = []         # rows appended since the matrix was last assembled
+        self.weighted_size = 0
+
+    @property
+    def available(self):
+        return np is not None
+
+    @property
+    def loaded(self):
+        return self.matrix is not None
+
+    def load(self, songs):
+        """Replace the index with the given song rows."""
+        with self.lock:
+            self.vocab, self.df, self.rows, self.track_ids, self.tf_rows = {}, [], {}, [], []
+            for song in songs:
+                self._append(song)
+            self._reweight()
+
+    def load_from_db(self, conn):
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT track_id, track_name, artist_name, album_name, genres FROM songs")
+            self.load(cursor.fetchall())
+        finally:
+            cursor.close()
+
+    def _append(self, song):
+        tf = {}
+        for term, weight in song_tokens(song).items():
+            index = self.vocab.get(term)
+            if index is None:
+                index = self.vocab[term] = len(self.df)
+                self.df.append(0)
+            self.df[index] += 1
+            tf[index] = weight
+        row = len(self.track_ids)
+        self.rows[song['track_id']] = row
+        self.track_ids.append(song['track_id'])
+        self.tf_rows.append(tf)
+        return row
+
+    def _remove_row(self, track_id):
+        row = self.rows.pop(track_id, None)
+        if row is None:
+            return
+        for index in self.tf_rows[row]:
+            self.df[index] -= 1
+        self.tf_rows[row] = {}
+        self.track_ids[row] = None
+
+    def _idf(self):
+        n = max(len(self.rows), 1)
+        df = np.asarray(self.df, dtype=np.float32)
+        return np.log((1 + n) / (1 + df)).astype(np.float32) + 1.0
+
+    def _vectors(self, rows, idf):
+        indptr, indices, data = [0], [], []
+        for row in rows:
+            tf = self.tf_rows[row]
+            indices.extend(tf.keys())
+            data.extend(tf.values())
+            indptr.append(len(indices))
+        matrix = sp.csr_matrix((np.asarray(data, np.float32), np.asarray(indices, np.int32), np.asarray(indptr, np.int64)),
+                               shape=(len(rows), len(self.df)))
+        matrix = matrix.multiply(idf).tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+        norms[norms == 0] = 1.0
+        return sp.csr_matrix(matrix.multiply(1.0 / norms[:, None]))
+
+    def _reweight(self):
+        self.idf = self._idf()
+        self.matrix = self._vectors(range(len(self.track_ids)), self.idf)
+        self.pending = []
+        self.weighted_size = len(self.rows)
+
+    def _assemble(self):
+        """Fold appended rows into the matrix, re-weighting everything after enough growth."""
+        if not self.pending:
+            return
+        if len(self.rows) > self.weighted_size * (1 + REWEIGHT_GROWTH):
+            self._reweight()
+            return
+        idf = self.idf
+        if len(idf) < len(self.df):  # Terms first seen since the last re-weight
+            n = max(len(self.rows), 1)
+            extra = np.asarray(self.df[len(idf):], dtype=np.float32)
+            idf = self.idf = np.concatenate([idf, np.log((1 + n) / (1 + extra)).astype(np.float32) + 1.0])
+        matrix = self.matrix
+        if matrix.shape[1] < len(self.df):
+            matrix = sp.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], len(self.df)))
+        new_rows = self._vectors(self.pending, idf)
+        self.matrix = sp.vstack([matrix, new_rows], format='csr')
+        self.pending = []
+
+    def upsert(self, songs):
+        """Add new songs or replace edited ones without rebuilding the index."""
+        with self.lock:
+            if self.matrix is None:
+                return
+            for song in songs:
+                old = self.rows.get(song['track_id'])
+                if old is not None:
+                    self._remove_row(song['track_id'])
+                    self.matrix = self._zero_row(self.matrix, old)
+                self.pending.append(self._append(song))
+            self._assemble()
+
+    def remove(self, track_id):
+        with self.lock:
+            row = self.rows.get(track_id)
+            if row is None or self.matrix is None:
+                return
+            self._remove_row(track_id)
+            self.matrix = self._zero_row(self.matrix, row)
+
+    @staticmethod
+    def _zero_row(matrix, row):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        matrix.data[start:end] = 0
+        return matrix
+
+    def similar(self, track_ids, k=10):
+        """Batched query: {track_id: [(track_id, score), ...]} for each known input track."""
+        with self.lock:
+            matrix, rows, ids = self.matrix, self.rows, self.track_ids
+        if matrix is None:
+            return {}
+        # Rows appended by a concurrent upsert may not be in this matrix yet
+        query_ids = [t for t in track_ids if rows.get(t, matrix.shape[0]) < matrix.shape[0]]
+        if not query_ids:
+            return {}
+        query_rows = [rows[t] for t in query_ids]
+        scores = (matrix[query_rows] @ matrix.T).toarray()
+        results = {}
+        for i, track_id in enumerate(query_ids):
+            row_scores = scores[i]
+            row_scores[query_rows[i]] = 0
+            count = min(k, np.count_nonzero(row_scores))
+            if count == 0:
+                results[track_id] = []
+                continue
+            top = np.argpartition(-row_scores, count - 1)[:count]
+            top = top[np.argsort(-row_scores[top], kind='stable')]
+            results[track_id] = [(ids[r], float(row_scores[r])) for r in top if ids[r] is not None]
+        return results
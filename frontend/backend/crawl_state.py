@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Crawl state for spotify_fetch.py, kept in a small SQLite file next to the script
+# so a crashed or interrupted run can pick up where it stopped.
+DEFAULT_STATE_PATH = os.getenv('CRAWL_STATE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'crawl_state.db'))
+
+
+class CrawlState:
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS artists (
+                artist_name TEXT PRIMARY KEY,
+                artist_id TEXT,
+                genre TEXT,
+                started_at REAL,
+                last_crawled REAL
+            );
+            CREATE TABLE IF NOT EXISTS albums (
+                album_id TEXT PRIMARY KEY,
+                artist_id TEXT NOT NULL,
+                album_name TEXT,
+                track_count INTEGER,
+                ingested_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_albums_artist ON albums(artist_id);
+        """)
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get_artist(self, artist_name):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT artist_id, genre, started_at, last_crawled FROM artists WHERE artist_name = ?",
+                (artist_name,)
+            ).fetchone()
+        if not row:
+            return None
+        return {"artist_id": row[0], "genre": row[1], "started_at": row[2], "last_crawled": row[3]}
+
+    def is_fresh(self, artist_name, max_age_seconds):
+        """True if the artist finished a full crawl less than max_age_seconds ago."""
+        artist = self.get_artist(artist_name)
+        if not artist or artist["last_crawled"] is None:
+            return False
+        # A run that started after the last completed crawl never finished
+        if artist["started_at"] and artist["started_at"] > artist["last_crawled"]:
+            return False
+        return time.time() - artist["last_crawled"] < max_age_seconds
+
+    def start_artist(self, artist_name, artist_id, genre):
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO artists (artist_name, artist_id, genre, started_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(artist_name) DO UPDATE SET
+                    artist_id = excluded.artist_id,
+                    genre = excluded.genre,
+                    started_at = excluded.started_at
+            """, (artist_name, artist_id, genre, time.time()))
+            self.conn.commit()
+
+    def finish_artist(self, artist_name):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE artists SET last_crawled = ? WHERE artist_name = ?",
+                (time.time(), artist_name)
+            )
+            self.conn.commit()
+
+    def seen_albums(self, artist_id):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT album_id FROM albums WHERE artist_id = ?", (artist_id,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_album(self, album_id, artist_id, album_name, track_count):
+        # Only called once every track of the album is stored, so a crash mid-album
+        # re-processes that album (track_exists keeps the inserts idempotent).
+        with self.lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO albums (album_id, artist_id, album_name, track_count, ingested_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (album_id, artist_id, album_name, track_count, time.time()))
+            self.conn.commit()
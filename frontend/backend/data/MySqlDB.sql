@@ -1,3 +1,7 @@
+-- Historical setup script, kept for reference. The schema is now owned by the versioned
+-- migrations in ../migrations (python migrate.py); add schema changes there, not here.
+-- Running migrate.py over a database built from this file adopts it.
+
 CREATE DATABASE IF NOT EXISTS MusicLibrary;
 
 USE MusicLibrary;
@@ -102,4 +106,117 @@ ALTER TABLE songs ADD INDEX idx_genre_name (genres);
 -- Add index for genre and rating columns to improve query performance
 ALTER TABLE songs ADD INDEX idx_genre_rating (genres, rating);
 
-INSERT INTO Admin (username, password, email) VALUES ('Administrator', 'admin123', 'admin@mymusiclib.com');
\ No newline at end of file
+INSERT INTO Admin (username, password, email) VALUES ('Administrator', 'admin123', 'admin@mymusiclib.com');
+-- Incremental comment moderation (monitor_thread.py): scan comments by creation time
+ALTER TABLE comments ADD INDEX idx_comments_created_at (created_at);
+
+CREATE TABLE moderation_watermark (
+    name VARCHAR(50) PRIMARY KEY,
+    last_created_at TIMESTAMP NULL,
+    last_user_id INT NOT NULL DEFAULT 0,
+    last_track_id INT NOT NULL DEFAULT 0
+);
+
+-- Per-song comment pages (/api/songs/<id>/comments), newest first with user_id as tie-breaker
+ALTER TABLE comments ADD INDEX idx_comments_track_created (track_id, created_at, user_id);
+
+-- Song detail page in one round trip (Repository.py creates it on first use if missing)
+DELIMITER //
+CREATE PROCEDURE get_song_details(IN p_track_id INT)
+BEGIN
+    SELECT s.*, COUNT(r.user_id) AS rating_count, COALESCE(AVG(r.rating), 0) AS average_rating
+    FROM songs s
+    LEFT JOIN ratings r ON r.track_id = s.track_id
+    WHERE s.track_id = p_track_id
+    GROUP BY s.track_id;
+
+    SELECT c.user_id, u.username, c.comment_text, c.created_at, COALESCE(r.rating, 0) AS user_rating
+    FROM comments c
+    JOIN users u ON c.user_id = u.id
+    LEFT JOIN ratings r ON r.user_id = c.user_id AND r.track_id = c.track_id
+    WHERE c.track_id = p_track_id
+    ORDER BY c.created_at DESC, c.user_id DESC
+    LIMIT 11;
+END //
+DELIMITER ;
+
+-- Liked songs ordered by like time (/api/likedSongs); existing rows get the migration time
+ALTER TABLE liked_songs
+    ADD COLUMN liked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ADD INDEX idx_liked_songs_user_time (user_id, liked_at, track_id);
+
+-- Incremental admin analytics snapshots (analytics.py): rows created since the last refresh
+ALTER TABLE ratings ADD INDEX idx_ratings_created_at (created_at);
+ALTER TABLE liked_songs ADD INDEX idx_liked_songs_liked_at (liked_at);
+
+-- Song catalog change tracking (catalog.py): workers poll for edited and deleted songs
+ALTER TABLE songs
+    ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    ADD INDEX idx_songs_updated_at (updated_at);
+
+CREATE TABLE song_deletions (
+    track_id INT PRIMARY KEY,
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_song_deletions_deleted_at (deleted_at)
+);
+
+-- Song deletion jobs (song_deletion.py): songs are tombstoned in song_deletions at once and
+-- their likes, ratings and comments purged in small batches in the background
+CREATE TABLE song_deletion_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    status ENUM('pending', 'running', 'done', 'failed') NOT NULL DEFAULT 'pending',
+    total_tracks INT NOT NULL,
+    purged_tracks INT NOT NULL DEFAULT 0,
+    purged_rows BIGINT NOT NULL DEFAULT 0,
+    owner VARCHAR(100) NULL,
+    heartbeat_at TIMESTAMP NULL,
+    error TEXT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL,
+    INDEX idx_song_deletion_jobs_status (status, id)
+);
+
+ALTER TABLE song_deletions
+    ADD COLUMN job_id INT NULL,
+    ADD COLUMN purged_at TIMESTAMP NULL,
+    ADD INDEX idx_song_deletions_job (job_id, track_id);
+
+-- get_song_details() hides tombstoned songs
+DROP PROCEDURE IF EXISTS get_song_details;
+DELIMITER //
+CREATE PROCEDURE get_song_details(IN p_track_id INT)
+BEGIN
+    SELECT s.*, COUNT(r.user_id) AS rating_count, COALESCE(AVG(r.rating), 0) AS average_rating
+    FROM songs s
+    LEFT JOIN ratings r ON r.track_id = s.track_id
+    WHERE s.track_id = p_track_id
+      AND NOT EXISTS (SELECT 1 FROM song_deletions sd WHERE sd.track_id = s.track_id)
+    GROUP BY s.track_id;
+
+    SELECT c.user_id, u.username, c.comment_text, c.created_at, COALESCE(r.rating, 0) AS user_rating
+    FROM comments c
+    JOIN users u ON c.user_id = u.id
+    LEFT JOIN ratings r ON r.user_id = c.user_id AND r.track_id = c.track_id
+    WHERE c.track_id = p_track_id
+    ORDER BY c.created_at DESC, c.user_id DESC
+    LIMIT 11;
+END //
+DELIMITER ;
+
+-- Bulk song imports (song_import.py): job progress and row errors, and the duplicate check
+CREATE TABLE song_import_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    format VARCHAR(10) NOT NULL,
+    status ENUM('pending', 'running', 'done', 'failed') NOT NULL DEFAULT 'pending',
+    total_rows INT NOT NULL DEFAULT 0,
+    inserted_rows INT NOT NULL DEFAULT 0,
+    duplicate_rows INT NOT NULL DEFAULT 0,
+    error_rows INT NOT NULL DEFAULT 0,
+    errors MEDIUMTEXT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL
+);
+
+ALTER TABLE songs ADD INDEX idx_songs_name_artist (track_name, artist_name);
@@ -1,3 +1,7 @@
+import mysql.connector
+import os
+import urllib.parse
+
 def get_db_connection():
     """Get database connection to Railway MySQL database using the public URL"""
     try:
@@ -0,0 +1,170 @@
+import base64
+import itertools
+import os
+import time
+import urllib.parse
+import mysql.connector
+
+# Read/write splitting: writes go to the primary (MYSQL_PUBLIC_URL), read-only handlers to
+# the replicas in MYSQL_REPLICA_URLS (comma-separated, same URL format).
+#
+# A replica is used only while its measured lag is at most MAX_REPLICA_LAG_SECONDS; lag is
+# re-read at most every LAG_CHECK_SECONDS per replica, and a replica that cannot report it
+# (replication stopped, missing privilege) is skipped until the next check. With no usable
+# replica, reads go to the primary.
+#
+# Read-your-writes: after a write request the primary's executed GTID set (or, without
+# GTIDs, the write time) is handed to the client as a token. A read carrying the token only
+# uses a replica that already contains that GTID set (or whose lag, sampled after the write,
+# shows it has applied it).
+#
+# Lag comes from Seconds_Behind_Source, in whole seconds: a reading of n means the replica
+# has applied everything committed before (sample time - n - 1).
+MAX_REPLICA_LAG_SECONDS = float(os.getenv('MAX_REPLICA_LAG_SECONDS', 2))
+LAG_CHECK_SECONDS = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', 5))
+READ_AFTER_TTL_SECONDS = 60  # Clients drop the token after this; replicas catch up well before
+
+
+def connect_url(url):
+    parsed = urllib.parse.urlparse(url)
+    connection = mysql.connector.connect(
+        host=parsed.hostname,
+        port=parsed.port,
+        user=parsed.username,
+        password=parsed.password,
+        database=parsed.path[1:] if parsed.path else 'railway',
+        autocommit=True,
+        connection_timeout=30
+    )
+    print(f"Successfully created new database connection to {parsed.hostname}:{parsed.port}")
+    return connection
+
+
+def encode_read_after(kind, value):
+    return base64.urlsafe_b64encode(f"{kind}:{value}".encode('utf-8')).decode('ascii')
+
+
+def decode_read_after(token):
+    """(kind, value) with kind 'g' (GTID set) or 't' (unix time); None for a missing or bad token."""
+    if not token:
+        return None
+    try:
+        kind, value = base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8').split(':', 1)
+        if kind == 't':
+            return kind, float(value)
+        if kind == 'g':
+            return kind, value
+    except Exception:
+        pass
+    return None
+
+
+class Replica:
+    def __init__(self, url):
+        self.url = url
+        self.lag = None          # seconds, None when unknown
+        self.checked_at = 0
+        self.sampled_at = 0      # time.time() of the last lag reading
+
+    def usable(self):
+        return self.lag is not None and self.lag <= MAX_REPLICA_LAG_SECONDS
+
+    def check_lag(self, conn):
+        cursor = conn.cursor(dictionary=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                cursor.execute("SHOW SLAVE STATUS")  # Before MySQL 8.0.22
+            status = cursor.fetchone()
+        finally:
+            cursor.close()
+        lag = None
+        if status:
+            lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        self.lag = float(lag) if lag is not None else None
+        self.checked_at = time.monotonic()
+        self.sampled_at = time.time()
+
+
+class DatabaseRouter:
+    def __init__(self, primary_url=None, replica_urls=None, connect=connect_url):
+        self.primary_url = primary_url
+        if replica_urls is None:
+            replica_urls = [u.strip() for u in os.getenv('MYSQL_REPLICA_URLS', '').split(',') if u.strip()]
+        self.replicas = [Replica(url) for url in replica_urls]
+        self.connect = connect
+        self.turn = itertools.count()
+        self.stats = {"primary": 0, "replica": 0, "fallback": 0}
+
+    def primary(self):
+        url = self.primary_url or os.getenv('MYSQL_PUBLIC_URL')
+        if not url:
+            raise ValueError("MYSQL_PUBLIC_URL environment variable is not set")
+        self.stats["primary"] += 1
+        return self.connect(url)
+
+    def read(self, read_after=None):
+        """Connection for a read-only handler: a fresh-enough replica, else the primary."""
+        if self.replicas:
+            start = next(self.turn)
+            for i in range(len(self.replicas)):
+                replica = self.replicas[(start + i) % len(self.replicas)]
+                conn = self._try_replica(replica, read_after)
+                if conn is not None:
+                    self.stats["replica"] += 1
+                    return conn
+            self.stats["fallback"] += 1
+        return self.primary()
+
+    def _try_replica(self, replica, read_after):
+        stale = time.monotonic() - replica.checked_at >= LAG_CHECK_SECONDS
+        if not stale and not replica.usable():
+            return None
+        try:
+            conn = self.connect(replica.url)
+        except Exception as e:
+            print(f"Replica unavailable: {e}")
+            replica.lag, replica.checked_at = None, time.monotonic()
+            return None
+        try:
+            if stale:
+                replica.check_lag(conn)
+            if replica.usable() and self._has_caught_up(conn, replica, read_after):
+                return conn
+        except Exception as e:
+            print(f"Replica check failed: {e}")
+            replica.lag, replica.checked_at = None, time.monotonic()
+        conn.close()
+        return None
+
+    @staticmethod
+    def _has_caught_up(conn, replica, read_after):
+        if read_after is None:
+            return True
+        kind, value = read_after
+        if kind == 't':
+            # Only a reading taken after the write can show it was applied
+            return replica.sampled_at > value and replica.lag + 1 <= replica.sampled_at - value
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GTID_SUBSET(%s, @@GLOBAL.gtid_executed)", (value,))
+            return bool(cursor.fetchone()[0])
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def write_token(conn):
+        """Read-your-writes token for the state of the primary after this connection's writes."""
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT @@GLOBAL.gtid_executed")
+                row = cursor.fetchone()
+            finally:
+                cursor.close()
+            if row and row[0]:
+                return encode_read_after('g', row[0].replace('\n', ''))
+        except Exception:
+            pass  # GTIDs disabled or unsupported: fall back to the write time
+        return encode_read_after('t', time.time())
@@ -0,0 +1,21 @@
+import os
+
+# gunicorn settings for the prefork deployment (see serve.py):
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# The master imports serve.py, which loads .env, builds the app and preloads the read-mostly
+# data once; workers are forked from it and run the per-worker hooks in post_fork.
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 8))
+backlog = 2048
+timeout = int(os.getenv('WEB_TIMEOUT_SECONDS', 120))  # Imports and analytics can take a while
+preload_app = True
+wsgi_app = 'serve:preloaded_app()'
+
+
+def post_fork(server, worker):
+    import Repository
+    Repository.run_post_fork_hooks()
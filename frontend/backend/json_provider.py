@@ -0,0 +1,55 @@
+import decimal
+import os
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Flask's stdlib encoder is used without orjson
+    orjson = None
+
+# orjson-backed drop-in for Flask's JSON provider; create_app() installs it when orjson is
+# available. Output matches DefaultJSONProvider's (sorted keys, trailing newline, indented in
+# debug) except that non-ASCII text is sent as UTF-8 instead of \u escapes.
+#
+# JSON_DATETIME_FORMAT selects how datetimes and Decimals are written:
+#   http  (default) RFC 822 dates and Decimal strings, exactly as the stdlib provider
+#   iso   ISO 8601 dates encoded natively by orjson and Decimals as numbers
+DATETIME_FORMAT = os.getenv('JSON_DATETIME_FORMAT', 'http')
+
+
+def iso_default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    return DefaultJSONProvider.default(obj)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def __init__(self, app):
+        super().__init__(app)
+        self.options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            self.options |= orjson.OPT_SORT_KEYS
+        if DATETIME_FORMAT == 'iso':
+            self.default_fn = iso_default
+        else:
+            self.options |= orjson.OPT_PASSTHROUGH_DATETIME
+            self.default_fn = self.default
+
+    def dumps_bytes(self, obj, indent=False):
+        options = self.options | orjson.OPT_INDENT_2 if indent else self.options
+        return orjson.dumps(obj, default=self.default_fn, option=options)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:  # Arguments only the stdlib encoder understands
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,239 @@
+import heapq
+import os
+import threading
+import time
+from trending import Chart, OVERALL
+
+# Top-rated leaderboards, overall and per genre, ranked by a Bayesian average:
+#
+#   score = (prior_mean * PRIOR_VOTES + sum of ratings) / (PRIOR_VOTES + number of ratings)
+#
+# so a track needs several good ratings before it outranks well-established ones. Per-track
+# sums and counts are loaded once with a GROUP BY and then kept current by add_review; each
+# chart is a sorted top-N list that is only rebuilt when a charted track drops out of it.
+#
+# Ratings written through other workers (or server.js) are picked up every SYNC_SECONDS: the
+# tracks rated since the last sync (ratings.updated_at) get their sums and counts re-read, so
+# the result is exact whether or not this worker already applied the rating itself. Genre
+# changes and deletions are polled the same way, like the song catalog does.
+PRIOR_VOTES = float(os.getenv('LEADERBOARD_PRIOR_VOTES', 10))
+LEADERBOARD_SIZE = 200
+DEFAULT_PRIOR_MEAN = 3.0
+PRIOR_DRIFT = 0.05  # Re-rank everything once the global mean moves this far from the prior
+SYNC_SECONDS = float(os.getenv('LEADERBOARD_SYNC_SECONDS', 30))
+SYNC_BATCH = 500
+# Changes are re-read from this far before the last sync, so rows committed late are not missed
+COMMIT_LAG_SECONDS = 5
+
+
+class Leaderboards:
+    def __init__(self, prior_votes=PRIOR_VOTES, size=LEADERBOARD_SIZE):
+        self.prior_votes = prior_votes
+        self.size = size
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()  # one loader/syncer at a time; others keep serving
+        self.sums = {}
+        self.counts = {}
+        self.total_sum = 0
+        self.total_count = 0
+        self.prior_mean = DEFAULT_PRIOR_MEAN
+        self.genres = {}          # track_id -> genre
+        self.charts = {OVERALL: Chart(size)}
+        self.dirty = set()        # charts that lost an entry and must be refilled before use
+        self.loaded = False
+        self.watermark = 0        # database time of the last load/sync
+        self.synced_at = 0
+
+    def _score(self, track_id):
+        return (self.prior_mean * self.prior_votes + self.sums[track_id]) / (self.prior_votes + self.counts[track_id])
+
+    def _chart(self, name):
+        chart = self.charts.get(name)
+        if chart is None:
+            chart = self.charts[name] = Chart(self.size)
+        return chart
+
+    def _place(self, name, track_id, score):
+        """Move track_id to its new score (None = gone) in one chart, keeping the chart exact."""
+        chart = self._chart(name)
+        if track_id not in chart.position:
+            if score is not None:
+                chart.offer(track_id, score)
+            return
+        was_full = len(chart.ids) >= chart.size
+        chart.remove(track_id)
+        if score is None:
+            if was_full:
+                self.dirty.add(name)
+        elif not was_full or score >= -chart.keys[-1]:
+            chart.offer(track_id, score)
+        else:
+            # Fell below the tail: a track outside the chart may now rank above it
+            self.dirty.add(name)
+
+    def _update(self, track_id):
+        score = self._score(track_id) if self.counts.get(track_id) else None
+        self._place(OVERALL, track_id, score)
+        genre = self.genres.get(track_id)
+        if genre:
+            self._place(genre, track_id, score)
+
+    def _rebuild(self, name):
+        if name == OVERALL:
+            candidates = self.counts
+        else:
+            candidates = [t for t in self.counts if self.genres.get(t) == name]
+        chart = self.charts[name] = Chart(self.size)
+        for track_id in heapq.nlargest(self.size, candidates, key=self._score):
+            chart.offer(track_id, self._score(track_id))
+        self.dirty.discard(name)
+
+    def _rebuild_all(self):
+        if self.total_count:
+            self.prior_mean = self.total_sum / self.total_count
+        self.charts = {OVERALL: Chart(self.size)}
+        self.dirty = {OVERALL} | {g for g in self.genres.values() if g}
+        for name in list(self.dirty):
+            self._rebuild(name)
+
+    def record_rating(self, track_id, rating, old_rating=None):
+        """Apply a new rating, or a changed one when old_rating is given."""
+        with self.lock:
+            if not self.loaded:
+                return  # The initial load will read it from the table
+            previous = old_rating or 0
+            self.sums[track_id] = self.sums.get(track_id, 0) + rating - previous
+            self.total_sum += rating - previous
+            if not old_rating:
+                self.counts[track_id] = self.counts.get(track_id, 0) + 1
+                self.total_count += 1
+            if abs(self.total_sum / self.total_count - self.prior_mean) > PRIOR_DRIFT:
+                self._rebuild_all()
+            else:
+                self._update(track_id)
+
+    def set_totals(self, totals):
+        """Replace the rating sum and count of tracks (track_id -> (sum, count)) with the table's values."""
+        with self.lock:
+            for track_id, (total, count) in totals.items():
+                self.total_sum += total - self.sums.pop(track_id, 0)
+                self.total_count += count - self.counts.pop(track_id, 0)
+                if count:
+                    self.sums[track_id] = total
+                    self.counts[track_id] = count
+            if self.total_count and abs(self.total_sum / self.total_count - self.prior_mean) > PRIOR_DRIFT:
+                self._rebuild_all()
+            else:
+                for track_id in totals:
+                    self._update(track_id)
+
+    def remove_track(self, track_id):
+        with self.lock:
+            count = self.counts.pop(track_id, 0)
+            self.total_sum -= self.sums.pop(track_id, 0)
+            self.total_count -= count
+            if count:
+                self._update(track_id)
+            self.genres.pop(track_id, None)
+
+    def set_genres(self, genres):
+        """Register track genres (track_id -> genre), moving rated tracks between genre charts."""
+        with self.lock:
+            for track_id, genre in genres.items():
+                old_genre = self.genres.get(track_id)
+                if old_genre == genre:
+                    continue
+                score = self._score(track_id) if self.counts.get(track_id) else None
+                if old_genre and score is not None:
+                    self._place(old_genre, track_id, None)
+                self.genres[track_id] = genre
+                if genre and score is not None:
+                    self._place(genre, track_id, score)
+
+    def top(self, k=20, genre=None):
+        """[(track_id, score, rating_count)] for the overall chart or one genre."""
+        with self.lock:
+            name = genre or OVERALL
+            if name not in self.charts:
+                return []
+            if name in self.dirty:
+                self._rebuild(name)
+            return [(track_id, score, self.counts[track_id]) for track_id, score in self.charts[name].top(k)]
+
+    def load(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT UNIX_TIMESTAMP()")
+            as_of = float(cursor.fetchone()[0])
+            cursor.execute("SELECT track_id, genres FROM songs WHERE genres IS NOT NULL AND genres != ''")
+            genres = {track_id: genre for track_id, genre in cursor.fetchall()}
+            cursor.execute("SELECT track_id, SUM(rating), COUNT(*) FROM ratings GROUP BY track_id")
+            totals = {track_id: (int(total), count) for track_id, total, count in cursor.fetchall()}
+        finally:
+            cursor.close()
+        with self.lock:
+            self.genres = genres
+            self.sums = {track_id: total for track_id, (total, _) in totals.items()}
+            self.counts = {track_id: count for track_id, (_, count) in totals.items()}
+            self.total_sum = sum(self.sums.values())
+            self.total_count = sum(self.counts.values())
+            self._rebuild_all()
+            self.watermark = as_of
+            self.loaded = True
+
+    def sync(self, conn):
+        """Re-read the tracks rated, re-genred or deleted since the last load/sync."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT UNIX_TIMESTAMP()")
+            now = float(cursor.fetchone()[0])
+            since = self.watermark - COMMIT_LAG_SECONDS
+            cursor.execute("SELECT track_id, genres FROM songs WHERE updated_at >= FROM_UNIXTIME(%s)", (since,))
+            genres = dict(cursor.fetchall())
+            cursor.execute("SELECT track_id FROM song_deletions WHERE deleted_at >= FROM_UNIXTIME(%s)", (since,))
+            deleted = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT DISTINCT track_id FROM ratings WHERE updated_at >= FROM_UNIXTIME(%s)", (since,))
+            rated = [row[0] for row in cursor.fetchall()]
+            totals = {}
+            for i in range(0, len(rated), SYNC_BATCH):
+                batch = rated[i:i + SYNC_BATCH]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f"SELECT track_id, SUM(rating), COUNT(*) FROM ratings "
+                               f"WHERE track_id IN ({placeholders}) GROUP BY track_id", batch)
+                totals.update({track_id: (int(total), count) for track_id, total, count in cursor.fetchall()})
+        finally:
+            cursor.close()
+        self.set_genres(genres)
+        self.set_totals({track_id: totals.get(track_id, (0, 0)) for track_id in rated})
+        for track_id in deleted:
+            self.remove_track(track_id)
+        self.watermark = now
+
+    def ensure_loaded(self, conn_factory):
+        """Load sums and counts once per process, then sync at most every SYNC_SECONDS.
+
+        The first call blocks until the load succeeds (a failed load is retried by the next
+        call); later syncs run in one request while the others serve the current charts.
+        """
+        if self.loaded and time.time() - self.synced_at < SYNC_SECONDS:
+            return
+        if not self.sync_lock.acquire(blocking=not self.loaded):
+            return
+        try:
+            if not self.loaded or time.time() - self.synced_at >= SYNC_SECONDS:
+                conn = conn_factory()
+                try:
+                    if self.loaded:
+                        self.sync(conn)
+                    else:
+                        self.load(conn)
+                finally:
+                    conn.close()
+                self.synced_at = time.time()
+        except Exception as e:
+            if not self.loaded:
+                raise
+            print("Error syncing leaderboards:", e)
+            self.synced_at = time.time()
+        finally:
+            self.sync_lock.release()
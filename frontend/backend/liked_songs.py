@@ -0,0 +1,148 @@
+import base64
+import bisect
+import datetime
+import os
+from array import array
+from caches import LRUCache
+from song_deletion import live_songs
+
+# Liked-songs service shared by every liked-songs endpoint.
+#
+# Pages are keyset-paginated on the sort column plus track_id (unique per user).
+# liked_at comes from the liked_songs.liked_at column backed by idx_liked_songs_user_time.
+LIKED_SORTS = {
+    # name: (ORDER BY column, descending)
+    'recent': ('ls.liked_at', True),
+    'oldest': ('ls.liked_at', False),
+    'title': ('s.track_name', False),
+    'artist': ('s.artist_name', False),
+}
+LIKED_PAGE_SIZE = 50
+LIKED_MAX_PAGE_SIZE = 200
+
+LIKED_COLUMNS = """
+    s.track_id, s.track_name, s.artist_name, s.album_name, s.album_image, s.audio_url,
+    COALESCE(r.rating, 0) AS rating, ls.liked_at
+"""
+
+
+def encode_liked_cursor(sort_value, track_id):
+    if isinstance(sort_value, datetime.datetime):
+        sort_value = 'd:' + sort_value.isoformat()
+    else:
+        sort_value = 's:' + sort_value
+    raw = f"{track_id}|{sort_value}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_liked_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8')
+        track_id, sort_value = raw.split('|', 1)
+        if sort_value.startswith('d:'):
+            return datetime.datetime.fromisoformat(sort_value[2:]), int(track_id)
+        return sort_value[2:], int(track_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def fetch_liked_page(cursor, user_id, limit=None, after=None, sort='recent'):
+    """Return (songs, next_cursor) for one page of a user's liked songs. cursor must be a dictionary cursor.
+
+    limit=None returns every liked song.
+    """
+    if sort not in LIKED_SORTS:
+        raise ValueError(f"Invalid sort; use one of {', '.join(LIKED_SORTS)}")
+    column, descending = LIKED_SORTS[sort]
+    direction = 'DESC' if descending else 'ASC'
+    op = '<' if descending else '>'
+
+    query = f"""
+        SELECT {LIKED_COLUMNS}
+        FROM liked_songs ls
+        INNER JOIN songs s ON s.track_id = ls.track_id
+        LEFT JOIN ratings r ON r.track_id = ls.track_id AND r.user_id = ls.user_id
+        WHERE ls.user_id = %s AND {live_songs('s')}
+    """
+    params = [user_id]
+    if after:
+        sort_value, track_id = after
+        query += f" AND ({column} {op} %s OR ({column} = %s AND ls.track_id {op} %s))"
+        params += [sort_value, sort_value, track_id]
+    query += f" ORDER BY {column} {direction}, ls.track_id {direction}"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        sort_key = column.split('.')[1]
+        next_cursor = encode_liked_cursor(rows[-1][sort_key], rows[-1]['track_id'])
+    return rows, next_cursor
+
+
+class LikedSetCache:
+    """Per-user liked track ids as a sorted array('I'), so "is this liked?" checks need no query.
+
+    Sets are loaded through conn_factory, which should give primary connections: a set is shared
+    by every request of the user, and one loaded from a lagging replica would hide a fresh like
+    until it expires. Likes made through this worker are added in place (add); the TTL covers
+    likes made through other workers. Like the pages, a set holds only songs that still exist
+    and are not tombstoned, so count matches what the pages return.
+    """
+
+    def __init__(self, max_users=None):
+        self.cache = LRUCache(max_users or int(os.getenv('LIKED_SET_CACHE_SIZE', 10000)), ttl_seconds=300)
+
+    def get(self, conn_factory, user_id):
+        return self.cache.get_or_load(user_id, lambda: self._load(conn_factory, user_id))
+
+    @staticmethod
+    def _load(conn_factory, user_id):
+        conn = conn_factory()
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"""
+                    SELECT ls.track_id FROM liked_songs ls
+                    INNER JOIN songs s ON s.track_id = ls.track_id
+                    WHERE ls.user_id = %s AND {live_songs('s')}
+                    ORDER BY ls.track_id
+                """, (user_id,))
+                return array('I', (row[0] for row in cursor.fetchall()))
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+
+    def liked_among(self, conn_factory, user_id, track_ids):
+        """The ids of track_ids that user_id has liked."""
+        liked = self.get(conn_factory, user_id)
+        found = set()
+        for track_id in track_ids:
+            i = bisect.bisect_left(liked, track_id)
+            if i < len(liked) and liked[i] == track_id:
+                found.add(track_id)
+        return found
+
+    def add(self, user_id, track_id):
+        def insert(track_ids):
+            i = bisect.bisect_left(track_ids, track_id)
+            if i == len(track_ids) or track_ids[i] != track_id:
+                track_ids.insert(i, track_id)
+            return track_ids
+        self.cache.update(user_id, insert)
+
+    def remove_track(self, track_id):
+        """Drop a deleted song from every cached set."""
+        with self.cache.lock:
+            for track_ids, _ in self.cache.entries.values():
+                i = bisect.bisect_left(track_ids, track_id)
+                if i < len(track_ids) and track_ids[i] == track_id:
+                    del track_ids[i]
+
+    def count(self, conn_factory, user_id):
+        return len(self.get(conn_factory, user_id))
@@ -0,0 +1,187 @@
+import argparse
+import hashlib
+import os
+import re
+import sys
+import mysql.connector
+from dotenv import load_dotenv
+from db_routing import connect_url
+
+# Versioned schema migrations for the MySQL database.
+#
+#   python migrate.py               apply pending migrations to MYSQL_PUBLIC_URL
+#   python migrate.py --status      list applied and pending versions
+#   python migrate.py --target 7    apply up to and including version 7
+#
+# migrations/NNNN_description.sql files are applied in version order, each once. A row in
+# schema_migrations records the version and a checksum of the file, so an edited migration is
+# reported instead of silently skipped. Files are plain MySQL: `;` ends a statement and
+# DELIMITER blocks hold procedures. Each ALTER makes one change.
+#
+# MySQL commits DDL as it goes, so a migration cannot be rolled back as a whole. Instead a
+# statement that fails because what it creates is already there (ALREADY_APPLIED_ERRORS)
+# counts as done: re-running a migration that stopped halfway picks up where it failed, and a
+# database set up by hand from data/MySqlDB.sql is adopted by running the migrations over it.
+# A named lock keeps two deploys from migrating at the same time.
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+LOCK_NAME = 'schema_migrations'
+LOCK_TIMEOUT_SECONDS = int(os.getenv('MIGRATION_LOCK_TIMEOUT_SECONDS', 60))
+
+ALREADY_APPLIED_ERRORS = {
+    1050: "table exists",      # ER_TABLE_EXISTS_ERROR
+    1060: "column exists",     # ER_DUP_FIELDNAME
+    1061: "index exists",      # ER_DUP_KEYNAME
+    1304: "procedure exists",  # ER_SP_ALREADY_EXISTS
+}
+
+CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration:
+    def __init__(self, version, name, sql):
+        self.version = version
+        self.name = name
+        self.sql = sql
+        self.checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+
+    def statements(self):
+        return split_statements(self.sql)
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Migrations in directory, in version order."""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            migrations.append(Migration(int(match.group(1)), match.group(2), f.read()))
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError("Two migration files share a version number")
+    return migrations
+
+
+def split_statements(sql):
+    """Statements of a migration file, honouring DELIMITER lines and skipping `--` comments."""
+    statements = []
+    delimiter = ';'
+    lines = []
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if not lines and (not stripped or stripped.startswith('--')):
+            continue
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        if stripped.endswith(delimiter):
+            lines.append(line.rstrip()[:-len(delimiter)])
+            statements.append('\n'.join(lines).strip())
+            lines = []
+        else:
+            lines.append(line)
+    if '\n'.join(lines).strip():
+        raise MigrationError(f"Statement not terminated with '{delimiter}'")
+    return statements
+
+
+def applied_migrations(cursor):
+    """{version: checksum} of the migrations recorded in schema_migrations."""
+    cursor.execute(CREATE_MIGRATIONS_TABLE)
+    cursor.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(cursor.fetchall())
+
+
+def apply_migration(cursor, migration):
+    for statement in migration.statements():
+        try:
+            cursor.execute(statement)
+        except mysql.connector.Error as e:
+            if e.errno not in ALREADY_APPLIED_ERRORS:
+                raise MigrationError(f"{migration.version:04d}_{migration.name} failed: {e}\n{statement}") from e
+            print(f"  skipped, {ALREADY_APPLIED_ERRORS[e.errno]}: {statement.splitlines()[0]}")
+    cursor.execute("INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                   (migration.version, migration.name, migration.checksum))
+
+
+def migrate(conn, migrations=None, target=None):
+    """Apply the pending migrations up to target (all by default); return the versions applied."""
+    migrations = load_migrations() if migrations is None else migrations
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT_SECONDS))
+        if cursor.fetchall()[0][0] != 1:
+            raise MigrationError(f"Another migration holds the '{LOCK_NAME}' lock")
+        try:
+            applied = applied_migrations(cursor)
+            check_checksums(migrations, applied)
+            done = []
+            for migration in migrations:
+                if migration.version in applied or (target is not None and migration.version > target):
+                    continue
+                print(f"Applying {migration.version:04d}_{migration.name}")
+                apply_migration(cursor, migration)
+                done.append(migration.version)
+            return done
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def check_checksums(migrations, applied):
+    changed = [f"{m.version:04d}_{m.name}" for m in migrations
+               if m.version in applied and applied[m.version] != m.checksum]
+    if changed:
+        raise MigrationError(f"Applied migrations were edited: {', '.join(changed)}; add a new migration instead")
+
+
+def status(conn, migrations=None):
+    """(migration, applied) pairs for every migration file."""
+    migrations = load_migrations() if migrations is None else migrations
+    cursor = conn.cursor()
+    try:
+        applied = applied_migrations(cursor)
+    finally:
+        cursor.close()
+    return [(migration, migration.version in applied) for migration in migrations]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations")
+    parser.add_argument('--status', action='store_true', help="list applied and pending migrations")
+    parser.add_argument('--target', type=int, help="last version to apply")
+    parser.add_argument('--url', help="database URL (default: MYSQL_PUBLIC_URL)")
+    args = parser.parse_args()
+    load_dotenv()
+    url = args.url or os.getenv('MYSQL_PUBLIC_URL')
+    if not url:
+        print("MYSQL_PUBLIC_URL environment variable is not set")
+        sys.exit(1)
+    connection = connect_url(url)
+    try:
+        if args.status:
+            for migration, applied in status(connection):
+                print(f"{'applied' if applied else 'pending':8} {migration.version:04d}_{migration.name}")
+        else:
+            versions = migrate(connection, target=args.target)
+            print(f"Applied {len(versions)} migration(s)" if versions else "Schema is up to date")
+    except MigrationError as e:
+        print(e)
+        sys.exit(1)
+    finally:
+        connection.close()
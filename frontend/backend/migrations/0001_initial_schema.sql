@@ -0,0 +1,67 @@
+-- Core tables, as first created by data/MySqlDB.sql
+CREATE TABLE users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(50) NOT NULL,
+    password VARCHAR(500) NOT NULL,
+    email VARCHAR(50) NOT NULL,
+    favorite_genre VARCHAR(50) NOT NULL DEFAULT '',
+    favorite_artist VARCHAR(50) NOT NULL DEFAULT '',
+    bio TEXT NULL,
+    avatar LONGTEXT NULL
+);
+
+CREATE TABLE songs (
+    track_id INT AUTO_INCREMENT PRIMARY KEY,
+    track_name VARCHAR(255) NOT NULL,
+    artist_name VARCHAR(255) NOT NULL,
+    album_name VARCHAR(255) NOT NULL,
+    album_image VARCHAR(255) NOT NULL,
+    rating INT CHECK (rating >= 0 AND rating <= 5) DEFAULT 0,
+    genres VARCHAR(50) NOT NULL,
+    audio_url VARCHAR(255) NOT NULL
+);
+
+-- The (user_id, track_id) primary keys serve per-user lookups; InnoDB adds an index on
+-- track_id for each track foreign key, which serves per-song lookups
+CREATE TABLE liked_songs (
+    user_id INT NOT NULL,
+    track_id INT NOT NULL,
+    PRIMARY KEY (user_id, track_id),
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (track_id) REFERENCES songs(track_id)
+);
+
+CREATE TABLE comments (
+    user_id INT NOT NULL,
+    track_id INT NOT NULL,
+    comment_text TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    PRIMARY KEY (user_id, track_id),
+    FOREIGN KEY (track_id) REFERENCES songs(track_id)
+);
+
+CREATE TABLE ratings (
+    user_id INT NOT NULL,
+    track_id INT NOT NULL,
+    rating INT CHECK (rating >= 1 AND rating <= 5) DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    PRIMARY KEY (user_id, track_id),
+    FOREIGN KEY (track_id) REFERENCES songs(track_id)
+);
+
+CREATE TABLE Admin (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(50) NOT NULL,
+    password VARCHAR(500) NOT NULL,
+    email VARCHAR(50) NOT NULL
+);
+
+CREATE TABLE monitored_users (
+    user_id INT NOT NULL,
+    reason VARCHAR(255) NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, timestamp),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
@@ -0,0 +1,16 @@
+-- Email verification, two-factor codes, password resets and remember-me tokens
+ALTER TABLE users ADD COLUMN email_verified BOOLEAN DEFAULT 0;
+ALTER TABLE users ADD COLUMN two_factor_enabled BOOLEAN DEFAULT 0;
+ALTER TABLE users ADD COLUMN two_factor_token VARCHAR(6) NULL;
+ALTER TABLE users ADD COLUMN two_factor_expires TIMESTAMP NULL;
+ALTER TABLE users ADD COLUMN reset_token VARCHAR(255) NULL;
+ALTER TABLE users ADD COLUMN reset_token_expires TIMESTAMP NULL;
+ALTER TABLE users ADD COLUMN last_login TIMESTAMP NULL;
+
+CREATE TABLE user_remember_tokens (
+    token_id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    token VARCHAR(255) NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
@@ -0,0 +1,5 @@
+-- Song listing by title (getAllSongs), and genre statistics (mostCommonGenre)
+ALTER TABLE songs ADD INDEX idx_track_name (track_name);
+ALTER TABLE songs ADD INDEX idx_artist_name (artist_name);
+ALTER TABLE songs ADD INDEX idx_genre_name (genres);
+ALTER TABLE songs ADD INDEX idx_genre_rating (genres, rating);
@@ -0,0 +1,9 @@
+-- Incremental comment moderation (monitor_thread.py): scan comments by creation time
+ALTER TABLE comments ADD INDEX idx_comments_created_at (created_at);
+
+CREATE TABLE moderation_watermark (
+    name VARCHAR(50) PRIMARY KEY,
+    last_created_at TIMESTAMP NULL,
+    last_user_id INT NOT NULL DEFAULT 0,
+    last_track_id INT NOT NULL DEFAULT 0
+);
@@ -0,0 +1,2 @@
+-- Per-song comment pages (/api/songs/<id>/comments), newest first with user_id as tie-breaker
+ALTER TABLE comments ADD INDEX idx_comments_track_created (track_id, created_at, user_id);
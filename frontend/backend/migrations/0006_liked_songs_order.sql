@@ -0,0 +1,3 @@
+-- Liked songs ordered by like time (/api/likedSongs); existing rows get the migration time
+ALTER TABLE liked_songs ADD COLUMN liked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE liked_songs ADD INDEX idx_liked_songs_user_time (user_id, liked_at, track_id);
@@ -0,0 +1,3 @@
+-- Incremental admin analytics snapshots (analytics.py): rows created since the last refresh
+ALTER TABLE ratings ADD INDEX idx_ratings_created_at (created_at);
+ALTER TABLE liked_songs ADD INDEX idx_liked_songs_liked_at (liked_at);
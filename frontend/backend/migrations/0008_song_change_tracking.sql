@@ -0,0 +1,9 @@
+-- Song catalog change tracking (catalog.py): workers poll for edited and deleted songs
+ALTER TABLE songs ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;
+ALTER TABLE songs ADD INDEX idx_songs_updated_at (updated_at);
+
+CREATE TABLE song_deletions (
+    track_id INT PRIMARY KEY,
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_song_deletions_deleted_at (deleted_at)
+);
@@ -0,0 +1,20 @@
+-- Song deletion jobs (song_deletion.py): songs are tombstoned in song_deletions at once and
+-- their likes, ratings and comments purged in small batches in the background
+CREATE TABLE song_deletion_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    status ENUM('pending', 'running', 'done', 'failed') NOT NULL DEFAULT 'pending',
+    total_tracks INT NOT NULL,
+    purged_tracks INT NOT NULL DEFAULT 0,
+    purged_rows BIGINT NOT NULL DEFAULT 0,
+    owner VARCHAR(100) NULL,
+    heartbeat_at TIMESTAMP NULL,
+    error TEXT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL,
+    INDEX idx_song_deletion_jobs_status (status, id)
+);
+
+ALTER TABLE song_deletions ADD COLUMN job_id INT NULL;
+ALTER TABLE song_deletions ADD COLUMN purged_at TIMESTAMP NULL;
+ALTER TABLE song_deletions ADD INDEX idx_song_deletions_job (job_id, track_id);
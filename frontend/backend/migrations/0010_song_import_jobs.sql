@@ -0,0 +1,16 @@
+-- Bulk song imports (song_import.py): job progress and row errors, and the duplicate check
+CREATE TABLE song_import_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    format VARCHAR(10) NOT NULL,
+    status ENUM('pending', 'running', 'done', 'failed') NOT NULL DEFAULT 'pending',
+    total_rows INT NOT NULL DEFAULT 0,
+    inserted_rows INT NOT NULL DEFAULT 0,
+    duplicate_rows INT NOT NULL DEFAULT 0,
+    error_rows INT NOT NULL DEFAULT 0,
+    errors MEDIUMTEXT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL
+);
+
+ALTER TABLE songs ADD INDEX idx_songs_name_artist (track_name, artist_name);
@@ -0,0 +1,23 @@
+-- Song detail page in one round trip; hides tombstoned songs. Keep in step with
+-- SONG_DETAILS_PROCEDURE in Repository.py, which creates it on first use if missing
+DROP PROCEDURE IF EXISTS get_song_details;
+
+DELIMITER //
+CREATE PROCEDURE get_song_details(IN p_track_id INT)
+BEGIN
+    SELECT s.*, COUNT(r.user_id) AS rating_count, COALESCE(AVG(r.rating), 0) AS average_rating
+    FROM songs s
+    LEFT JOIN ratings r ON r.track_id = s.track_id
+    WHERE s.track_id = p_track_id
+      AND NOT EXISTS (SELECT 1 FROM song_deletions sd WHERE sd.track_id = s.track_id)
+    GROUP BY s.track_id;
+
+    SELECT c.user_id, u.username, c.comment_text, c.created_at, COALESCE(r.rating, 0) AS user_rating
+    FROM comments c
+    JOIN users u ON c.user_id = u.id
+    LEFT JOIN ratings r ON r.user_id = c.user_id AND r.track_id = c.track_id
+    WHERE c.track_id = p_track_id
+    ORDER BY c.created_at DESC, c.user_id DESC
+    LIMIT 11;
+END //
+DELIMITER ;
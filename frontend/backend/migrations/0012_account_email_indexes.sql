@@ -0,0 +1,5 @@
+-- Every user endpoint resolves the account by email (login, profile, reviews, likes, liked
+-- pages) and admin login does the same on Admin; both were full table scans. Plain indexes
+-- rather than UNIQUE so the migration cannot fail on existing duplicate addresses
+ALTER TABLE users ADD INDEX idx_users_email (email);
+ALTER TABLE Admin ADD INDEX idx_admin_email (email);
@@ -0,0 +1,4 @@
+-- Leaderboard sync (leaderboards.py): workers re-read the tracks whose ratings were added or
+-- changed since their last sync; existing rows get the migration time
+ALTER TABLE ratings ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;
+ALTER TABLE ratings ADD INDEX idx_ratings_updated_at (updated_at);
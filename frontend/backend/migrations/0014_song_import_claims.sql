@@ -0,0 +1,7 @@
+-- Import jobs are claimed like deletion jobs (song_import.py): the owner heartbeats, and a job
+-- whose owner died is resumed from the upload spooled on its host
+ALTER TABLE song_import_jobs ADD COLUMN owner VARCHAR(100) NULL;
+ALTER TABLE song_import_jobs ADD COLUMN heartbeat_at TIMESTAMP NULL;
+ALTER TABLE song_import_jobs ADD COLUMN spool_host VARCHAR(100) NULL;
+ALTER TABLE song_import_jobs ADD COLUMN spool_path VARCHAR(1024) NULL;
+ALTER TABLE song_import_jobs ADD INDEX idx_song_import_jobs_status (status, id);
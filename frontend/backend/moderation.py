@@ -0,0 +1,211 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+# Bad-word matching shared by the comment monitor and the comment endpoints.
+DEFAULT_BAD_WORDS = ['badword1', 'badword2', 'badword3']
+
+# A user is flagged after more than MODERATION_THRESHOLD (3) bad comments within
+# MODERATION_WINDOW_SECONDS (10 minutes)
+FLAG_REASON = 'Used bad words in multiple comments'
+
+
+def load_word_list():
+    """Read the word list from MODERATION_WORDS_FILE (one word per line) or MODERATION_WORDS (comma separated)."""
+    path = os.getenv('MODERATION_WORDS_FILE')
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            words = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    elif os.getenv('MODERATION_WORDS'):
+        words = [w.strip() for w in os.getenv('MODERATION_WORDS').split(',') if w.strip()]
+    else:
+        words = DEFAULT_BAD_WORDS
+    return words
+
+
+class AhoCorasick:
+    """Case-insensitive multi-pattern matcher; scans a text once regardless of how many words are loaded."""
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [None]
+        for word in words:
+            self._add(word.lower())
+        self._build()
+
+    def _add(self, word):
+        if not word:
+            return
+        state = 0
+        for ch in word:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(None)
+            state = nxt
+        self.out[state] = word
+
+    def _build(self):
+        # Breadth-first so a state's failure link always points at an already finished, shallower state.
+        # dict_link skips to the nearest failure state that ends a word, so overlapping words are reported too.
+        self.dict_link = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0) if state else 0
+                link = self.fail[nxt]
+                self.dict_link[nxt] = link if self.out[link] is not None else self.dict_link[link]
+                queue.append(nxt)
+
+    def find_all(self, text):
+        """Return the list of words found in text (with repeats)."""
+        found = []
+        state = 0
+        goto, fail, out, dict_link = self.goto, self.fail, self.out, self.dict_link
+        for ch in text.lower():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            s = state if out[state] is not None else dict_link[state]
+            while s:
+                found.append(out[s])
+                s = dict_link[s]
+        return found
+
+    def matches(self, text):
+        """True as soon as any word is found."""
+        state = 0
+        goto, fail, out, dict_link = self.goto, self.fail, self.out, self.dict_link
+        for ch in text.lower():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state] is not None or dict_link[state]:
+                return True
+        return False
+
+
+class SlidingWindowCounter:
+    """Per-user timestamps of bad comments, trimmed to the flag window."""
+
+    def __init__(self, window_seconds=None, threshold=None):
+        self.window = window_seconds or int(os.getenv('MODERATION_WINDOW_SECONDS', 600))
+        self.threshold = threshold or int(os.getenv('MODERATION_THRESHOLD', 3))
+        self.events = {}
+
+    def add(self, user_id, timestamp):
+        """Record one bad comment at timestamp (seconds); return True when the user is over the threshold."""
+        events = self.events.get(user_id)
+        if events is None:
+            events = self.events[user_id] = deque()
+        events.append(timestamp)
+        while events and events[0] <= timestamp - self.window:
+            events.popleft()
+        return len(events) > self.threshold
+
+    def prune(self, now):
+        """Drop users with no events inside the window so memory tracks active users only."""
+        for user_id in [u for u, ev in self.events.items() if not ev or ev[-1] <= now - self.window]:
+            del self.events[user_id]
+
+
+class InlineModerator:
+    """Checks comments on the write path; flags are written to monitored_users by a background thread.
+
+    Users already in monitored_users are loaded on the first bad comment (retried until it
+    works), and the per-user counters are pruned once per flag window.
+    """
+
+    def __init__(self, connection_factory, words=None):
+        self.connection_factory = connection_factory
+        self.matcher = AhoCorasick(words or load_word_list())
+        self.counter = SlidingWindowCounter()
+        self.flagged = set()
+        self.flagged_loaded = False
+        self.pruned_at = time.time()
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.writer = None
+
+    def load_flagged(self):
+        """Seed flagged from monitored_users so a restart does not flag those users again."""
+        conn = self.connection_factory()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT user_id FROM monitored_users")
+            flagged = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+        finally:
+            conn.close()
+        with self.lock:
+            self.flagged |= flagged
+            self.flagged_loaded = True
+
+    def check(self, user_id, text, timestamp=None):
+        """Run the matcher over one comment; return True if this comment got the user flagged."""
+        if not text or not self.matcher.matches(text):
+            return False
+        if not self.flagged_loaded:
+            try:
+                self.load_flagged()
+            except Exception as e:
+                print(f"Could not load monitored users: {e}")
+        now = timestamp or time.time()
+        with self.lock:
+            if now - self.pruned_at >= self.counter.window:
+                self.counter.prune(now)
+                self.pruned_at = now
+            if user_id in self.flagged:
+                return False
+            if not self.counter.add(user_id, now):
+                return False
+            self.flagged.add(user_id)
+        self._start_writer()
+        self.pending.put(user_id)
+        return True
+
+    def _start_writer(self):
+        if self.writer is None:
+            with self.lock:
+                if self.writer is None:
+                    self.writer = threading.Thread(target=self._write_flags, daemon=True)
+                    self.writer.start()
+
+    def after_fork(self):
+        """Drop the parent's writer thread, queue and lock in a freshly forked worker."""
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.writer = None
+
+    def _write_flags(self):
+        conn = None
+        while True:
+            user_id = self.pending.get()
+            try:
+                if conn is None or not conn.is_connected():
+                    conn = self.connection_factory()
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1 FROM monitored_users WHERE user_id = %s LIMIT 1", (user_id,))
+                if cursor.fetchone() is None:
+                    cursor.execute(
+                        "INSERT INTO monitored_users (user_id, reason) VALUES (%s, %s)",
+                        (user_id, FLAG_REASON)
+                    )
+                    conn.commit()
+                    print(f"User {user_id} has been monitored for bad words.")
+                cursor.close()
+            except Exception as e:
+                print(f"Error flagging user {user_id}: {e}")
+                conn = None
+                with self.lock:
+                    self.flagged.discard(user_id)  # The next bad comment over the threshold tries again
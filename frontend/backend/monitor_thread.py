@@ -1,45 +1,131 @@
 import threading
 import time
-import pyodbc
+import os
+from dotenv import load_dotenv
+from db_connection import get_db_connection
+from moderation import AhoCorasick, SlidingWindowCounter, load_word_list, FLAG_REASON
 
-def monitor_comments(conn):
-    while True:
+# Repository.py flags users inline as comments are written (moderation.InlineModerator).
+# This monitor is only needed as a catch-up pass, e.g. after comments were imported directly.
+
+# Rows newer than this are left for the next cycle so a comment committed late with an
+# older created_at is not skipped by the watermark
+COMMIT_LAG_SECONDS = 5
+BATCH_SIZE = 1000
+
+
+class CommentMonitor:
+    """Scans only comments newer than the stored watermark and flags users crossing the bad-word threshold."""
+
+    def __init__(self, conn, words=None):
+        self.conn = conn
+        self.matcher = AhoCorasick(words or load_word_list())
+        self.counter = SlidingWindowCounter()
+        self.flagged = set()
+        self.watermark = None
+        self._load_state()
+
+    def _load_state(self):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS moderation_watermark (
+                    name VARCHAR(50) PRIMARY KEY,
+                    last_created_at TIMESTAMP NULL,
+                    last_user_id INT NOT NULL DEFAULT 0,
+                    last_track_id INT NOT NULL DEFAULT 0
+                )
+            """)
+            cursor.execute("""
+                SELECT last_created_at, last_user_id, last_track_id
+                FROM moderation_watermark WHERE name = 'comments'
+            """)
+            row = cursor.fetchone()
+            if row and row[0] is not None:
+                self.watermark = (row[0], row[1], row[2])
+            else:
+                # First run: start from the flag window instead of the whole history
+                cursor.execute("SELECT NOW() - INTERVAL %s SECOND", (self.counter.window,))
+                self.watermark = (cursor.fetchone()[0], 0, 0)
+
+            cursor.execute("SELECT DISTINCT user_id FROM monitored_users")
+            self.flagged = {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+    def _save_watermark(self, cursor):
+        cursor.execute("""
+            INSERT INTO moderation_watermark (name, last_created_at, last_user_id, last_track_id)
+            VALUES ('comments', %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                last_created_at = VALUES(last_created_at),
+                last_user_id = VALUES(last_user_id),
+                last_track_id = VALUES(last_track_id)
+        """, self.watermark)
+
+    def run_once(self):
+        """Process every comment past the watermark; return the list of newly flagged user ids."""
+        newly_flagged = []
+        cursor = self.conn.cursor()
         try:
-            print("Monitoring comments for bad words...")
-            cursor = conn.cursor()
-
-            # Query to find users with more than 3 bad word comments in less than 10 minutes
-            query = """
-            INSERT INTO monitored_users (user_id, reason, timestamp)
-            SELECT DISTINCT c.user_id, 'Used bad words in multiple comments', GETDATE()
-            FROM comments c
-            WHERE c.comment_text LIKE '%badword1%' OR c.comment_text LIKE '%badword2%' OR c.comment_text LIKE '%badword3%'
-              AND c.created_at >= DATEADD(MINUTE, -10, GETDATE())
-            GROUP BY c.user_id
-            HAVING COUNT(*) > 3
-              AND NOT EXISTS (
-                SELECT 1 FROM monitored_users m WHERE m.user_id = c.user_id
-              );
-            """
-
-            cursor.execute(query)
-            conn.commit()
-
-            # Get users to print
-            cursor.execute("SELECT user_id FROM monitored_users")
-            rows = cursor.fetchall()
-            for row in rows:
-                print(f"User {row[0]} has been monitored for bad words.")
+            while True:
+                created_at, user_id, track_id = self.watermark
+                # Keyset scan over idx_comments_created_at (created_at + the (user_id, track_id) primary key)
+                cursor.execute("""
+                    SELECT user_id, track_id, comment_text, created_at
+                    FROM comments
+                    WHERE created_at <= NOW() - INTERVAL %s SECOND
+                      AND (created_at > %s
+                           OR (created_at = %s AND (user_id > %s OR (user_id = %s AND track_id > %s))))
+                    ORDER BY created_at, user_id, track_id
+                    LIMIT %s
+                """, (COMMIT_LAG_SECONDS, created_at, created_at, user_id, user_id, track_id, BATCH_SIZE))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                for row_user, row_track, text, row_created in rows:
+                    if self.matcher.matches(text) and row_user not in self.flagged:
+                        if self.counter.add(row_user, row_created.timestamp()):
+                            self.flagged.add(row_user)
+                            newly_flagged.append(row_user)
+                self.watermark = (rows[-1][3], rows[-1][0], rows[-1][1])
 
+                if len(rows) < BATCH_SIZE:
+                    break
+
+            if newly_flagged:
+                cursor.executemany(
+                    "INSERT INTO monitored_users (user_id, reason) VALUES (%s, %s)",
+                    [(user_id, FLAG_REASON) for user_id in newly_flagged]
+                )
+            self._save_watermark(cursor)
+            self.conn.commit()
+            self.counter.prune(self.watermark[0].timestamp())
+        finally:
             cursor.close()
+        return newly_flagged
+
+
+def monitor_comments(conn):
+    monitor = CommentMonitor(conn)
+    while True:
+        try:
+            for user_id in monitor.run_once():
+                print(f"User {user_id} has been monitored for bad words.")
         except Exception as e:
             print(f"Error monitoring comments: {e}")
-        time.sleep(600)  # Run every 10 minutes
+        time.sleep(int(os.getenv('MONITOR_INTERVAL', 60)))
+
 
+def start_monitor_thread():
+    conn = get_db_connection()
+    thread = threading.Thread(target=monitor_comments, args=(conn,), daemon=True)
+    thread.start()
+    return thread
 
-# Establish database connection
-conn = pyodbc.connect('DRIVER={ODBC Driver 17 for SQL Server};SERVER=USER\\MSSQLSERVER03;DATABASE=MusicLibrary;Trusted_Connection=yes;')
 
-# Start the monitoring thread
-thread = threading.Thread(target=monitor_comments, args=(conn,), daemon=True)
-thread.start()
\ No newline at end of file
+if __name__ == '__main__':
+    load_dotenv()
+    print("Monitoring comments for bad words...")
+    start_monitor_thread().join()
@@ -0,0 +1,244 @@
+import os
+import sys
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+    import scipy.sparse as sp
+except ImportError:  # Recommendations are disabled without NumPy/SciPy
+    np = None
+    sp = None
+
+# Item-item collaborative filtering, built offline from ratings + liked_songs:
+#
+#   python recommendations.py              build and publish the neighbour files
+#   python recommendations.py --benchmark  time a build over 1M synthetic ratings
+#
+# The build writes three .npy arrays into a new directory and then swaps the `current`
+# symlink, so the Flask workers memory-map a complete build and share its pages.
+RECOMMENDATIONS_DIR = os.getenv('RECOMMENDATIONS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'recommendations'))
+TOP_K = int(os.getenv('RECOMMENDATIONS_TOP_K', 50))
+CHUNK_SIZE = 2048
+LIKE_WEIGHT = 1.0  # A like counts like a 5-star rating
+
+
+def load_interactions(conn, batch_size=50000):
+    """Read (user_id, track_id, weight) triples from ratings and liked_songs as NumPy arrays."""
+    users, tracks, weights = [], [], []
+    cursor = conn.cursor()
+    try:
+        for query, weight in (("SELECT user_id, track_id, rating FROM ratings", None),
+                              ("SELECT user_id, track_id FROM liked_songs", LIKE_WEIGHT)):
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                block = np.array(rows, dtype=np.float64)
+                users.append(block[:, 0].astype(np.int64))
+                tracks.append(block[:, 1].astype(np.int64))
+                weights.append(block[:, 2] / 5.0 if weight is None else np.full(len(block), weight))
+    finally:
+        cursor.close()
+    if not users:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+    return np.concatenate(users), np.concatenate(tracks), np.concatenate(weights)
+
+
+def build_matrix(user_ids, track_ids, weights):
+    """User x track CSR matrix (duplicates summed) plus the sorted track id of each column."""
+    user_index, user_pos = np.unique(user_ids, return_inverse=True)
+    track_index, track_pos = np.unique(track_ids, return_inverse=True)
+    matrix = sp.csr_matrix((weights, (user_pos, track_pos)),
+                           shape=(len(user_index), len(track_index)), dtype=np.float32)
+    matrix.sum_duplicates()
+    return matrix, track_index.astype(np.int64)
+
+
+# Set before the worker pool forks so every worker shares the matrix instead of pickling it
+_normalized = None
+_normalized_t = None
+
+
+def _top_k_chunk(args):
+    start, stop, k = args
+    block = (_normalized_t[start:stop] @ _normalized).tocsr()
+    neighbors = np.full((stop - start, k), -1, dtype=np.int32)
+    scores = np.zeros((stop - start, k), dtype=np.float32)
+    for row in range(stop - start):
+        lo, hi = block.indptr[row], block.indptr[row + 1]
+        cols = block.indices[lo:hi]
+        vals = block.data[lo:hi]
+        keep = cols != start + row
+        cols, vals = cols[keep], vals[keep]
+        if len(cols) > k:
+            part = np.argpartition(-vals, k)[:k]
+            cols, vals = cols[part], vals[part]
+        order = np.argsort(-vals, kind='stable')
+        neighbors[row, :len(order)] = cols[order]
+        scores[row, :len(order)] = vals[order]
+    return start, neighbors, scores
+
+
+def compute_similar_tracks(matrix, k=TOP_K, workers=None, chunk_size=CHUNK_SIZE):
+    """Cosine top-k neighbours per track column; returns (neighbors, scores) as column indices."""
+    global _normalized, _normalized_t
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    norms[norms == 0] = 1.0
+    _normalized = sp.csr_matrix(matrix.multiply(1.0 / norms).astype(np.float32))
+    _normalized_t = _normalized.T.tocsr()
+
+    n_tracks = matrix.shape[1]
+    neighbors = np.full((n_tracks, k), -1, dtype=np.int32)
+    scores = np.zeros((n_tracks, k), dtype=np.float32)
+    chunks = [(start, min(start + chunk_size, n_tracks), k) for start in range(0, n_tracks, chunk_size)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(chunks) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            results = pool.map(_top_k_chunk, chunks)
+            for start, chunk_neighbors, chunk_scores in results:
+                neighbors[start:start + len(chunk_neighbors)] = chunk_neighbors
+                scores[start:start + len(chunk_scores)] = chunk_scores
+    else:
+        for chunk in chunks:
+            start, chunk_neighbors, chunk_scores = _top_k_chunk(chunk)
+            neighbors[start:start + len(chunk_neighbors)] = chunk_neighbors
+            scores[start:start + len(chunk_scores)] = chunk_scores
+    _normalized = _normalized_t = None
+    return neighbors, scores
+
+
+def publish(track_index, neighbors, scores, directory=RECOMMENDATIONS_DIR):
+    """Write a build into its own directory and atomically point `current` at it."""
+    build_dir = os.path.join(directory, f"build-{int(time.time() * 1000)}")
+    os.makedirs(build_dir)
+    # Store neighbour track ids rather than column indices so lookups need no translation
+    neighbor_ids = np.where(neighbors >= 0, track_index[np.clip(neighbors, 0, None)], -1).astype(np.int32)
+    np.save(os.path.join(build_dir, 'track_ids.npy'), track_index)
+    np.save(os.path.join(build_dir, 'neighbors.npy'), neighbor_ids)
+    np.save(os.path.join(build_dir, 'scores.npy'), scores)
+
+    link = os.path.join(directory, 'current')
+    tmp_link = f"{link}.{os.getpid()}.tmp"
+    os.symlink(os.path.basename(build_dir), tmp_link)
+    os.replace(tmp_link, link)
+
+    # Keep the previous build for workers that still have it mapped
+    builds = sorted(d for d in os.listdir(directory) if d.startswith('build-'))
+    for old in builds[:-2]:
+        old_dir = os.path.join(directory, old)
+        for name in os.listdir(old_dir):
+            os.remove(os.path.join(old_dir, name))
+        os.rmdir(old_dir)
+    return build_dir
+
+
+def build(conn, k=TOP_K, workers=None, directory=RECOMMENDATIONS_DIR):
+    user_ids, track_ids, weights = load_interactions(conn)
+    matrix, track_index = build_matrix(user_ids, track_ids, weights)
+    neighbors, scores = compute_similar_tracks(matrix, k, workers)
+    return publish(track_index, neighbors, scores, directory)
+
+
+class SimilarityIndex:
+    """Memory-mapped view of the current build; reloads when `current` is swapped."""
+
+    def __init__(self, directory=RECOMMENDATIONS_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.target = None
+        self.arrays = None  # (track_ids, neighbors, scores), swapped as one tuple
+
+    def _refresh(self):
+        try:
+            target = os.readlink(os.path.join(self.directory, 'current'))
+        except OSError:
+            return False
+        if target != self.target:
+            with self.lock:
+                if target != self.target:
+                    build_dir = os.path.join(self.directory, target)
+                    self.arrays = tuple(np.load(os.path.join(build_dir, f'{name}.npy'), mmap_mode='r')
+                                        for name in ('track_ids', 'neighbors', 'scores'))
+                    self.target = target
+        return True
+
+    @property
+    def available(self):
+        return np is not None and self._refresh()
+
+    @staticmethod
+    def _row(track_ids, track_id):
+        i = int(np.searchsorted(track_ids, track_id))
+        if i < len(track_ids) and track_ids[i] == track_id:
+            return i
+        return None
+
+    def similar(self, track_id, k=10):
+        """[(track_id, score)] for the k most similar tracks."""
+        if not self.available:
+            return []
+        track_ids, neighbors, scores = self.arrays
+        row = self._row(track_ids, track_id)
+        if row is None:
+            return []
+        ids, scores = neighbors[row, :k], scores[row, :k]
+        return [(int(t), float(s)) for t, s in zip(ids, scores) if t >= 0]
+
+    def recommend(self, seed_track_ids, k=20):
+        """Score neighbours of the seed tracks by summed similarity, excluding the seeds."""
+        if not self.available:
+            return []
+        track_ids, neighbors, scores = self.arrays
+        seeds = set(seed_track_ids)
+        totals = {}
+        for track_id in seeds:
+            row = self._row(track_ids, track_id)
+            if row is None:
+                continue
+            for t, s in zip(neighbors[row], scores[row]):
+                if t < 0:
+                    break
+                t = int(t)
+                if t not in seeds:
+                    totals[t] = totals.get(t, 0.0) + float(s)
+        return sorted(totals.items(), key=lambda item: -item[1])[:k]
+
+
+def benchmark(n_ratings=1_000_000, n_users=100_000, n_tracks=20_000, k=TOP_K, workers=None):
+    """Time a build over synthetic, popularity-skewed ratings."""
+    rng = np.random.default_rng(42)
+    user_ids = rng.integers(0, n_users, n_ratings)
+    # Skewed toward popular tracks (index 0) without collapsing onto a handful of them
+    track_ids = (n_tracks * rng.random(n_ratings) ** 3).astype(np.int64)
+    weights = rng.integers(1, 6, n_ratings) / 5.0
+
+    started = time.perf_counter()
+    matrix, track_index = build_matrix(user_ids, track_ids, weights)
+    built = time.perf_counter()
+    neighbors, scores = compute_similar_tracks(matrix, k, workers)
+    done = time.perf_counter()
+    print(f"{n_ratings} ratings, {matrix.shape[0]} users x {matrix.shape[1]} tracks, k={k}, "
+          f"workers={workers or os.cpu_count()}")
+    print(f"Matrix build: {built - started:.2f}s, top-k similarity: {done - built:.2f}s, total: {done - started:.2f}s")
+    return done - started
+
+
+if __name__ == '__main__':
+    if np is None:
+        print("NumPy and SciPy are required to build recommendations")
+        sys.exit(1)
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        from dotenv import load_dotenv
+        from db_connection import get_db_connection
+        load_dotenv()
+        connection = get_db_connection()
+        os.makedirs(RECOMMENDATIONS_DIR, exist_ok=True)
+        print(f"Published recommendations to {build(connection)}")
+        connection.close()
@@ -0,0 +1,144 @@
+import gc
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+
+# Prefork launcher: one process per core sharing a single listening socket.
+#
+#   gunicorn -c gunicorn.conf.py preload, then fork WEB_CONCURRENCY gthread workers (production)
+#   python serve.py              the same without gunicorn
+#   python serve.py --benchmark  check import + create_app() + preload against STARTUP_BUDGET_SECONDS
+#
+# The parent builds the app and preloads the read-mostly data (song catalog, similarity and
+# content indexes, charts) once, then gc.freeze()s it so the collector never touches those
+# objects again and the pages stay shared copy-on-write with every worker. Each worker runs
+# the post-fork hooks (gunicorn.conf.py's post_fork does the same) and serves requests.
+#
+# Without gunicorn the workers run werkzeug's threaded development server: no request
+# timeouts, no graceful reload and no protection against slow clients, so use it where
+# gunicorn is not available. A worker that dies soon after starting is restarted after a
+# delay that doubles up to MAX_RESTART_DELAY_SECONDS, so a worker that cannot start (for
+# example the port is gone or an import fails) does not fork in a tight loop.
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', 5000))
+STARTUP_BUDGET_SECONDS = float(os.getenv('STARTUP_BUDGET_SECONDS', 2.0))
+BACKLOG = 2048
+HEALTHY_WORKER_SECONDS = 10      # A worker that lived this long resets the restart delay
+MAX_RESTART_DELAY_SECONDS = 30
+
+# .env must be loaded before Repository imports the helper modules, which read their settings at import
+load_dotenv()
+import Repository  # noqa: E402
+
+
+def worker_count():
+    return int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1))
+
+
+def listen(host=HOST, port=PORT):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock):
+    from werkzeug.serving import make_server
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    Repository.run_post_fork_hooks()
+    server = make_server(HOST, PORT, app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+
+def spawn(app, sock):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(app, sock)
+        except Exception as e:
+            print(f"Worker {os.getpid()} failed: {e}")
+        finally:
+            os._exit(1)
+    return pid
+
+
+def preloaded_app():
+    """create_app() with the read-mostly data loaded and frozen, ready to fork (also gunicorn's app)."""
+    app = Repository.create_app()
+    Repository.preload()
+    # Everything allocated so far is long-lived; keep the collector from touching (and so
+    # copying) those pages in the workers
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def main():
+    started = time.perf_counter()
+    app = preloaded_app()
+    sock = listen()
+    workers = worker_count()
+    print(f"Preloaded in {time.perf_counter() - started:.2f}s; starting {workers} workers on {HOST}:{PORT}")
+
+    children = {spawn(app, sock): time.monotonic() for _ in range(workers)}
+    restart_delay = 0
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        spawned = children.pop(pid, None)
+        if spawned is None or stopping:
+            continue
+        if time.monotonic() - spawned >= HEALTHY_WORKER_SECONDS:
+            restart_delay = 0
+        else:
+            restart_delay = min(max(restart_delay * 2, 1), MAX_RESTART_DELAY_SECONDS)
+        print(f"Worker {pid} exited with status {status}; restarting in {restart_delay}s")
+        resume = time.monotonic() + restart_delay
+        while not stopping and time.monotonic() < resume:
+            time.sleep(0.5)
+        if not stopping:
+            children[spawn(app, sock)] = time.monotonic()
+
+
+def benchmark(budget=STARTUP_BUDGET_SECONDS):
+    """Time a cold import + create_app() + preload in a fresh interpreter and compare with the budget."""
+    code = ("import time; started = time.perf_counter(); import Repository; "
+            "Repository.create_app(); created = time.perf_counter(); Repository.preload(); "
+            "print(created - started, time.perf_counter() - started)")
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout.split()
+    create_seconds, total_seconds = float(output[-2]), float(output[-1])
+    print(f"Import + create_app(): {create_seconds:.2f}s, with preload: {total_seconds:.2f}s "
+          f"(budget {budget:.2f}s)")
+    return total_seconds <= budget
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        sys.exit(0 if benchmark() else 1)
+    main()
@@ -0,0 +1,229 @@
+import os
+import socket
+import threading
+import time
+import mysql.connector
+
+# Song deletion jobs.
+#
+# Deleting a song is split in two. The request only tombstones the songs: one song_deletions
+# row per track (tagged with the job) and a song_deletion_jobs row, which is enough for every
+# read path to stop showing them (catalogs drop song_deletions ids on their next poll, SQL
+# reads filter with live_songs()). A background purger then removes the dependent rows in
+# small batches bounded by primary key, so each DELETE touches at most PURGE_BATCH_SIZE rows
+# and holds its locks for milliseconds, pausing PURGE_PAUSE_SECONDS between batches so
+# regular traffic on liked_songs/ratings/comments is not held up. The songs row goes last.
+#
+# Jobs live in MySQL, so any worker can pick up a job left behind by a restart; a running job
+# whose heartbeat is older than STALE_JOB_SECONDS is taken over. The owner heartbeats with
+# every batch and stops once its heartbeat finds another owner. Purging is idempotent, and
+# purged_tracks is counted from the purged song_deletions rows rather than incremented.
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 500))
+PURGE_PAUSE_SECONDS = float(os.getenv('PURGE_PAUSE_SECONDS', 0.05))
+PURGE_POLL_SECONDS = float(os.getenv('PURGE_POLL_SECONDS', 30))
+STALE_JOB_SECONDS = 120
+MAX_TRACKS_PER_JOB = 1000
+
+# Tables referencing songs(track_id), purged in this order (likes first: they show in user lists)
+DEPENDENT_TABLES = ('liked_songs', 'ratings', 'comments')
+
+
+class JobLost(Exception):
+    """Another worker took over the job after this one missed its heartbeats."""
+
+
+def live_songs(alias='songs'):
+    """SQL condition excluding tombstoned songs; alias is the songs table's name in the query."""
+    return f"NOT EXISTS (SELECT 1 FROM song_deletions sd WHERE sd.track_id = {alias}.track_id)"
+
+
+def tombstone(cursor, track_ids):
+    """Create a job for the existing songs among track_ids and hide them; return (job_id, found ids).
+
+    Runs in the caller's transaction; the caller commits.
+    """
+    placeholders = ', '.join(['%s'] * len(track_ids))
+    cursor.execute(f"SELECT track_id FROM songs WHERE track_id IN ({placeholders}) AND {live_songs()}",
+                   list(track_ids))
+    found = sorted(row[0] if not isinstance(row, dict) else row['track_id'] for row in cursor.fetchall())
+    if not found:
+        return None, []
+    cursor.execute("INSERT INTO song_deletion_jobs (total_tracks) VALUES (%s)", (len(found),))
+    job_id = cursor.lastrowid
+    cursor.executemany("""
+        INSERT INTO song_deletions (track_id, job_id) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE job_id = VALUES(job_id), deleted_at = CURRENT_TIMESTAMP, purged_at = NULL
+    """, [(track_id, job_id) for track_id in found])
+    return job_id, found
+
+
+def job_progress(cursor, job_id):
+    """Job status and counters for the progress endpoint, or None. cursor must be a dictionary cursor."""
+    cursor.execute("""
+        SELECT id, status, total_tracks, purged_tracks, purged_rows, error, created_at, updated_at, finished_at
+        FROM song_deletion_jobs WHERE id = %s
+    """, (job_id,))
+    job = cursor.fetchone()
+    if job:
+        job['progress'] = round(job['purged_tracks'] / job['total_tracks'], 4) if job['total_tracks'] else 1.0
+    return job
+
+
+class SongPurger:
+    """Background thread that claims pending deletion jobs and purges their songs batch by batch."""
+
+    def __init__(self, connection_factory, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE_SECONDS):
+        self.connection_factory = connection_factory
+        self.batch_size = batch_size
+        self.pause = pause
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def wake(self):
+        """Start the purger if needed and have it look for jobs now."""
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, daemon=True)
+                    self.thread.start()
+        self.wakeup.set()
+
+    def after_fork(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(PURGE_POLL_SECONDS)
+            self.wakeup.clear()
+            try:
+                conn = self.connection_factory()
+                try:
+                    while self.run_next_job(conn):
+                        pass
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"Song purger error: {e}")
+
+    def run_next_job(self, conn):
+        """Claim and finish one job; return False when there is nothing to do."""
+        job_id = self._claim(conn)
+        if job_id is None:
+            return False
+        try:
+            self.purge_job(conn, job_id)
+        except JobLost as e:
+            print(f"Song deletion job {job_id} stopped: {e}")
+        except Exception as e:
+            print(f"Song deletion job {job_id} failed: {e}")
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE song_deletion_jobs SET status = 'failed', error = %s, owner = NULL
+                WHERE id = %s AND owner = %s
+            """, (str(e)[:1000], job_id, self.owner))
+            cursor.close()
+        return True
+
+    def _claim(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT id FROM song_deletion_jobs
+                WHERE status = 'pending'
+                   OR (status = 'running' AND heartbeat_at < NOW() - INTERVAL %s SECOND)
+                ORDER BY id LIMIT 1
+            """, (STALE_JOB_SECONDS,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            # Only one worker wins the conditional update
+            cursor.execute("""
+                UPDATE song_deletion_jobs SET status = 'running', owner = %s, heartbeat_at = NOW()
+                WHERE id = %s AND (status = 'pending'
+                    OR (status = 'running' AND heartbeat_at < NOW() - INTERVAL %s SECOND))
+            """, (self.owner, row[0], STALE_JOB_SECONDS))
+            return row[0] if cursor.rowcount == 1 else None
+        finally:
+            cursor.close()
+
+    def purge_job(self, conn, job_id):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT track_id FROM song_deletions WHERE job_id = %s AND purged_at IS NULL ORDER BY track_id",
+                           (job_id,))
+            track_ids = [row[0] for row in cursor.fetchall()]
+            for track_id in track_ids:
+                rows = self.purge_track(cursor, job_id, track_id)
+                cursor.execute("UPDATE song_deletions SET purged_at = NOW() WHERE track_id = %s", (track_id,))
+                cursor.execute("""
+                    UPDATE song_deletion_jobs
+                    SET purged_tracks = (SELECT COUNT(*) FROM song_deletions
+                                         WHERE job_id = %s AND purged_at IS NOT NULL),
+                        purged_rows = purged_rows + %s, heartbeat_at = NOW()
+                    WHERE id = %s AND owner = %s
+                """, (job_id, rows, job_id, self.owner))
+                self._check_owner(cursor, job_id)
+            cursor.execute("""
+                UPDATE song_deletion_jobs SET status = 'done', owner = NULL, finished_at = NOW()
+                WHERE id = %s AND owner = %s
+            """, (job_id, self.owner))
+        finally:
+            cursor.close()
+
+    def purge_track(self, cursor, job_id, track_id):
+        """Delete one song and its dependent rows; return the number of rows removed."""
+        removed = self._purge_dependents(cursor, job_id, track_id)
+        try:
+            cursor.execute("DELETE FROM songs WHERE track_id = %s", (track_id,))
+        except mysql.connector.IntegrityError:
+            # A like/rating/comment was added to the tombstoned song while it was being purged
+            removed += self._purge_dependents(cursor, job_id, track_id)
+            cursor.execute("DELETE FROM songs WHERE track_id = %s", (track_id,))
+        return removed + cursor.rowcount
+
+    def _heartbeat(self, cursor, job_id):
+        cursor.execute("UPDATE song_deletion_jobs SET heartbeat_at = NOW() WHERE id = %s AND owner = %s",
+                       (job_id, self.owner))
+        self._check_owner(cursor, job_id)
+
+    def _check_owner(self, cursor, job_id):
+        """Raise JobLost unless the UPDATE just run (... WHERE owner = self.owner) found the job."""
+        if cursor.rowcount == 1:
+            return
+        # rowcount counts changed rows: a heartbeat within the same second changes nothing
+        cursor.execute("SELECT owner FROM song_deletion_jobs WHERE id = %s", (job_id,))
+        row = cursor.fetchone()
+        if row is None or row[0] != self.owner:
+            raise JobLost("another worker took the job over")
+
+    def _purge_dependents(self, cursor, job_id, track_id):
+        removed = 0
+        for table in DEPENDENT_TABLES:
+            last_user = -1
+            while True:
+                # The walk uses the track_id foreign-key index, which is ordered by (track_id, user_id);
+                # the delete is then a set of primary-key lookups
+                cursor.execute(f"""
+                    SELECT user_id FROM {table}
+                    WHERE track_id = %s AND user_id > %s
+                    ORDER BY user_id LIMIT %s
+                """, (track_id, last_user, self.batch_size))
+                user_ids = [row[0] for row in cursor.fetchall()]
+                if not user_ids:
+                    break
+                placeholders = ', '.join(['%s'] * len(user_ids))
+                cursor.execute(f"DELETE FROM {table} WHERE track_id = %s AND user_id IN ({placeholders})",
+                               [track_id] + user_ids)
+                removed += cursor.rowcount
+                last_user = user_ids[-1]
+                if len(user_ids) < self.batch_size:
+                    break
+                # A heavily referenced song takes many batches; keep the claim alive between them
+                self._heartbeat(cursor, job_id)
+                time.sleep(self.pause)
+        return removed
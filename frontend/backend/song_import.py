@@ -0,0 +1,349 @@
+import csv
+import json
+import os
+import socket
+import tempfile
+import threading
+from song_deletion import live_songs, JobLost, STALE_JOB_SECONDS
+
+# Bulk song import from CSV (header row) or NDJSON (one object per line).
+#
+# The upload is spooled to a temporary file while the request reads it; the request then
+# returns a job id and a background thread parses, validates and inserts the rows, so no
+# request worker waits for the database. Rows go in with one multi-row INSERT per BATCH_SIZE
+# rows after dropping those whose (track_name, artist_name) already exists, in the catalog
+# or earlier in the same file. Progress and the first MAX_REPORTED_ERRORS row errors are kept
+# in song_import_jobs, so any worker can answer progress requests.
+#
+# Jobs are claimed like song deletion jobs: the owner heartbeats with every batch, and a job
+# whose owner stopped for STALE_JOB_SECONDS is resumed by another worker on the host holding
+# the spooled file, after the rows already reported (each batch commits with its progress).
+# One import runs at a time (the LOCK_NAME named lock), so the duplicate check cannot race
+# with another import's inserts.
+#
+# Columns use the songs table names or add_song's camelCase names (trackName, artistName, ...).
+BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+MAX_UPLOAD_BYTES = int(os.getenv('IMPORT_MAX_UPLOAD_BYTES', 200 * 1024 * 1024))
+MAX_REPORTED_ERRORS = 1000
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+IMPORT_POLL_SECONDS = float(os.getenv('IMPORT_POLL_SECONDS', 30))
+LOCK_NAME = 'song_import'
+
+SONG_FIELDS = ('track_name', 'artist_name', 'album_name', 'album_image', 'rating', 'genres', 'audio_url')
+FIELD_ALIASES = {'trackName': 'track_name', 'artistName': 'artist_name', 'albumName': 'album_name',
+                 'albumImage': 'album_image', 'audioUrl': 'audio_url', 'genre': 'genres'}
+REQUIRED_FIELDS = ('track_name', 'artist_name')
+MAX_LENGTHS = {'track_name': 255, 'artist_name': 255, 'album_name': 255, 'album_image': 255,
+               'genres': 50, 'audio_url': 255}
+FORMATS = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson',
+           'application/ndjson': 'ndjson'}
+
+
+STAT_FIELDS = ('total_rows', 'inserted_rows', 'duplicate_rows', 'error_rows')
+JOB_COLUMNS = ('id', 'format', 'spool_host', 'spool_path', 'errors') + STAT_FIELDS
+
+
+class UploadRejected(ValueError):
+    """Upload rejected before a job is created (bad format, too large)."""
+
+
+class ImportStopped(Exception):
+    """A claimed job cannot be run (its spooled upload is gone)."""
+
+
+def detect_format(content_type, requested=None):
+    fmt = requested or FORMATS.get((content_type or '').split(';')[0].strip().lower())
+    if fmt not in ('csv', 'ndjson'):
+        raise UploadRejected("Send text/csv or application/x-ndjson, or pass format=csv|ndjson")
+    return fmt
+
+
+def spool_upload(stream, max_bytes=MAX_UPLOAD_BYTES):
+    """Copy the request body to a temporary file in chunks; return its path."""
+    handle, path = tempfile.mkstemp(prefix='song-import-', suffix='.upload')
+    size = 0
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(f"Upload larger than {max_bytes} bytes")
+                f.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    if size == 0:
+        os.unlink(path)
+        raise UploadRejected("Empty upload")
+    return path
+
+
+def read_rows(f, fmt):
+    """Yield (row number, dict or None, parse error) from a text file."""
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(f), start=1):
+            yield number, row, None
+        return
+    for number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "Each line must be a JSON object"
+            continue
+        yield number, row, None
+
+
+def validate(row):
+    """Song values tuple in SONG_FIELDS order, or raise ValueError with the reason."""
+    song = {}
+    for key, value in row.items():
+        if key is None:
+            raise ValueError("More values than header columns")
+        song[FIELD_ALIASES.get(key, key)] = value
+    values = []
+    for field in SONG_FIELDS:
+        value = song.get(field)
+        if field == 'rating':
+            try:
+                value = int(value) if value not in (None, '') else 0
+            except (TypeError, ValueError):
+                raise ValueError("rating must be an integer")
+            if not 0 <= value <= 5:
+                raise ValueError("rating must be between 0 and 5")
+        else:
+            value = '' if value is None else str(value).strip()
+            if field in REQUIRED_FIELDS and not value:
+                raise ValueError(f"Missing required field: {field}")
+            if len(value) > MAX_LENGTHS[field]:
+                raise ValueError(f"{field} is longer than {MAX_LENGTHS[field]} characters")
+        values.append(value)
+    return tuple(values)
+
+
+def dedupe_key(track_name, artist_name):
+    # The songs columns use a case-insensitive collation; match it
+    return track_name.casefold(), artist_name.casefold()
+
+
+class SongImporter:
+    """Background thread that claims import jobs and inserts their rows; on_insert(cursor, songs) sees each inserted batch."""
+
+    def __init__(self, connection_factory, on_insert=None, batch_size=BATCH_SIZE):
+        self.connection_factory = connection_factory
+        self.on_insert = on_insert
+        self.batch_size = batch_size
+        self.host = socket.gethostname()
+        self.owner = f"{self.host}:{os.getpid()}"
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self, path, fmt):
+        """Create the job row for the upload spooled at path and have the importer look for it; return the job id."""
+        conn = self.connection_factory()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO song_import_jobs (format, spool_host, spool_path) VALUES (%s, %s, %s)",
+                           (fmt, self.host, path))
+            job_id = cursor.lastrowid
+            cursor.close()
+        finally:
+            conn.close()
+        self.wake()
+        return job_id
+
+    def wake(self):
+        """Start the importer if needed and have it look for jobs now."""
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, daemon=True)
+                    self.thread.start()
+        self.wakeup.set()
+
+    def after_fork(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.owner = f"{self.host}:{os.getpid()}"
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(IMPORT_POLL_SECONDS)
+            self.wakeup.clear()
+            try:
+                conn = self.connection_factory()
+                try:
+                    while self.run_next_job(conn):
+                        pass
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"Song importer error: {e}")
+
+    def run_next_job(self, conn):
+        """Claim and run one job under the import lock; return False when there is nothing to do."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+            if cursor.fetchall()[0][0] != 1:
+                return False  # Another worker is importing; this host's jobs wait for the next wakeup
+            try:
+                job = self._claim(cursor)
+                if job is not None:
+                    self.run(conn, job)
+            finally:
+                # The lock belongs to the session, which outlives close() on a pooled connection
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                cursor.fetchall()
+            return job is not None
+        finally:
+            cursor.close()
+
+    def _claim(self, cursor):
+        """Take the next job spooled on this host: pending, or running with a worker that stopped heartbeating."""
+        cursor.execute(f"""
+            SELECT {', '.join(JOB_COLUMNS)} FROM song_import_jobs
+            WHERE spool_host = %s AND (status = 'pending'
+                OR (status = 'running' AND heartbeat_at < NOW() - INTERVAL %s SECOND))
+            ORDER BY id LIMIT 1
+        """, (self.host, STALE_JOB_SECONDS))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        # Only one worker wins the conditional update
+        cursor.execute("""
+            UPDATE song_import_jobs SET status = 'running', owner = %s, heartbeat_at = NOW()
+            WHERE id = %s AND (status = 'pending'
+                OR (status = 'running' AND heartbeat_at < NOW() - INTERVAL %s SECOND))
+        """, (self.owner, job['id'], STALE_JOB_SECONDS))
+        return job if cursor.rowcount == 1 else None
+
+    def run(self, conn, job):
+        """Import a claimed job, resuming after the rows a previous owner already reported."""
+        job_id, path, fmt = job['id'], job['spool_path'], job['format']
+        stats = {field: job[field] for field in STAT_FIELDS}
+        errors = json.loads(job['errors']) if job['errors'] else []
+        resume_after = stats["total_rows"]
+        cursor = conn.cursor()
+        try:
+            if job['spool_host'] != self.host or not path or not os.path.exists(path):
+                raise ImportStopped(f"the upload is no longer available on {job['spool_host']}")
+            seen = set()
+            batch = []
+            with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+                for index, (number, row, error) in enumerate(read_rows(f, fmt)):
+                    if index < resume_after:
+                        continue
+                    stats["total_rows"] += 1
+                    if error is None:
+                        try:
+                            song = validate(row)
+                        except ValueError as e:
+                            error = str(e)
+                    if error is not None:
+                        stats["error_rows"] += 1
+                        if len(errors) < MAX_REPORTED_ERRORS:
+                            errors.append({"row": number, "error": error})
+                        continue
+                    key = dedupe_key(song[0], song[1])
+                    if key in seen:
+                        stats["duplicate_rows"] += 1
+                        continue
+                    seen.add(key)
+                    batch.append(song)
+                    if len(batch) >= self.batch_size:
+                        self._commit_batch(conn, cursor, job_id, batch, stats, errors, 'running')
+                        batch = []
+            self._commit_batch(conn, cursor, job_id, batch, stats, errors, 'done')
+        except JobLost as e:
+            print(f"Song import job {job_id} stopped: {e}")
+            return
+        except Exception as e:
+            print(f"Song import job {job_id} failed: {e}")
+            errors.append({"row": None, "error": f"Import stopped: {e}"})
+            try:
+                self._report(cursor, job_id, 'failed', stats, errors)
+            except Exception as report_error:
+                print(f"Could not record failure of import job {job_id}: {report_error}")
+        finally:
+            cursor.close()
+        if path and os.path.exists(path):
+            os.unlink(path)
+
+    def _commit_batch(self, conn, cursor, job_id, batch, stats, errors, status):
+        """Insert batch and record the progress in one transaction, so a resumed job neither skips nor repeats rows."""
+        conn.start_transaction()
+        try:
+            songs = self._insert_batch(cursor, batch)
+            progress = dict(stats, inserted_rows=stats["inserted_rows"] + len(songs),
+                            duplicate_rows=stats["duplicate_rows"] + len(batch) - len(songs))
+            if not self._report(cursor, job_id, status, progress, errors):
+                raise JobLost("another worker took the job over")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        stats.update(progress)
+        if songs and self.on_insert is not None:
+            # The rows are committed; a failing hook must not fail the import
+            try:
+                self.on_insert(cursor, songs)
+            except Exception as e:
+                print(f"Song import job {job_id}: on_insert hook failed: {e}")
+
+    def _insert_batch(self, cursor, batch):
+        """Insert the songs of batch not already in the catalog; return them as dicts with their track_id."""
+        if not batch:
+            return []
+        pairs = ', '.join(['(%s, %s)'] * len(batch))
+        names = [value for song in batch for value in song[:2]]
+        cursor.execute(f"""
+            SELECT track_name, artist_name FROM songs
+            WHERE (track_name, artist_name) IN ({pairs}) AND {live_songs()}
+        """, names)
+        existing = {dedupe_key(*row) for row in cursor.fetchall()}
+        new = [song for song in batch if dedupe_key(song[0], song[1]) not in existing]
+        if not new:
+            return []
+        placeholders = ', '.join(['(' + ', '.join(['%s'] * len(SONG_FIELDS)) + ')'] * len(new))
+        cursor.execute(f"INSERT INTO songs ({', '.join(SONG_FIELDS)}) VALUES {placeholders}",
+                       [value for song in new for value in song])
+        # LAST_INSERT_ID(): a multi-row INSERT gets one consecutive block of ids, in VALUES order
+        first_id = cursor.lastrowid
+        return [dict(zip(SONG_FIELDS, song), track_id=first_id + i) for i, song in enumerate(new)]
+
+    def _report(self, cursor, job_id, status, stats, errors):
+        """Record progress (and heartbeat) for a job this worker owns; False if it no longer does."""
+        finished = status in ('done', 'failed')
+        cursor.execute("""
+            UPDATE song_import_jobs
+            SET status = %s, total_rows = %s, inserted_rows = %s, duplicate_rows = %s, error_rows = %s,
+                errors = %s, heartbeat_at = NOW(), owner = IF(%s, NULL, owner),
+                finished_at = IF(%s, NOW(), NULL)
+            WHERE id = %s AND owner = %s
+        """, (status, stats["total_rows"], stats["inserted_rows"], stats["duplicate_rows"], stats["error_rows"],
+              json.dumps(errors), finished, finished, job_id, self.owner))
+        return cursor.rowcount == 1
+
+
+def job_progress(cursor, job_id):
+    """Import job status, counters and row errors, or None. cursor must be a dictionary cursor."""
+    cursor.execute("""
+        SELECT id, format, status, total_rows, inserted_rows, duplicate_rows, error_rows, errors,
+               created_at, updated_at, finished_at
+        FROM song_import_jobs WHERE id = %s
+    """, (job_id,))
+    job = cursor.fetchone()
+    if job:
+        job['errors'] = json.loads(job['errors']) if job['errors'] else []
+    return job
@@ -7,12 +7,15 @@ from yt_dlp import YoutubeDL
 import time
 import mysql.connector
 from concurrent.futures import ThreadPoolExecutor
+from crawl_state import CrawlState
 
 load_dotenv()
 
 client_id = os.getenv("CLIENT_ID")
 client_secret = os.getenv("CLIENT_SECRET")
 # connection_string = os.getenv("MYSQL_DATABASE_CONNECTION_STRING")
+# Artists crawled completely within this window are skipped; older ones are re-checked for new albums only
+refresh_after_hours = float(os.getenv("CRAWL_REFRESH_HOURS", "24"))
 
 def get_token():
     auth_string = client_id + ":" + client_secret
@@ -120,7 +123,7 @@ def save_track_to_db(cursor, conn, track_info):
     ))
     conn.commit()
 
-def process_artists(artist_list, genre_name, start_index):
+def process_artists(artist_list, genre_name, start_index, state):
     token = get_token()
     conn = get_db_connection()
     cursor = conn.cursor(buffered=True)
@@ -129,33 +132,65 @@ def process_artists(artist_list, genre_name, start_index):
     try:
         for i, artist_name in enumerate(artist_list):
             full_index = start_index + i
-            artist_data = search_for_artist(token, artist_name)
-            if not artist_data:
-                print(f"[{genre_name}] No artist found: {artist_name}")
+            if state.is_fresh(artist_name, refresh_after_hours * 3600):
+                print(f"[{genre_name}] Up to date, skipping: {artist_name}")
                 continue
 
-            print(f"[{genre_name}] Artist found: {artist_data['name']}")
-            albums = get_artist_albums(token, artist_data["id"])
+            # Reuse the artist id from a previous run instead of searching again
+            known = state.get_artist(artist_name)
+            if known and known["artist_id"]:
+                artist_id = known["artist_id"]
+                print(f"[{genre_name}] Resuming artist: {artist_name}")
+            else:
+                artist_data = search_for_artist(token, artist_name)
+                if not artist_data:
+                    print(f"[{genre_name}] No artist found: {artist_name}")
+                    continue
+                artist_id = artist_data["id"]
+                print(f"[{genre_name}] Artist found: {artist_data['name']}")
 
-            for album in albums:
+            state.start_artist(artist_name, artist_id, genre_name)
+            seen = state.seen_albums(artist_id)
+            albums = get_artist_albums(token, artist_id)
+            new_albums = [album for album in albums if album["id"] not in seen]
+            print(f"[{genre_name}] {len(new_albums)} new of {len(albums)} albums for {artist_name}")
+            incomplete_albums = 0
+
+            for album in new_albums:
                 print(f"[{genre_name}] Album: {album['name']}")
                 tracks = get_album_tracks(token, album["id"])
+                failed_tracks = 0
 
                 for track in tracks:
+                    if track_exists(cursor, track["track_name"], track["artist_name"]):
+                        print(f"[{genre_name}] Duplicate skipped: {track['track_name']}")
+                        continue
+
                     time.sleep(0.5)
                     audio_url = get_audio_url(track["track_name"], track["artist_name"]) or "https://example.com/placeholder-audio.mp3"
                     track["audio_url"] = audio_url
                     track["genre"] = genre_name
 
-                    if not track_exists(cursor, track["track_name"], track["artist_name"]):
-                        try:
-                            save_track_to_db(cursor, conn, track)
-                            print(f"[{genre_name}] Saved: {track['track_name']}, {track['artist_name']}")
-                        except mysql.connector.Error as err:
-                            print(f"Database error: {err}")
-                            continue
-                    else:
-                        print(f"[{genre_name}] Duplicate skipped: {track['track_name']}")
+                    try:
+                        save_track_to_db(cursor, conn, track)
+                        print(f"[{genre_name}] Saved: {track['track_name']}, {track['artist_name']}")
+                    except mysql.connector.Error as err:
+                        print(f"Database error: {err}")
+                        failed_tracks += 1
+                        continue
+
+                # An album (and so the artist) only counts as done once every track was saved
+                # or already there; otherwise the next run processes it again
+                if failed_tracks:
+                    print(f"[{genre_name}] {failed_tracks} of {len(tracks)} tracks failed, will retry: {album['name']}")
+                    incomplete_albums += 1
+                    continue
+                state.mark_album(album["id"], artist_id, album["name"], len(tracks))
+
+            if incomplete_albums:
+                print(f"[{genre_name}] {incomplete_albums} albums incomplete, not marking as crawled: {artist_name}")
+                continue
+            state.finish_artist(artist_name)
 
     except Exception as e:
         print(f"[{genre_name}] Error occurred: {e}")
@@ -240,11 +275,14 @@ if __name__ == "__main__":
         exit(1)
 
     # Launch threads per genre
+    state = CrawlState()
+
     print("Launching threads...")
     start_index = 0
     with ThreadPoolExecutor(max_workers=3) as executor:
         for genre, artist_list in genres_artists.items():
-            executor.submit(process_artists, artist_list, genre, start_index)
+            executor.submit(process_artists, artist_list, genre, start_index, state)
             start_index += len(artist_list)
 
     print("All threads launched.")
+    state.close()
@@ -0,0 +1,124 @@
+import threading
+import time
+import pytest
+from admission import AdmissionController, ClientBuckets, Rejected, RouteClass, client_address
+
+# Bucket tests pass their own clock; the controller tests use real (short) queue budgets.
+
+
+def controller(*classes, rate=1000, burst=1000):
+    return AdmissionController(list(classes), ClientBuckets(rate=rate, burst=burst))
+
+
+def test_bucket_spends_its_burst_then_reports_the_wait():
+    buckets = ClientBuckets(rate=2, burst=4)
+    assert buckets.take('a', 3, now=0) == 0
+    assert buckets.take('a', 1, now=0) == 0
+    assert buckets.take('a', 1, now=0) == pytest.approx(0.5)
+    # Other clients have their own bucket
+    assert buckets.take('b', 4, now=0) == 0
+
+
+def test_bucket_refills_at_its_rate_up_to_the_burst():
+    buckets = ClientBuckets(rate=2, burst=4)
+    buckets.take('a', 4, now=0)
+    assert buckets.take('a', 2, now=1) == 0
+    assert buckets.take('a', 1, now=1) == pytest.approx(0.5)
+    assert buckets.take('a', 4, now=100) == 0
+    assert buckets.take('a', 1, now=100) == pytest.approx(0.5)
+
+
+def test_full_buckets_are_pruned_when_too_many_clients_are_tracked():
+    buckets = ClientBuckets(rate=1, burst=2, max_clients=2)
+    buckets.take('idle', 1, now=0)
+    buckets.take('busy', 2, now=9)
+    buckets.take('new', 1, now=10)
+    assert set(buckets.buckets) == {'busy', 'new'}
+    # Nothing refilled: everything is dropped rather than growing past max_clients
+    buckets.take('another', 2, now=10)
+    assert set(buckets.buckets) == {'another'}
+
+
+def test_client_address_trusts_only_the_configured_proxy_hops():
+    assert client_address('10.0.0.1', None, hops=1) == '10.0.0.1'
+    assert client_address('10.0.0.1', '1.2.3.4', hops=1) == '1.2.3.4'
+    # A client-supplied entry left of the proxy's own is ignored
+    assert client_address('10.0.0.1', 'spoofed, 1.2.3.4', hops=1) == '1.2.3.4'
+    assert client_address('10.0.0.1', 'spoofed, 1.2.3.4, 10.0.0.2', hops=2) == '1.2.3.4'
+    assert client_address('10.0.0.1', '1.2.3.4', hops=2) == '10.0.0.1'
+    assert client_address('10.0.0.1', '1.2.3.4', hops=0) == '10.0.0.1'
+
+
+def test_empty_bucket_is_rejected_with_429():
+    reads = RouteClass('reads', limit=4, queue_budget_ms=10, cost=2)
+    admission = controller(reads, rate=1, burst=3)
+    admission.release(admission.admit('reads', 'a'))
+    with pytest.raises(Rejected) as rejected:
+        admission.admit('reads', 'a')
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after == 1
+    assert reads.in_flight == 0 and reads.waiting == 0
+
+
+def test_full_class_sheds_with_503_after_its_queue_budget():
+    search = RouteClass('search', limit=1, queue_budget_ms=20)
+    admission = controller(search)
+    token = admission.admit('search', 'a')
+    started = time.monotonic()
+    with pytest.raises(Rejected) as rejected:
+        admission.admit('search', 'b')
+    assert time.monotonic() - started >= 0.02
+    assert rejected.value.status == 503 and rejected.value.retry_after >= 1
+    admission.release(token)
+    stats = admission.stats()['search']
+    assert stats['admitted'] == 1 and stats['shed'] == 1 and stats['in_flight'] == 0
+
+
+def test_waiting_request_gets_the_released_slot():
+    reads = RouteClass('reads', limit=1, queue_budget_ms=2000)
+    admission = controller(reads)
+    token = admission.admit('reads', 'a')
+    tokens = []
+    waiter = threading.Thread(target=lambda: tokens.append(admission.admit('reads', 'b')))
+    waiter.start()
+    while reads.waiting == 0:
+        time.sleep(0.001)
+    admission.release(token)
+    waiter.join(timeout=2)
+    assert len(tokens) == 1 and reads.in_flight == 1
+
+
+def test_lower_classes_are_shed_while_a_higher_class_waits():
+    reads = RouteClass('reads', limit=1, queue_budget_ms=2000)
+    search = RouteClass('search', limit=4, queue_budget_ms=2000, rank=1)
+    admission = controller(reads, search)
+    token = admission.admit('reads', 'a')
+    assert admission.admit('search', 'a')  # Nothing waiting above it
+    waiter = threading.Thread(target=lambda: admission.release(admission.admit('reads', 'b')))
+    waiter.start()
+    while reads.waiting == 0:
+        time.sleep(0.001)
+    started = time.monotonic()
+    with pytest.raises(Rejected) as rejected:
+        admission.admit('search', 'c')
+    # Shed at once instead of queueing for its budget
+    assert rejected.value.status == 503 and time.monotonic() - started < 1
+    admission.release(token)
+    waiter.join(timeout=2)
+    assert reads.in_flight == 0
+
+
+def test_classes_of_the_same_rank_only_queue_against_their_own_limit():
+    reads = RouteClass('reads', limit=1, queue_budget_ms=2000)
+    writes = RouteClass('writes', limit=1, queue_budget_ms=2000)
+    admission = controller(reads, writes)
+    token = admission.admit('reads', 'a')
+    waiter = threading.Thread(target=lambda: admission.release(admission.admit('reads', 'b')))
+    waiter.start()
+    while reads.waiting == 0:
+        time.sleep(0.001)
+    # A GET waiting for a read slot does not shed writes while write slots are free
+    admission.release(admission.admit('writes', 'c'))
+    assert writes.shed == 0
+    admission.release(token)
+    waiter.join(timeout=2)
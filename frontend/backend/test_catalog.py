@@ -0,0 +1,160 @@
+import json
+import os
+import pytest
+
+pytest.importorskip('numpy')
+
+import catalog  # noqa: E402
+from catalog import CatalogColumns, SongCatalog, LIST_COLUMNS  # noqa: E402
+
+
+def row(track_id, name, artist='Artist', album='Album', genres='pop', rating=None):
+    return (track_id, name, artist, album, f'https://i.scdn.co/{album}', genres, f'https://audio/{track_id}', rating)
+
+
+SONGS = [
+    row(3, 'Yesterday', 'The Beatles', 'Help!', 'rock', 5),
+    row(1, 'Come Together', 'The Beatles', 'Abbey Road', 'rock', 4),
+    row(2, 'So What', 'Miles Davis', 'Kind of Blue', 'jazz'),
+    row(4, 'Blue in Green', 'Miles Davis', 'Kind of Blue', 'jazz', 3),
+]
+
+
+@pytest.fixture
+def db(fake_db):
+    fake_db.songs = list(SONGS)
+    fake_db.changed = []
+    fake_db.deleted = []
+    fake_db.route('SELECT track_id FROM song_deletions', lambda *_: [(track_id,) for track_id in fake_db.deleted])
+    fake_db.route('updated_at', lambda *_: fake_db.changed)
+    fake_db.route('FROM songs', lambda *_: fake_db.songs)
+    return fake_db
+
+
+@pytest.fixture
+def song_catalog(tmp_path, db):
+    songs = SongCatalog(directory=str(tmp_path), poll_seconds=0)
+    assert songs.ready(db.connect)
+    return songs
+
+
+def names(songs):
+    return [song.track_name for song in songs]
+
+
+def test_columns_intern_strings_and_keep_rows_by_track_id():
+    columns = CatalogColumns.build(SONGS, 0)
+    assert list(columns.track_ids) == [1, 2, 3, 4]
+    # 'Miles Davis', 'Kind of Blue', its image URL and 'jazz' are stored once for two songs
+    assert columns.codes[1, 1] == columns.codes[3, 1]
+    assert columns.codes[1, 2] == columns.codes[3, 2]
+    assert columns.row(4) == 3 and columns.row(5) is None
+    assert columns.string(int(columns.codes[0, 0])) == 'Come Together'
+
+
+def test_views_match_the_source_rows(song_catalog):
+    song = song_catalog.get(3)
+    assert song.to_dict() == dict(zip(catalog.COLUMNS, SONGS[0]))
+    assert song_catalog.get(2).rating is None
+    assert song_catalog.get(99) is None
+    assert [s.track_id for s in song_catalog.get_many([4, 99, 1])] == [4, 1]
+
+
+def test_snapshot_is_reopened_by_the_next_worker(tmp_path, song_catalog, db):
+    db.songs = []
+    reopened = SongCatalog(directory=str(tmp_path), poll_seconds=0)
+    assert reopened.ready(db.connect)
+    assert names(reopened.all_songs()) == names(song_catalog.all_songs())
+
+
+def test_all_songs_are_ordered_by_name_with_the_overlay_merged_in(song_catalog):
+    assert names(song_catalog.all_songs()) == ['Blue in Green', 'Come Together', 'So What', 'Yesterday']
+    song_catalog.apply(changed=[row(5, 'Anthem'), row(2, 'Zebra', 'Miles Davis')], deleted=[1])
+    assert names(song_catalog.all_songs()) == ['Anthem', 'Blue in Green', 'Yesterday', 'Zebra']
+    assert song_catalog.get(1) is None
+    assert song_catalog.get(2).track_name == 'Zebra'
+
+
+def test_search_ranks_exact_matches_first_and_sees_the_overlay(song_catalog):
+    assert names(song_catalog.search('miles davis')) == ['Blue in Green', 'So What']
+    assert names(song_catalog.search('YESTERDAY')) == ['Yesterday']
+    assert [s.track_id for s in song_catalog.search('blue')] == [4, 2]
+    song_catalog.apply(changed=[row(6, 'Blue'), row(4, 'Green', 'Miles Davis', 'Kind of Red')], deleted=[2])
+    assert names(song_catalog.search('blue')) == ['Blue']
+    assert song_catalog.search('a\nb') == []
+
+
+def test_poll_applies_changes_and_deletions(song_catalog, db):
+    db.changed = [row(7, 'New Song')]
+    db.deleted = [3]
+    song_catalog.ready(db.connect)
+    assert song_catalog.get(7).track_name == 'New Song'
+    assert song_catalog.get(3) is None
+    assert song_catalog.watermark == db.now
+    since = db.now - catalog.COMMIT_LAG_SECONDS  # The load and the poll read the same clock
+    assert db.params('updated_at >= FROM_UNIXTIME')[-1] == [since]
+    assert db.params('FROM song_deletions WHERE deleted_at')[-1] == [since]
+
+
+def test_compaction_folds_the_overlay_into_a_new_snapshot(tmp_path, song_catalog, db):
+    song_catalog.apply(changed=[row(5, 'Anthem'), row(2, 'Zebra')], deleted=[1])
+    before = names(song_catalog.all_songs())
+    song_catalog.compact()
+    assert song_catalog.overlay == {}
+    assert list(song_catalog.columns.track_ids) == [2, 3, 4, 5]
+    assert names(song_catalog.all_songs()) == before
+    reopened = SongCatalog(directory=str(tmp_path), poll_seconds=0)
+    db.songs = []
+    assert reopened.ready(db.connect)
+    assert names(reopened.all_songs()) == before
+
+
+def test_compaction_keeps_changes_made_while_it_ran(song_catalog, monkeypatch):
+    song_catalog.apply(changed=[row(5, 'Anthem')])
+    build = CatalogColumns.build
+
+    def build_during_edit(songs, as_of):
+        song_catalog.apply(changed=[row(6, 'Late Edit')], deleted=[5])
+        return build(songs, as_of)
+    monkeypatch.setattr(CatalogColumns, 'build', staticmethod(build_during_edit))
+    song_catalog.compact()
+    assert set(song_catalog.overlay) == {5, 6}
+    assert song_catalog.get(5) is None
+    assert song_catalog.get(6).track_name == 'Late Edit'
+
+
+def test_encoded_bodies_are_rebuilt_only_when_the_catalog_changes(song_catalog):
+    calls = []
+
+    def encode(songs):
+        calls.append(len(songs))
+        return json.dumps(songs)
+    version, body = song_catalog.all_songs_encoded('json', encode)
+    assert song_catalog.all_songs_encoded('json', encode) == (version, body)
+    assert json.loads(body)[0] == {name: value for name, value in
+                                   zip(catalog.COLUMNS, SONGS[3]) if name in LIST_COLUMNS}
+    song_catalog.remove(4)
+    new_version, _ = song_catalog.all_songs_encoded('json', encode)
+    assert new_version > version
+    assert calls == [4, 3]
+
+
+def test_compaction_installs_its_columns_when_another_worker_cleans_up_first(tmp_path, song_catalog, monkeypatch):
+    clock = iter(range(2_000_000, 3_000_000))
+    monkeypatch.setattr(catalog.time, 'time', lambda: next(clock))  # One build directory per compaction
+    for i in range(3):
+        song_catalog.apply(changed=[row(10 + i, f'Song {i}')])
+        song_catalog.compact()
+    removed = []
+    rmtree = catalog.shutil.rmtree
+
+    def raced(path, ignore_errors=False):
+        rmtree(path, ignore_errors=ignore_errors)  # The other worker got there first
+        removed.append(path)
+        rmtree(path, ignore_errors=ignore_errors)
+    monkeypatch.setattr(catalog.shutil, 'rmtree', raced)
+    song_catalog.apply(changed=[row(20, 'Last')])
+    song_catalog.compact()
+    assert song_catalog.overlay == {} and song_catalog.get(20).track_name == 'Last'
+    assert removed
+    assert len([d for d in os.listdir(tmp_path) if d.startswith('build-')]) == 2
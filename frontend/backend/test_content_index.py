@@ -0,0 +1,82 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+import content_index  # noqa: E402
+from content_index import ContentIndex, song_tokens  # noqa: E402
+
+
+def song(track_id, title, artist, album='', genres=''):
+    return {'track_id': track_id, 'track_name': title, 'artist_name': artist, 'album_name': album, 'genres': genres}
+
+
+CATALOG = [
+    song(1, 'Come Together', 'The Beatles', 'Abbey Road', 'rock'),
+    song(2, 'Something', 'The Beatles', 'Abbey Road', 'rock'),
+    song(3, 'Yesterday', 'The Beatles', 'Help!', 'rock'),
+    song(4, 'So What', 'Miles Davis', 'Kind of Blue', 'jazz'),
+    song(5, 'Blue in Green', 'Miles Davis', 'Kind of Blue', 'jazz'),
+    song(6, 'Lonely Planet', 'Nobody Else', 'Nowhere', 'ambient'),
+]
+
+
+def loaded(songs=CATALOG):
+    index = ContentIndex()
+    index.load(songs)
+    return index
+
+
+def ranked(index, track_id, k=10):
+    return [t for t, _ in index.similar([track_id], k).get(track_id, [])]
+
+
+def test_tokens_are_weighted_by_field_and_skip_stopwords():
+    tokens = song_tokens(song(1, 'The Remix of Love', 'A, B', 'Love', 'pop, rock'))
+    assert tokens['artist:a'] == tokens['artist:b'] == content_index.FIELD_WEIGHTS['artist']
+    assert tokens['genre:rock'] == content_index.FIELD_WEIGHTS['genre']
+    assert tokens['album:love'] == content_index.FIELD_WEIGHTS['album']
+    # "love" appears in both the title and the album name
+    assert tokens['word:love'] == 2 * content_index.FIELD_WEIGHTS['title']
+    assert not any(term in tokens for term in ('word:the', 'word:remix', 'word:of'))
+
+
+def test_same_album_ranks_above_same_artist_and_unrelated_songs_do_not_match():
+    index = loaded()
+    assert ranked(index, 1) == [2, 3]
+    assert ranked(index, 4) == [5]
+    assert ranked(index, 6) == []
+    scores = dict(index.similar([1])[1])
+    assert 0 < scores[3] < scores[2] <= 1.0
+
+
+def test_batched_query_skips_unknown_tracks():
+    results = loaded().similar([1, 4, 999], k=1)
+    assert set(results) == {1, 4}
+    assert [t for t, _ in results[1]] == [2]
+
+
+def test_upsert_appends_new_songs_and_replaces_edited_ones():
+    index = loaded()
+    index.upsert([song(7, 'Freddie Freeloader', 'Miles Davis', 'Kind of Blue', 'jazz')])
+    assert set(ranked(index, 7)[:2]) == {4, 5}
+    # Song 3 moves to another artist and genre; it stops matching the Beatles
+    index.upsert([song(3, 'Yesterday', 'Miles Davis', 'Kind of Blue', 'jazz')])
+    assert 3 not in ranked(index, 1)
+    assert 3 in ranked(index, 4)
+
+
+def test_upsert_reweights_after_enough_growth():
+    index = loaded()
+    assert index.weighted_size == len(CATALOG)
+    index.upsert([song(100 + i, f'Track {i}', 'Someone New', 'Debut', 'pop') for i in range(3)])
+    assert index.weighted_size == len(CATALOG) + 3
+    assert index.pending == []
+    assert set(ranked(index, 100)[:2]) == {101, 102}
+
+
+def test_removed_songs_are_never_returned():
+    index = loaded()
+    index.remove(2)
+    assert ranked(index, 1) == [3]
+    assert index.similar([2]) == {}
@@ -0,0 +1,154 @@
+import pytest
+import leaderboards
+from leaderboards import Leaderboards
+
+
+@pytest.fixture
+def db(fake_db):
+    """Ratings are (track_id, rating, updated_at) rows."""
+    fake_db.genres = {}
+    fake_db.genre_changes = {}
+    fake_db.deleted = []
+    fake_db.ratings = []
+    fake_db.route('FROM songs WHERE updated_at', lambda *_: fake_db.genre_changes.items())
+    fake_db.route('FROM songs', lambda *_: fake_db.genres.items())
+    fake_db.route('FROM song_deletions', lambda *_: [(track_id,) for track_id in fake_db.deleted])
+    fake_db.route('SELECT DISTINCT track_id FROM ratings', lambda query, params, _: sorted(
+        {(t,) for t, _, updated in fake_db.ratings if updated >= params[0]}))
+    fake_db.route('FROM ratings', lambda query, params, _: totals(fake_db.ratings, set(params) if params else None))
+    return fake_db
+
+
+def totals(ratings, wanted):
+    sums = {}
+    for track_id, rating, _ in ratings:
+        if wanted is None or track_id in wanted:
+            total, count = sums.get(track_id, (0, 0))
+            sums[track_id] = (total + rating, count + 1)
+    return [(t, total, count) for t, (total, count) in sums.items()]
+
+
+def rate(db, track_id, rating):
+    db.ratings.append((track_id, rating, db.now))
+
+
+@pytest.fixture
+def boards(monkeypatch):
+    monkeypatch.setattr(leaderboards, 'SYNC_SECONDS', 0)
+    return Leaderboards(prior_votes=2, size=3)
+
+
+def bayesian(prior_mean, prior_votes, ratings):
+    return (prior_mean * prior_votes + sum(ratings)) / (prior_votes + len(ratings))
+
+
+def test_scores_are_bayesian_averages_toward_the_global_mean(boards, db):
+    for track_id, ratings in {1: [5], 2: [5, 5, 5, 5, 4, 4], 3: [2, 2]}.items():
+        for rating in ratings:
+            rate(db, track_id, rating)
+    boards.ensure_loaded(db.connect)
+    mean = sum(r for _, r, _ in db.ratings) / len(db.ratings)
+    top = boards.top()
+    # A single 5-star rating ranks below six ratings averaging 4.67
+    assert [t for t, _, _ in top] == [2, 1, 3]
+    assert top[0][1] == pytest.approx(bayesian(mean, 2, [5, 5, 5, 5, 4, 4]))
+    assert top[1][1] == pytest.approx(bayesian(mean, 2, [5]))
+    assert top[0][2] == 6
+
+
+def test_charts_keep_only_the_top_n_and_refill_when_one_drops_out(boards, db):
+    for track_id in range(1, 6):
+        for _ in range(track_id):
+            rate(db, track_id, 5)
+        rate(db, track_id, 1)
+    boards.ensure_loaded(db.connect)
+    assert [t for t, _, _ in boards.top()] == [5, 4, 3]
+    boards.remove_track(5)
+    assert [t for t, _, _ in boards.top()] == [4, 3, 2]
+
+
+def test_record_rating_moves_a_track_down_past_the_chart_tail(boards, db):
+    for track_id in range(1, 5):
+        rate(db, track_id, 4)
+    rate(db, 1, 5)
+    boards.ensure_loaded(db.connect)
+    assert boards.top()[0][0] == 1
+    for _ in range(3):
+        boards.record_rating(1, 1)
+    assert 1 not in [t for t, _, _ in boards.top()]
+    assert len(boards.top()) == 3
+
+
+def test_changed_rating_replaces_the_old_value(boards, db):
+    rate(db, 1, 2)
+    rate(db, 2, 3)
+    boards.ensure_loaded(db.connect)
+    boards.record_rating(1, 5, old_rating=2)
+    assert boards.sums[1] == 5 and boards.counts[1] == 1
+    assert boards.total_sum == 8 and boards.total_count == 2
+
+
+def test_genre_charts_follow_genre_changes(boards, db):
+    db.genres = {1: 'rock', 2: 'jazz'}
+    rate(db, 1, 5)
+    rate(db, 2, 4)
+    boards.ensure_loaded(db.connect)
+    assert [t for t, _, _ in boards.top(genre='rock')] == [1]
+    boards.set_genres({1: 'jazz'})
+    assert boards.top(genre='rock') == []
+    assert [t for t, _, _ in boards.top(genre='jazz')] == [1, 2]
+
+
+def test_sync_picks_up_ratings_written_elsewhere(boards, db):
+    rate(db, 1, 3)
+    rate(db, 2, 4)
+    boards.ensure_loaded(db.connect)
+    db.now += 60
+    rate(db, 1, 5)
+    rate(db, 1, 5)
+    # This worker already applied one of them itself; the sync still ends up exact
+    boards.record_rating(1, 5)
+    boards.ensure_loaded(db.connect)
+    since = db.now - 60 - leaderboards.COMMIT_LAG_SECONDS  # From the previous sync
+    assert db.params('SELECT DISTINCT track_id FROM ratings') == [[since]]
+    assert db.params('WHERE track_id IN') == [[1, 2]]  # The lag window re-reads track 2
+    assert boards.sums[1] == 13 and boards.counts[1] == 3
+    assert boards.total_sum == 17 and boards.total_count == 4
+    assert boards.top()[0][0] == 1
+
+
+def test_sync_applies_genre_changes_and_deletions(boards, db):
+    db.genres = {1: 'rock', 2: 'rock'}
+    rate(db, 1, 5)
+    rate(db, 2, 4)
+    boards.ensure_loaded(db.connect)
+    db.genre_changes = {1: 'jazz'}
+    db.deleted = [2]
+    boards.ensure_loaded(db.connect)
+    assert boards.top(genre='rock') == []
+    assert [t for t, _, _ in boards.top(genre='jazz')] == [1]
+    assert [t for t, _, _ in boards.top()] == [1]
+
+
+def test_failed_load_is_retried_and_failed_sync_keeps_the_charts(boards, db, capsys):
+    rate(db, 1, 4)
+    db.down = True
+    with pytest.raises(ConnectionError):
+        boards.ensure_loaded(db.connect)
+    assert not boards.loaded
+    db.down = False
+    boards.ensure_loaded(db.connect)
+    db.down = True
+    boards.ensure_loaded(db.connect)
+    assert "Error syncing leaderboards" in capsys.readouterr().out
+    assert [t for t, _, _ in boards.top()] == [1]
+
+
+def test_prior_drift_rebuilds_every_chart(boards, db):
+    rate(db, 1, 1)
+    rate(db, 2, 1)
+    boards.ensure_loaded(db.connect)
+    assert boards.prior_mean == pytest.approx(1.0)
+    boards.record_rating(3, 5)
+    assert boards.prior_mean == pytest.approx(7 / 3)
+    assert boards.top()[0][1] == pytest.approx(bayesian(7 / 3, 2, [5]))
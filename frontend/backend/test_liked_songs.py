@@ -0,0 +1,94 @@
+import datetime
+import pytest
+from liked_songs import LikedSetCache, encode_liked_cursor, decode_liked_cursor, fetch_liked_page
+
+
+@pytest.fixture
+def db(fake_db):
+    fake_db.likes = {}       # user_id -> liked track ids
+    fake_db.page_rows = []
+    fake_db.route('SELECT ls.track_id FROM liked_songs',
+                  lambda query, params, _: [(t,) for t in sorted(fake_db.likes.get(params[0], ()))])
+    fake_db.route('FROM liked_songs', lambda *_: fake_db.page_rows)
+    return fake_db
+
+
+@pytest.fixture
+def cache():
+    return LikedSetCache(max_users=10)
+
+
+def test_liked_among_loads_the_set_once(cache, db):
+    db.likes = {1: [30, 10, 20]}
+    assert cache.liked_among(db.connect, 1, [10, 15, 30, 99]) == {10, 30}
+    assert cache.liked_among(db.connect, 1, [20]) == {20}
+    assert len(db.executed) == 1
+
+
+def test_add_keeps_the_set_sorted_and_unique(cache, db):
+    db.likes = {1: [10, 30]}
+    cache.get(db.connect, 1)
+    cache.add(1, 20)
+    cache.add(1, 20)
+    cache.add(1, 5)
+    assert list(cache.get(db.connect, 1)) == [5, 10, 20, 30]
+    assert cache.count(db.connect, 1) == 4
+
+
+def test_add_for_an_uncached_user_does_not_load(cache, db):
+    db.likes = {1: [10]}
+    cache.add(1, 20)
+    assert db.executed == []
+    assert list(cache.get(db.connect, 1)) == [10]
+
+
+def test_set_is_filtered_like_the_pages(cache, db):
+    db.likes = {1: [10, 20]}
+    assert cache.count(db.connect, 1) == 2
+    query, params = db.executed[0]
+    assert 'INNER JOIN songs s ON s.track_id = ls.track_id' in query
+    assert 'song_deletions sd WHERE sd.track_id = s.track_id' in query
+    assert params == [1]
+
+
+def test_remove_track_drops_it_from_every_cached_set(cache, db):
+    db.likes = {1: [10, 20], 2: [20, 30]}
+    cache.get(db.connect, 1)
+    cache.get(db.connect, 2)
+    cache.remove_track(20)
+    assert list(cache.get(db.connect, 1)) == [10]
+    assert list(cache.get(db.connect, 2)) == [30]
+
+
+@pytest.mark.parametrize('sort_value', [datetime.datetime(2024, 5, 1, 12, 30, 15, 250000), 'Abbey Road', 'a|b'])
+def test_cursor_round_trip(sort_value):
+    assert decode_liked_cursor(encode_liked_cursor(sort_value, 42)) == (sort_value, 42)
+
+
+def test_bad_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_liked_cursor('not a cursor')
+
+
+def test_page_asks_for_one_extra_row_and_returns_a_cursor(db):
+    liked_at = datetime.datetime(2024, 1, 1)
+    rows = [{'track_id': i, 'liked_at': liked_at - datetime.timedelta(days=i)} for i in range(3)]
+    db.page_rows = rows
+    songs, next_cursor = fetch_liked_page(db.cursor(dictionary=True), 7, limit=2)
+    assert db.executed[-1][1] == [7, 3]
+    assert [song['track_id'] for song in songs] == [0, 1]
+    assert decode_liked_cursor(next_cursor) == (rows[1]['liked_at'], 1)
+
+
+def test_last_page_has_no_cursor_and_after_filters_on_the_key(db):
+    db.page_rows = [{'track_id': 5, 'track_name': 'x'}]
+    songs, next_cursor = fetch_liked_page(db.cursor(dictionary=True), 7, limit=2, after=('m', 4), sort='title')
+    assert next_cursor is None
+    query, params = db.executed[-1]
+    assert params == [7, 'm', 'm', 4, 3]
+    assert 'ORDER BY s.track_name ASC, ls.track_id ASC' in query
+
+
+def test_unknown_sort_is_rejected(db):
+    with pytest.raises(ValueError):
+        fetch_liked_page(db.cursor(dictionary=True), 7, sort='random')
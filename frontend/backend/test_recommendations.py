@@ -0,0 +1,73 @@
+import os
+import time
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+from recommendations import build_matrix, compute_similar_tracks, publish, SimilarityIndex  # noqa: E402
+
+
+def interactions():
+    # Users 1-3 rate tracks 10 and 20 together; track 30 only shares user 3 with them;
+    # track 40 is rated by nobody else
+    pairs = [(1, 10, 1.0), (1, 20, 1.0), (2, 10, 1.0), (2, 20, 0.8), (3, 10, 0.6), (3, 20, 0.6),
+             (3, 30, 1.0), (4, 40, 1.0)]
+    users, tracks, weights = zip(*pairs)
+    return np.array(users), np.array(tracks), np.array(weights)
+
+
+def test_build_matrix_sums_duplicates_and_sorts_track_columns():
+    matrix, track_index = build_matrix(np.array([5, 5, 9]), np.array([30, 30, 10]), np.array([0.2, 0.4, 1.0]))
+    assert list(track_index) == [10, 30]
+    assert matrix.shape == (2, 2)
+    assert matrix[0, 1] == pytest.approx(0.6)
+    assert matrix[1, 0] == pytest.approx(1.0)
+
+
+def test_neighbours_are_cosine_ranked_and_exclude_the_track_itself():
+    matrix, track_index = build_matrix(*interactions())
+    neighbors, scores = compute_similar_tracks(matrix, k=3, workers=1)
+    column = {int(t): i for i, t in enumerate(track_index)}
+    row = neighbors[column[10]]
+    assert [int(track_index[c]) for c in row if c >= 0] == [20, 30]
+    assert scores[column[10], 0] > scores[column[10], 1] > 0
+    dense = matrix.toarray()
+    a, b = dense[:, column[10]], dense[:, column[20]]
+    assert scores[column[10], 0] == pytest.approx(a @ b / np.linalg.norm(a) / np.linalg.norm(b), rel=1e-5)
+    # A track nobody else interacted with has no neighbours
+    assert list(neighbors[column[40]]) == [-1, -1, -1]
+
+
+def test_chunked_build_matches_a_single_chunk():
+    matrix, _ = build_matrix(*interactions())
+    whole = compute_similar_tracks(matrix, k=2, workers=1)
+    chunked = compute_similar_tracks(matrix, k=2, workers=1, chunk_size=1)
+    assert np.array_equal(whole[0], chunked[0])
+    assert np.allclose(whole[1], chunked[1])
+
+
+def test_published_build_serves_similar_and_recommend(tmp_path):
+    matrix, track_index = build_matrix(*interactions())
+    neighbors, scores = compute_similar_tracks(matrix, k=3, workers=1)
+    publish(track_index, neighbors, scores, str(tmp_path))
+    index = SimilarityIndex(str(tmp_path))
+    assert [t for t, _ in index.similar(10)] == [20, 30]
+    assert index.similar(999) == []
+    recommended = index.recommend([10, 20])
+    assert [t for t, _ in recommended] == [30]
+    assert recommended[0][1] > 0
+
+
+def test_index_follows_the_current_link_and_prunes_old_builds(tmp_path):
+    matrix, track_index = build_matrix(*interactions())
+    neighbors, scores = compute_similar_tracks(matrix, k=3, workers=1)
+    index = SimilarityIndex(str(tmp_path))
+    assert not index.available
+    builds = []
+    for _ in range(3):
+        time.sleep(0.002)  # Build directories are named by the millisecond
+        builds.append(publish(track_index, neighbors, scores, str(tmp_path)))
+        assert index.available and index.target == os.path.basename(builds[-1])
+    assert sorted(d for d in os.listdir(str(tmp_path)) if d.startswith('build-')) == \
+        [os.path.basename(b) for b in builds[1:]]
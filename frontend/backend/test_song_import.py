@@ -0,0 +1,230 @@
+import io
+import json
+import os
+import pytest
+import song_import
+from song_import import SongImporter, UploadRejected, detect_format, read_rows, spool_upload, validate
+
+
+@pytest.fixture
+def db(fake_db):
+    """The songs and song_import_jobs tables in memory; a rollback restores both."""
+    fake_db.songs = []
+    fake_db.next_id = 100
+    fake_db.jobs = {}
+    fake_db.locked = False
+    fake_db.transactional = ('songs', 'next_id', 'jobs')
+    fake_db.route('GET_LOCK', lambda *_: [(0 if fake_db.locked else 1,)])
+    fake_db.route('RELEASE_LOCK', lambda *_: [(1,)])
+    fake_db.route('INSERT INTO song_import_jobs', lambda query, params, cursor: setattr(
+        cursor, 'lastrowid', add_job(fake_db, *params)))
+    fake_db.route("SET status = 'running'", lambda query, params, cursor: claim(fake_db, cursor, *params))
+    fake_db.route('FROM song_import_jobs', lambda query, params, _: [
+        tuple(job[c] for c in song_import.JOB_COLUMNS) for job in fake_db.jobs.values()
+        if job['spool_host'] == params[0] and claimable(job)][:1])
+    fake_db.route('UPDATE song_import_jobs', lambda query, params, cursor: report(fake_db, cursor, *params))
+    fake_db.route('FROM songs', lambda query, params, _: existing_songs(fake_db, params))
+    fake_db.route('INSERT INTO songs', lambda query, params, cursor: insert_songs(fake_db, cursor, params))
+    return fake_db
+
+
+def add_job(db, fmt, host, path, **fields):
+    job_id = len(db.jobs) + 1
+    db.jobs[job_id] = dict(id=job_id, format=fmt, spool_host=host, spool_path=path, errors=None,
+                           status='pending', owner=None, stale=False, total_rows=0, inserted_rows=0,
+                           duplicate_rows=0, error_rows=0)
+    db.jobs[job_id].update(fields)
+    return job_id
+
+
+def claimable(job):
+    return job['status'] == 'pending' or (job['status'] == 'running' and job['stale'])
+
+
+def claim(db, cursor, owner, job_id, _):
+    job = db.jobs[job_id]
+    cursor.rowcount = int(claimable(job))
+    if cursor.rowcount:
+        job.update(status='running', owner=owner, stale=False)
+
+
+def report(db, cursor, status, total, inserted, duplicates, error_rows, errors, finished, _, job_id, owner):
+    job = db.jobs[job_id]
+    cursor.rowcount = int(job['owner'] == owner)
+    if cursor.rowcount:
+        job.update(status=status, total_rows=total, inserted_rows=inserted, duplicate_rows=duplicates,
+                   error_rows=error_rows, errors=errors, owner=None if finished else owner)
+
+
+def existing_songs(db, params):
+    # The songs columns compare case-insensitively
+    wanted = {song_import.dedupe_key(*pair) for pair in zip(params[::2], params[1::2])}
+    return [(song['track_name'], song['artist_name']) for song in db.songs
+            if song_import.dedupe_key(song['track_name'], song['artist_name']) in wanted]
+
+
+def insert_songs(db, cursor, params):
+    width = len(song_import.SONG_FIELDS)
+    cursor.lastrowid = db.next_id
+    for i in range(0, len(params), width):
+        db.songs.append(dict(zip(song_import.SONG_FIELDS, params[i:i + width]), track_id=db.next_id))
+        db.next_id += 1
+
+
+@pytest.fixture
+def importer(db):
+    inserted = []
+    songs = SongImporter(db.connect, on_insert=lambda cursor, batch: inserted.append(batch), batch_size=2)
+    songs.inserted = inserted
+    return songs
+
+
+def spooled(tmp_path, text, name='upload'):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_detect_format_reads_the_content_type_or_the_override():
+    assert detect_format('text/csv; charset=utf-8') == 'csv'
+    assert detect_format('Application/X-NDJSON') == 'ndjson'
+    assert detect_format('application/octet-stream', requested='ndjson') == 'ndjson'
+    for content_type, requested in (('application/json', None), (None, None), ('text/csv', 'xml')):
+        with pytest.raises(UploadRejected):
+            detect_format(content_type, requested)
+
+
+def test_spool_upload_copies_the_body_and_enforces_the_limits(monkeypatch):
+    monkeypatch.setattr(song_import, 'UPLOAD_CHUNK_BYTES', 4)
+    path = spool_upload(io.BytesIO(b'track_name\nabc\n'), max_bytes=100)
+    try:
+        with open(path, 'rb') as f:
+            assert f.read() == b'track_name\nabc\n'
+    finally:
+        os.unlink(path)
+    spooled_paths = []
+    real_mkstemp = song_import.tempfile.mkstemp
+
+    def mkstemp(**kwargs):
+        handle, path = real_mkstemp(**kwargs)
+        spooled_paths.append(path)
+        return handle, path
+    monkeypatch.setattr(song_import.tempfile, 'mkstemp', mkstemp)
+    with pytest.raises(UploadRejected, match='larger'):
+        spool_upload(io.BytesIO(b'x' * 11), max_bytes=10)
+    with pytest.raises(UploadRejected, match='Empty'):
+        spool_upload(io.BytesIO(b''))
+    assert not any(os.path.exists(path) for path in spooled_paths)
+
+
+def test_read_rows_numbers_csv_rows_after_the_header():
+    f = io.StringIO('track_name,artist_name\nSo What,Miles Davis\nA,B,extra\n')
+    rows = list(read_rows(f, 'csv'))
+    assert rows[0] == (1, {'track_name': 'So What', 'artist_name': 'Miles Davis'}, None)
+    assert rows[1][1][None] == ['extra']
+
+
+def test_read_rows_reports_bad_ndjson_lines_and_skips_blank_ones():
+    f = io.StringIO('{"track_name": "A", "artist_name": "B"}\n\nnot json\n[1, 2]\n')
+    rows = list(read_rows(f, 'ndjson'))
+    assert [number for number, _, _ in rows] == [1, 3, 4]
+    assert rows[0][1] == {'track_name': 'A', 'artist_name': 'B'} and rows[0][2] is None
+    assert rows[1][2].startswith('Invalid JSON')
+    assert rows[2][2] == 'Each line must be a JSON object'
+
+
+def test_validate_maps_aliases_and_checks_each_field():
+    assert validate({'trackName': ' So What ', 'artistName': 'Miles Davis', 'genre': 'jazz', 'rating': '4'}) == \
+        ('So What', 'Miles Davis', '', '', 4, 'jazz', '')
+    assert validate({'track_name': 'A', 'artist_name': 'B', 'rating': ''})[4] == 0
+    for row, reason in (({'track_name': 'A'}, 'artist_name'),
+                        ({'track_name': 'A', 'artist_name': 'B', 'rating': 'five'}, 'integer'),
+                        ({'track_name': 'A', 'artist_name': 'B', 'rating': 6}, 'between'),
+                        ({'track_name': 'A', 'artist_name': 'B', 'genres': 'x' * 51}, 'longer'),
+                        ({'track_name': 'A', 'artist_name': 'B', None: ['extra']}, 'header')):
+        with pytest.raises(ValueError, match=reason):
+            validate(row)
+
+
+def test_import_inserts_new_songs_and_reports_duplicates_and_errors(tmp_path, db, importer):
+    db.songs.append({'track_name': 'Existing', 'artist_name': 'Band', 'track_id': 1})
+    path = spooled(tmp_path, 'track_name,artist_name,rating\n'
+                             'One,Band,3\nexisting,BAND,1\nTwo,Band,9\nThree,Band,\none,band,5\nFour,Band,2\n')
+    job_id = add_job(db, 'csv', importer.host, path)
+    assert importer.run_next_job(db)
+    job = db.jobs[job_id]
+    assert job['status'] == 'done' and job['owner'] is None
+    assert (job['total_rows'], job['inserted_rows'], job['duplicate_rows'], job['error_rows']) == (6, 3, 2, 1)
+    assert json.loads(job['errors']) == [{'row': 3, 'error': 'rating must be between 0 and 5'}]
+    # Ids come from the INSERT's first id, in VALUES order
+    inserted = [song for batch in importer.inserted for song in batch]
+    assert [(s['track_name'], s['track_id']) for s in inserted] == [('One', 100), ('Three', 101), ('Four', 102)]
+    assert {s['track_id'] for s in inserted} == {s['track_id'] for s in db.songs[1:]}
+    assert not os.path.exists(path)
+    assert not importer.run_next_job(db)
+
+
+def test_stale_job_is_resumed_after_the_reported_rows(tmp_path, db, importer):
+    path = spooled(tmp_path, '{"track_name": "A", "artist_name": "X"}\n{"track_name": "B", "artist_name": "X"}\n'
+                             '{"track_name": "C", "artist_name": "X"}\n')
+    job_id = add_job(db, 'ndjson', importer.host, path, status='running', owner='gone:1', stale=True,
+                        total_rows=2, inserted_rows=2, errors='[]')
+    assert importer.run_next_job(db)
+    job = db.jobs[job_id]
+    assert job['status'] == 'done'
+    assert (job['total_rows'], job['inserted_rows']) == (3, 3)
+    assert [s['track_name'] for s in db.songs] == ['C']
+
+
+def test_nothing_is_claimed_while_another_worker_holds_the_import_lock(tmp_path, db, importer):
+    job_id = add_job(db, 'csv', importer.host, spooled(tmp_path, 'track_name,artist_name\nA,B\n'))
+    db.locked = True
+    assert not importer.run_next_job(db)
+    assert db.jobs[job_id]['status'] == 'pending'
+
+
+def test_pending_jobs_spooled_on_another_host_are_left_alone(tmp_path, db, importer):
+    add_job(db, 'csv', 'other-host', spooled(tmp_path, 'track_name,artist_name\nA,B\n'))
+    assert not importer.run_next_job(db)
+    assert db.params('FROM song_import_jobs') == [[importer.host, song_import.STALE_JOB_SECONDS]]
+
+
+def test_batch_is_rolled_back_when_the_job_was_taken_over(tmp_path, db, importer):
+    path = spooled(tmp_path, 'track_name,artist_name\nA,X\nB,X\nC,X\nD,X\n')
+    job_id = add_job(db, 'csv', importer.host, path)
+
+    def taken_over(cursor, songs):
+        db.jobs[job_id]['owner'] = 'other:2'
+    importer.on_insert = taken_over
+    assert importer.run_next_job(db)
+    assert [s['track_name'] for s in db.songs] == ['A', 'B']
+    assert db.jobs[job_id]['total_rows'] == 2
+    # The new owner resumes from the spooled file
+    assert os.path.exists(path)
+
+
+def test_job_whose_upload_is_gone_fails(tmp_path, db, importer):
+    job_id = add_job(db, 'csv', importer.host, str(tmp_path / 'missing'))
+    assert importer.run_next_job(db)
+    job = db.jobs[job_id]
+    assert job['status'] == 'failed'
+    assert json.loads(job['errors'])[0]['error'].startswith('Import stopped')
+
+
+def test_stale_jobs_spooled_on_another_host_are_left_alone(tmp_path, db, importer):
+    job_id = add_job(db, 'csv', 'other-host', spooled(tmp_path, 'track_name,artist_name\nA,B\n'),
+                        status='running', owner='other-host:1', stale=True)
+    assert not importer.run_next_job(db)
+    assert db.jobs[job_id]['owner'] == 'other-host:1'
+
+
+def test_failing_insert_hook_does_not_fail_the_import(tmp_path, db, importer, capsys):
+    job_id = add_job(db, 'csv', importer.host, spooled(tmp_path, 'track_name,artist_name\nA,X\nB,X\nC,X\n'))
+
+    def broken(cursor, songs):
+        raise RuntimeError("index unavailable")
+    importer.on_insert = broken
+    assert importer.run_next_job(db)
+    assert db.jobs[job_id]['status'] == 'done'
+    assert [s['track_name'] for s in db.songs] == ['A', 'B', 'C']
+    assert 'on_insert hook failed' in capsys.readouterr().out
@@ -0,0 +1,192 @@
+import math
+import pytest
+import trending
+from trending import Chart, TrendingCharts
+
+HOUR = 3600
+
+
+@pytest.fixture
+def db(fake_db):
+    fake_db.genres = {}
+    fake_db.genre_changes = {}
+    fake_db.deleted = []
+    fake_db.events = []   # (table, track_id, unix time); the user id is the index
+    fake_db.route('FROM songs WHERE updated_at', lambda *_: fake_db.genre_changes.items())
+    fake_db.route('FROM songs', lambda *_: fake_db.genres.items())
+    fake_db.route('FROM song_deletions', lambda *_: [(track_id,) for track_id in fake_db.deleted])
+    for table in ('ratings', 'comments', 'liked_songs'):
+        fake_db.route(f'FROM {table} ', lambda query, params, _, table=table: [
+            (track_id, user_id, when) for user_id, (kind, track_id, when) in enumerate(fake_db.events)
+            if kind == table and params[0] <= when < params[1]])
+    return fake_db
+
+
+@pytest.fixture
+def charts(tmp_path, monkeypatch):
+    monkeypatch.setattr(trending, 'SYNC_SECONDS', 0)
+    return TrendingCharts(half_life_hours=1, path=str(tmp_path / 'trending.json'))
+
+
+def test_chart_keeps_the_top_n_sorted():
+    chart = Chart(size=3)
+    for track_id, score in ((1, 5.0), (2, 1.0), (3, 3.0), (4, 4.0), (5, 0.5)):
+        chart.offer(track_id, score)
+    assert chart.top(10) == [(1, 5.0), (4, 4.0), (3, 3.0)]
+    chart.offer(3, 6.0)
+    chart.remove(1)
+    assert chart.top(10) == [(3, 6.0), (4, 4.0)]
+    chart.rescale(0.5)
+    assert chart.top(1) == [(3, 3.0)]
+
+
+def test_scores_decay_with_the_half_life(charts):
+    now = charts.t0
+    charts.record(1, 'rating', now - HOUR)
+    charts.record(2, 'rating', now)
+    scores = dict(charts.top())
+    assert scores[1] / scores[2] == pytest.approx(0.5, rel=1e-6)
+
+
+def test_recent_events_outrank_older_heavier_ones(charts):
+    now = charts.t0
+    charts.record(1, 'like', now - 3 * HOUR)    # 2.0 decayed three half-lives: 0.25
+    charts.record(2, 'rating', now)             # 1.0
+    assert [t for t, _ in charts.top()] == [2, 1]
+
+
+def test_rebase_keeps_the_ranking(charts):
+    start = charts.t0
+    charts.record(1, 'like', start)
+    charts.record(2, 'rating', start)
+    later = start + 51 / charts.rate  # Just far enough to force a rebase
+    charts.record(3, 'rating', later)
+    assert charts.t0 == later
+    assert [t for t, _ in charts.top()] == [3]  # 1 and 2 decayed away, out of scores and charts
+    charts.record(1, 'like', later)
+    charts.record(2, 'comment', later)
+    assert [t for t, _ in charts.top()] == [1, 2, 3]
+    assert all(math.isfinite(score) for score in charts.scores.values())
+
+
+def test_genre_charts_follow_genre_changes(charts):
+    charts.set_genres({1: 'rock', 2: 'jazz'})
+    charts.record(1, 'rating', charts.t0)
+    charts.record(2, 'rating', charts.t0)
+    assert [t for t, _ in charts.top(genre='rock')] == [1]
+    charts.set_genres({1: 'jazz'})
+    assert charts.top(genre='rock') == []
+    assert {t for t, _ in charts.top(genre='jazz')} == {1, 2}
+    charts.remove_track(2)
+    assert [t for t, _ in charts.top(genre='jazz')] == [1]
+    assert [t for t, _ in charts.top()] == [1]
+
+
+def test_failed_load_is_retried(charts, db):
+    db.down = True
+    with pytest.raises(ConnectionError):
+        charts.ensure_loaded(db.connect)
+    assert not charts.loaded
+    db.down = False
+    db.events = [('ratings', 1, db.now - 100)]
+    charts.ensure_loaded(db.connect)
+    assert charts.loaded
+    assert [t for t, _ in charts.top()] == [1]
+
+
+def test_sync_counts_every_committed_event_once(charts, db):
+    db.genres = {1: 'rock', 2: 'pop'}
+    db.events = [('ratings', 1, db.now - 100), ('liked_songs', 2, db.now - 50)]
+    charts.ensure_loaded(db.connect)
+    # An event younger than the commit lag waits for the next sync
+    db.events.append(('comments', 1, db.now - 1))
+    charts.ensure_loaded(db.connect)
+    one_event = charts.scores[1]
+    db.now += 10
+    charts.ensure_loaded(db.connect)
+    charts.ensure_loaded(db.connect)
+    comment = trending.EVENT_WEIGHTS['comment'] * math.exp(charts.rate * (db.now - 10 - 1 - charts.t0))
+    assert charts.scores[1] == pytest.approx(one_event + comment)
+    assert [t for t, _ in charts.top(genre='rock')] == [1]
+    until = db.now - trending.COMMIT_LAG_SECONDS
+    assert db.params('FROM comments ')[-1] == [until - 10, until]  # Each sync starts where the last one ended
+
+
+def test_sync_applies_genre_changes_and_deletions(charts, db):
+    db.genres = {1: 'rock', 2: 'rock'}
+    db.events = [('ratings', 1, db.now - 100), ('ratings', 2, db.now - 90)]
+    charts.ensure_loaded(db.connect)
+    db.genre_changes = {1: 'jazz'}
+    db.deleted = [2]
+    db.now += 10
+    charts.ensure_loaded(db.connect)
+    assert charts.top(genre='rock') == []
+    assert [t for t, _ in charts.top(genre='jazz')] == [1]
+    assert [t for t, _ in charts.top()] == [1]
+
+
+def test_failed_sync_keeps_serving_the_loaded_charts(charts, capsys, db):
+    db.events = [('ratings', 1, db.now - 100)]
+    charts.ensure_loaded(db.connect)
+    db.down = True
+    charts.ensure_loaded(db.connect)
+    assert "Error syncing trending charts" in capsys.readouterr().out
+    assert [t for t, _ in charts.top()] == [1]
+
+
+def test_snapshot_restores_scores_and_resumes_after_its_watermark(charts, db):
+    db.events = [('ratings', 1, db.now - 100), ('liked_songs', 2, db.now - 50)]
+    charts.ensure_loaded(db.connect)
+    charts.persist()
+    db.events.append(('ratings', 2, db.now + 5))
+    db.now += 20
+    restored = TrendingCharts(half_life_hours=1, path=charts.path)
+    restored.ensure_loaded(db.connect)
+    charts.ensure_loaded(db.connect)
+    assert restored.top() == pytest.approx(charts.top())
+
+
+def test_snapshot_from_another_half_life_is_ignored(charts, db):
+    db.events = [('ratings', 1, db.now - 100)]
+    charts.ensure_loaded(db.connect)
+    charts.persist()
+    other = TrendingCharts(half_life_hours=2, path=charts.path)
+    assert not other.restore()
+
+
+def test_only_one_process_writes_the_snapshot(charts):
+    if trending.fcntl is None:
+        pytest.skip("needs fcntl")
+    other = TrendingCharts(half_life_hours=1, path=charts.path)
+    assert charts._owns_snapshot()
+    assert not other._owns_snapshot()
+    charts.after_fork()
+    assert other._owns_snapshot()
+
+
+def test_writes_count_at_once_and_are_not_counted_again_by_the_sync(charts, db):
+    db.events = [('ratings', 1, db.now - 100)]
+    charts.ensure_loaded(db.connect)
+    before = charts.scores[1]
+    charts.record_write(2, 'like', user_id=len(db.events))
+    db.events.append(('liked_songs', 2, db.now))
+    assert [t for t, _ in charts.top()] == [2, 1]
+    liked = charts.scores[2]
+    db.now += 10
+    charts.ensure_loaded(db.connect)
+    assert charts.scores[2] == liked and charts.scores[1] == before
+    assert charts.recorded == {}
+
+
+def test_full_charts_refill_after_a_removal(charts):
+    charts.charts[trending.OVERALL] = Chart(size=2)
+    charts.set_genres({1: 'rock', 2: 'rock', 3: 'rock'})
+    charts.charts['rock'] = Chart(size=2)
+    for track_id, kind in ((1, 'like'), (2, 'comment'), (3, 'rating')):
+        charts.record(track_id, kind, charts.t0)
+    assert [t for t, _ in charts.top()] == [1, 2]
+    charts.remove_track(1)
+    assert [t for t, _ in charts.top()] == [2, 3]
+    assert [t for t, _ in charts.top(genre='rock')] == [2, 3]
+    charts.set_genres({2: 'jazz'})
+    assert [t for t, _ in charts.top(genre='rock')] == [3]
@@ -0,0 +1,103 @@
+import datetime
+import json
+import pytest
+from werkzeug.datastructures import MIMEAccept
+import wire_format
+from wire_format import COLUMNS_JSON, COLUMNS_MSGPACK, columnar, encode, negotiate, to_columnar
+
+# decode() below is the client side of the format, so every test is a round trip.
+
+SONGS = [
+    {'track_id': 1, 'track_name': 'Come Together', 'artist_name': 'The Beatles', 'album_name': 'Abbey Road', 'rating': 4},
+    {'track_id': 2, 'track_name': 'Something', 'artist_name': 'The Beatles', 'album_name': 'Abbey Road', 'rating': None},
+    {'track_id': 3, 'track_name': 'So What', 'artist_name': 'Miles Davis', 'album_name': None, 'rating': 5},
+]
+
+
+class Provider:
+    """The part of Flask's JSON provider encode() uses."""
+
+    @staticmethod
+    def default(value):
+        if isinstance(value, datetime.datetime):
+            return value.isoformat()
+        raise TypeError(value)
+
+    def dumps(self, data):
+        return json.dumps(data, default=self.default)
+
+
+def decode_table(table):
+    rows = []
+    for values in table['rows']:
+        row = {}
+        for name, value in zip(table['columns'], values):
+            strings = table['dictionaries'].get(name)
+            row[name] = strings[value] if strings is not None and value is not None else value
+        rows.append(row)
+    return rows
+
+
+def decode(data):
+    if isinstance(data, dict) and set(data) == {'columns', 'dictionaries', 'rows'}:
+        return decode_table(data)
+    if isinstance(data, dict):
+        return {key: decode(value) for key, value in data.items()}
+    return data
+
+
+def accept(header):
+    return MIMEAccept([(value.split(';q=')[0].strip(), float(value.split(';q=')[1]) if ';q=' in value else 1)
+                       for value in header.split(',')])
+
+
+def test_repeated_strings_are_stored_once_per_column():
+    table = columnar(SONGS)
+    assert table['columns'] == ['track_id', 'track_name', 'artist_name', 'album_name', 'rating']
+    assert table['dictionaries'] == {'artist_name': ['The Beatles', 'Miles Davis'], 'album_name': ['Abbey Road']}
+    assert table['rows'][1] == [2, 'Something', 0, 0, None]
+    assert table['rows'][2] == [3, 'So What', 1, None, 5]
+    assert decode_table(table) == SONGS
+
+
+def test_rows_with_differing_keys_use_the_union_of_columns():
+    rows = [{'track_id': 1, 'track_name': 'A'}, {'track_id': 2, 'artist_name': 'B'}]
+    table = columnar(rows)
+    assert table['columns'] == ['track_id', 'track_name', 'artist_name']
+    assert decode_table(table) == [{'track_id': 1, 'track_name': 'A', 'artist_name': None},
+                                   {'track_id': 2, 'track_name': None, 'artist_name': 'B'}]
+
+
+def test_nested_lists_are_converted_and_the_surrounding_shape_kept():
+    data = {'songs': SONGS, 'page': 2, 'similar': {'1': SONGS[1:], '9': []}, 'tags': ['rock', 'jazz']}
+    converted = to_columnar(data)
+    assert converted['page'] == 2 and converted['tags'] == ['rock', 'jazz']
+    assert converted['similar']['9'] == {'columns': [], 'dictionaries': {}, 'rows': []}
+    assert decode(converted) == dict(data, similar={'1': SONGS[1:], '9': []})
+
+
+def test_negotiate_needs_the_compact_type_named_explicitly():
+    assert negotiate(accept('*/*')) is None
+    assert negotiate(accept('application/json')) is None
+    assert negotiate(accept(COLUMNS_JSON)) == COLUMNS_JSON
+    assert negotiate(accept(f'{COLUMNS_JSON};q=0.5, application/json')) is None
+    assert negotiate(accept(f'{COLUMNS_JSON};q=0, */*')) is None
+    if wire_format.msgpack is not None:
+        assert negotiate(accept(f'{COLUMNS_JSON};q=0.5, {COLUMNS_MSGPACK}')) == COLUMNS_MSGPACK
+
+
+def test_json_body_round_trips_with_provider_fallbacks():
+    when = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    data = {'songs': [dict(SONGS[0], added_at=when)]}
+    body = encode(data, COLUMNS_JSON, Provider())
+    assert decode(json.loads(body)) == {'songs': [dict(SONGS[0], added_at=when.isoformat())]}
+
+
+def test_msgpack_body_round_trips():
+    msgpack = pytest.importorskip('msgpack')
+    when = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    data = {'songs': SONGS + [dict(SONGS[0], track_id=4, added_at=when)]}
+    body = encode(data, COLUMNS_MSGPACK, Provider())
+    decoded = decode(msgpack.unpackb(body, raw=False))
+    assert decoded['songs'][:3] == [dict(song, added_at=None) for song in SONGS]
+    assert decoded['songs'][3]['added_at'] == when.isoformat()
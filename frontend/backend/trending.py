@@ -0,0 +1,360 @@
+import bisect
+import heapq
+import json
+import math
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows (single-process development): the process always writes the snapshot
+    fcntl = None
+
+# Time-decayed trending charts, fed by the ratings, comments and likes tables.
+#
+# Scores use forward decay: an event at time t adds weight * e^(lambda * (t - t0)), so stored
+# scores never decrease and the ranking is the same as with decayed scores. A track can
+# therefore only enter a chart through its own event, which keeps each chart's sorted top-N
+# list exact without rescanning. Scores are rebased to a new t0 before they overflow.
+#
+# The write paths record their events as they commit (record_write), so a worker's own writes
+# show up at once. Every worker also replays the events committed since its last sync at most
+# every SYNC_SECONDS, which brings in writes made by other workers (and through server.js).
+# Each sync covers [watermark, now - COMMIT_LAG_SECONDS), and a replayed event this worker
+# already recorded is skipped (matched on kind, user and track), so every event is counted
+# once. New ratings count; changing an existing rating does not.
+#
+# A full chart that loses an entry (deletion, genre change) is rebuilt from the scores the next
+# time it is read, so it never comes back short.
+#
+# One process at a time (whichever holds <path>.lock) writes the snapshot that the next start
+# restores instead of replaying SEED_DAYS of events.
+HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 24))
+CHART_SIZE = 200
+EVENT_WEIGHTS = {'rating': 1.0, 'comment': 1.5, 'like': 2.0}
+TRENDING_STATE_PATH = os.getenv('TRENDING_STATE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'trending.json'))
+PERSIST_INTERVAL_SECONDS = 300
+SYNC_SECONDS = float(os.getenv('TRENDING_SYNC_SECONDS', 10))
+COMMIT_LAG_SECONDS = 5
+SEED_DAYS = 14
+RECORDED_EVENT_SECONDS = 600  # A recorded write whose row was never replayed is forgotten after this
+EVENT_QUERIES = (
+    ('rating', "SELECT track_id, user_id, UNIX_TIMESTAMP(created_at) FROM ratings "
+               "WHERE created_at >= FROM_UNIXTIME(%s) AND created_at < FROM_UNIXTIME(%s)"),
+    ('comment', "SELECT track_id, user_id, UNIX_TIMESTAMP(created_at) FROM comments "
+                "WHERE created_at >= FROM_UNIXTIME(%s) AND created_at < FROM_UNIXTIME(%s)"),
+    ('like', "SELECT track_id, user_id, UNIX_TIMESTAMP(liked_at) FROM liked_songs "
+             "WHERE liked_at >= FROM_UNIXTIME(%s) AND liked_at < FROM_UNIXTIME(%s)"),
+)
+OVERALL = ''
+
+
+class Chart:
+    """Top-N (track_id, score) list kept sorted by score, highest first."""
+
+    def __init__(self, size=CHART_SIZE):
+        self.size = size
+        self.keys = []       # -score, ascending
+        self.ids = []
+        self.position = {}   # track_id -> its key, to find the entry again
+
+    def offer(self, track_id, score):
+        if track_id in self.position:
+            self._delete(track_id)
+        elif len(self.ids) >= self.size and -score >= self.keys[-1]:
+            return
+        i = bisect.bisect_left(self.keys, -score)
+        self.keys.insert(i, -score)
+        self.ids.insert(i, track_id)
+        self.position[track_id] = -score
+        if len(self.ids) > self.size:
+            self.keys.pop()
+            del self.position[self.ids.pop()]
+
+    def _delete(self, track_id):
+        i = bisect.bisect_left(self.keys, self.position.pop(track_id))
+        while self.ids[i] != track_id:
+            i += 1
+        del self.keys[i]
+        del self.ids[i]
+
+    def remove(self, track_id):
+        if track_id in self.position:
+            self._delete(track_id)
+
+    def rescale(self, factor):
+        self.keys = [key * factor for key in self.keys]
+        self.position = {track_id: key * factor for track_id, key in self.position.items()}
+
+    def top(self, k):
+        return [(track_id, -key) for track_id, key in zip(self.ids[:k], self.keys[:k])]
+
+
+class TrendingCharts:
+    def __init__(self, half_life_hours=HALF_LIFE_HOURS, path=TRENDING_STATE_PATH):
+        self.rate = math.log(2) / (half_life_hours * 3600)
+        self.path = path
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()  # one loader/syncer at a time; others keep serving
+        self.t0 = time.time()
+        self.scores = {}
+        self.genres = {}          # track_id -> genre, filled by set_genres / load_genres
+        self.charts = {OVERALL: Chart()}
+        self.dirty = set()        # charts that lost an entry and must be refilled before use
+        self.recorded = {}        # (kind, user_id, track_id) -> time, for writes recorded but not yet replayed
+        self.last_persist = time.time()
+        self.loaded = False
+        self.watermark = 0        # database time up to which events have been replayed
+        self.synced_at = 0
+        self.snapshot_lock = None # open <path>.lock while this process owns the snapshot
+
+    def _genre_chart(self, genre):
+        chart = self.charts.get(genre)
+        if chart is None:
+            chart = self.charts[genre] = Chart()
+        return chart
+
+    def record(self, track_id, kind, when=None):
+        """Add one rating/comment/like event for track_id."""
+        when = when or time.time()
+        with self.lock:
+            if self.rate * (when - self.t0) > 50:
+                self._rebase(when)
+            score = self.scores.get(track_id, 0.0) + EVENT_WEIGHTS[kind] * math.exp(self.rate * (when - self.t0))
+            self.scores[track_id] = score
+            self.charts[OVERALL].offer(track_id, score)
+            genre = self.genres.get(track_id)
+            if genre:
+                self._genre_chart(genre).offer(track_id, score)
+
+    def record_write(self, track_id, kind, user_id):
+        """Record an event this worker just committed; the sync that replays its row skips it."""
+        if not self.loaded:
+            return  # The initial load replays it from the table
+        now = time.time()
+        with self.lock:
+            self.recorded[(kind, user_id, track_id)] = now
+        self.record(track_id, kind, now)
+
+    def _remove(self, name, track_id):
+        chart = self.charts.get(name)
+        if chart is not None and track_id in chart.position:
+            was_full = len(chart.ids) >= chart.size
+            chart.remove(track_id)
+            if was_full:
+                self.dirty.add(name)  # A track outside the chart now belongs in it
+
+    def _rebuild(self, name):
+        if name == OVERALL:
+            candidates = self.scores.items()
+        else:
+            candidates = [(t, s) for t, s in self.scores.items() if self.genres.get(t) == name]
+        chart = self.charts[name] = Chart(self.charts[name].size)
+        for track_id, score in heapq.nlargest(chart.size, candidates, key=lambda item: item[1]):
+            chart.offer(track_id, score)
+        self.dirty.discard(name)
+
+    def _rebase(self, now):
+        factor = math.exp(-self.rate * (now - self.t0))
+        scores = {t: s * factor for t, s in self.scores.items() if s * factor > 1e-6}
+        for chart in self.charts.values():
+            chart.rescale(factor)
+            # Tracks that decayed away leave the charts too, or remove_track could not find them
+            for track_id in [t for t in chart.ids if t not in scores]:
+                chart.remove(track_id)
+        self.scores = scores
+        self.t0 = now
+
+    def top(self, k=20, genre=None):
+        """[(track_id, decayed score)] for the overall chart or one genre."""
+        with self.lock:
+            name = genre or OVERALL
+            if name not in self.charts:
+                return []
+            if name in self.dirty:
+                self._rebuild(name)
+            chart = self.charts[name]
+            decay = math.exp(-self.rate * (time.time() - self.t0))
+            return [(track_id, score * decay) for track_id, score in chart.top(k)]
+
+    def set_genres(self, genres):
+        """Register track genres (track_id -> genre) and place already-scored tracks in their genre chart."""
+        with self.lock:
+            for track_id, genre in genres.items():
+                old_genre = self.genres.get(track_id)
+                if old_genre == genre:
+                    continue
+                score = self.scores.get(track_id)
+                if old_genre and score is not None:
+                    self._remove(old_genre, track_id)
+                self.genres[track_id] = genre
+                if genre and score is not None:
+                    self._genre_chart(genre).offer(track_id, score)
+
+    def remove_track(self, track_id):
+        with self.lock:
+            score = self.scores.pop(track_id, None)
+            genre = self.genres.pop(track_id, None)
+            if score is not None:
+                self._remove(OVERALL, track_id)
+                if genre:
+                    self._remove(genre, track_id)
+
+    def load_genres(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT track_id, genres FROM songs WHERE genres IS NOT NULL AND genres != ''")
+            self.set_genres({track_id: genre for track_id, genre in cursor.fetchall()})
+        finally:
+            cursor.close()
+
+    def replay(self, conn, since, until):
+        """Record the events with since <= time < until (unix seconds, database clock), except
+        those record_write already counted."""
+        cursor = conn.cursor()
+        try:
+            for kind, query in EVENT_QUERIES:
+                cursor.execute(query, (since, until))
+                for track_id, user_id, when in cursor.fetchall():
+                    with self.lock:
+                        seen = self.recorded.pop((kind, user_id, track_id), None)
+                    if seen is None:
+                        self.record(track_id, kind, float(when))
+        finally:
+            cursor.close()
+        with self.lock:
+            # Recorded writes whose rows fell before a watermark (a long transaction) are never replayed
+            cutoff = time.time() - RECORDED_EVENT_SECONDS
+            self.recorded = {key: at for key, at in self.recorded.items() if at >= cutoff}
+
+    def sync(self, conn):
+        """Replay the events committed since the last sync, plus genre changes and deletions."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT UNIX_TIMESTAMP()")
+            until = float(cursor.fetchone()[0]) - COMMIT_LAG_SECONDS
+            since = self.watermark - COMMIT_LAG_SECONDS
+            cursor.execute("SELECT track_id, genres FROM songs WHERE updated_at >= FROM_UNIXTIME(%s)", (since,))
+            genres = dict(cursor.fetchall())
+            cursor.execute("SELECT track_id FROM song_deletions WHERE deleted_at >= FROM_UNIXTIME(%s)", (since,))
+            deleted = [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        self.set_genres(genres)
+        if until > self.watermark:
+            self.replay(conn, self.watermark, until)
+            self.watermark = until
+        for track_id in deleted:
+            self.remove_track(track_id)
+
+    def load(self, conn):
+        """Genres plus the last snapshot, or the last SEED_DAYS of events when there is none."""
+        self.load_genres(conn)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT UNIX_TIMESTAMP()")
+            until = float(cursor.fetchone()[0]) - COMMIT_LAG_SECONDS
+        finally:
+            cursor.close()
+        oldest = until - SEED_DAYS * 86400
+        if not self.restore():
+            self.watermark = oldest
+        self.watermark = max(self.watermark, oldest)
+        self.replay(conn, self.watermark, until)
+        self.watermark = until
+        self.loaded = True
+
+    def ensure_loaded(self, conn_factory):
+        """Load once per process, then sync at most every SYNC_SECONDS.
+
+        The first call blocks until the load succeeds (a failed load is retried by the next
+        call); later syncs run in one request while the others serve the current charts.
+        """
+        if self.loaded and time.time() - self.synced_at < SYNC_SECONDS:
+            return
+        if not self.sync_lock.acquire(blocking=not self.loaded):
+            return
+        try:
+            if not self.loaded or time.time() - self.synced_at >= SYNC_SECONDS:
+                conn = conn_factory()
+                try:
+                    if self.loaded:
+                        self.sync(conn)
+                    else:
+                        self.load(conn)
+                finally:
+                    conn.close()
+                self.synced_at = time.time()
+                self.maybe_persist()
+        except Exception as e:
+            if not self.loaded:
+                raise
+            print("Error syncing trending charts:", e)
+            self.synced_at = time.time()
+        finally:
+            self.sync_lock.release()
+
+    def after_fork(self):
+        """Children start without the snapshot lock; one of them takes it on its first persist."""
+        if self.snapshot_lock is not None:
+            self.snapshot_lock.close()
+            self.snapshot_lock = None
+        self.sync_lock = threading.Lock()
+
+    def _owns_snapshot(self):
+        if fcntl is None:
+            return True
+        if self.snapshot_lock is None:
+            try:
+                handle = open(f"{self.path}.lock", 'a')
+            except OSError as e:
+                print(f"Failed to persist trending charts: {e}")
+                return False
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()  # Another worker writes the snapshot; retried next interval
+                return False
+            self.snapshot_lock = handle  # Held until the process exits
+        return True
+
+    def maybe_persist(self):
+        if time.time() - self.last_persist >= PERSIST_INTERVAL_SECONDS:
+            self.last_persist = time.time()
+            if self._owns_snapshot():
+                self.persist()
+
+    def persist(self):
+        with self.lock:
+            self.last_persist = time.time()
+            state = {"t0": self.t0, "half_life_rate": self.rate, "synced_until": self.watermark,
+                     "scores": {str(t): s for t, s in self.scores.items()}}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Failed to persist trending charts: {e}")
+
+    def restore(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if abs(state.get("half_life_rate", 0) - self.rate) > 1e-12 or "synced_until" not in state:
+            return False  # Half-life changed (scores not comparable) or a snapshot without a watermark
+        with self.lock:
+            factor = math.exp(self.rate * (state["t0"] - self.t0))
+            for key, snapshot_score in state["scores"].items():
+                track_id = int(key)
+                score = self.scores.get(track_id, 0.0) + snapshot_score * factor
+                self.scores[track_id] = score
+                self.charts[OVERALL].offer(track_id, score)
+                genre = self.genres.get(track_id)
+                if genre:
+                    self._genre_chart(genre).offer(track_id, score)
+            self.watermark = state["synced_until"]
+        return True
@@ -0,0 +1,92 @@
+try:
+    import msgpack
+except ImportError:  # Only the JSON flavour of the columnar format is offered without msgpack
+    msgpack = None
+
+# Opt-in compact encoding for song lists, chosen by the Accept header:
+#
+#   Accept: application/vnd.mpp.columns+json      columnar JSON
+#   Accept: application/vnd.mpp.columns+msgpack   the same structure as MessagePack
+#
+# Every list of row objects in the response becomes
+#
+#   {"columns": ["track_id", "track_name", ...],
+#    "dictionaries": {"album_name": ["Abbey Road", ...], ...},
+#    "rows": [[1, "Come Together", ..., 0, ...], ...]}
+#
+# where the values of dictionary-encoded columns (repeated strings such as artist, album,
+# image URL and genre) are indexes into that column's dictionary; null stays null. Empty
+# lists become tables with no columns. Objects around the lists (paging fields, batch
+# results keyed by id) keep their shape. Clients that do not ask get plain JSON.
+COLUMNS_JSON = 'application/vnd.mpp.columns+json'
+COLUMNS_MSGPACK = 'application/vnd.mpp.columns+msgpack'
+DICTIONARY_COLUMNS = frozenset(('artist_name', 'album_name', 'album_image', 'genres'))
+
+
+def offered_types():
+    return (COLUMNS_JSON, COLUMNS_MSGPACK) if msgpack is not None else (COLUMNS_JSON,)
+
+
+def negotiate(accept_mimetypes):
+    """COLUMNS_JSON or COLUMNS_MSGPACK when the client names one in Accept, else None (plain JSON).
+
+    Wildcards never select the compact format, so */* and application/json clients are unaffected.
+    """
+    named = {value: quality for value, quality in accept_mimetypes if quality > 0}
+    offered = [media_type for media_type in offered_types() if media_type in named]
+    if not offered:
+        return None
+    best = max(offered, key=lambda media_type: named[media_type])
+    if named.get('application/json', 0) > named[best]:
+        return None
+    return best
+
+
+def is_row_list(value):
+    return isinstance(value, list) and all(isinstance(row, dict) for row in value)
+
+
+def columnar(rows, dictionary_columns=DICTIONARY_COLUMNS):
+    """Column header, per-column string dictionaries and row arrays for a list of dicts."""
+    columns = list(rows[0]) if rows else []
+    for row in rows:
+        if row.keys() != rows[0].keys():  # Rows with differing keys: take the union, in order
+            columns = list(dict.fromkeys(key for row in rows for key in row))
+            break
+    encoded = [name in dictionary_columns for name in columns]
+    dictionaries = {name: ({}, []) for name, enc in zip(columns, encoded) if enc}
+    out = []
+    for row in rows:
+        values = []
+        for name, enc in zip(columns, encoded):
+            value = row.get(name)
+            if enc and isinstance(value, str):
+                index, strings = dictionaries[name]
+                code = index.get(value)
+                if code is None:
+                    code = index[value] = len(strings)
+                    strings.append(value)
+                value = code
+            values.append(value)
+        out.append(values)
+    return {"columns": columns,
+            "dictionaries": {name: strings for name, (_, strings) in dictionaries.items()},
+            "rows": out}
+
+
+def to_columnar(data):
+    """data with every (nested) list of row objects replaced by its columnar form."""
+    if is_row_list(data):
+        return columnar(data)
+    if isinstance(data, dict):
+        return {key: to_columnar(value) for key, value in data.items()}
+    return data
+
+
+def encode(data, media_type, json_provider):
+    """Response body for media_type; json_provider supplies JSON encoding and type fallbacks."""
+    data = to_columnar(data)
+    if media_type == COLUMNS_MSGPACK:
+        return msgpack.packb(data, default=json_provider.default, use_bin_type=True)
+    dumps = getattr(json_provider, 'dumps_bytes', json_provider.dumps)
+    return dumps(data)